@@ -11,6 +11,8 @@
 """
 
 import os
+import sys
+from threading import Lock
 from concurrent.futures import ThreadPoolExecutor
 from astrbot.api import logger
 from ..db_manager import DatabaseManager, StableDatabaseInterface
@@ -18,6 +20,48 @@ from .memory_manager import MemoryManager
 from .profile_manager import ProfileManager
 
 
+# 进程内共享的 IO 线程池（多个门面实例复用，按引用计数在最后一个实例关闭时释放）
+_shared_executor = None
+_shared_executor_refs = 0
+_shared_executor_lock = Lock()
+
+
+def _default_io_workers() -> int:
+    """按 CPU 核数估算 IO 线程数；无 GIL 的解释器允许更高并行度"""
+    cpu = os.cpu_count() or 1
+    gil_check = getattr(sys, "_is_gil_enabled", None)
+    if gil_check is not None and not gil_check():
+        return min(64, cpu * 8)
+    return min(32, cpu * 4)
+
+
+def _acquire_shared_executor() -> ThreadPoolExecutor:
+    """获取共享线程池（惰性创建），并增加引用计数"""
+    global _shared_executor, _shared_executor_refs
+    with _shared_executor_lock:
+        if _shared_executor is None:
+            _shared_executor = ThreadPoolExecutor(
+                max_workers=_default_io_workers(),
+                thread_name_prefix="engram-io",
+            )
+        _shared_executor_refs += 1
+        return _shared_executor
+
+
+def _release_shared_executor(executor) -> None:
+    """释放一次共享线程池引用；引用归零时关闭线程池"""
+    global _shared_executor, _shared_executor_refs
+    with _shared_executor_lock:
+        if executor is not _shared_executor:
+            executor.shutdown(wait=False)
+            return
+        _shared_executor_refs -= 1
+        if _shared_executor_refs <= 0:
+            _shared_executor.shutdown(wait=False)
+            _shared_executor = None
+            _shared_executor_refs = 0
+
+
 class MemoryFacade:
     """
     记忆系统门面类
@@ -40,8 +84,9 @@ class MemoryFacade:
         os.makedirs(self.data_dir, exist_ok=True)
         logger.info("Engram：MemoryFacade data_dir=%s", os.path.abspath(self.data_dir))
         
-        # 共享的线程池
-        self.executor = ThreadPoolExecutor(max_workers=4)
+        # 共享的线程池（进程内复用，线程数按 CPU 核数确定）
+        self.executor = _acquire_shared_executor()
+        self._executor_released = False
         
         # 数据库管理器（稳定接口层 + 启动契约自检）
         raw_db = DatabaseManager(self.data_dir)
@@ -104,7 +149,14 @@ class MemoryFacade:
         """关闭记忆系统"""
         self._is_shutdown = True
         self._memory_manager.shutdown()
-        self.executor.shutdown(wait=False)
+        self.release_executor()
+
+    def release_executor(self):
+        """释放本实例持有的共享线程池引用（可重复调用）"""
+        if self._executor_released:
+            return
+        self._executor_released = True
+        _release_shared_executor(self.executor)
     
     # ========== 记忆管理方法（委托给 MemoryManager） ==========
     
@@ -112,6 +164,10 @@ class MemoryFacade:
         """确保 ChromaDB 已初始化"""
         return await self._memory_manager._ensure_chroma_initialized()
     
+    async def flush_pending_raw(self):
+        """将原始消息写缓冲立即落库（删除、统计等需读到完整数据的操作前调用）"""
+        return await self._memory_manager.flush_pending_raw()
+
     async def record_message(self, user_id, session_id, role, content, msg_type="text", user_name=None, **extra_fields):
         """记录原始消息"""
         return await self._memory_manager.record_message(
@@ -172,6 +228,14 @@ class MemoryFacade:
     async def undo_last_delete(self, user_id):
         """撤销最近一次删除"""
         return await self._memory_manager.undo_last_delete(user_id)
+
+    async def vacuum_deleted_vectors(self):
+        """回收已删除（墓碑）向量"""
+        return await self._memory_manager.vacuum_deleted_vectors()
+
+    async def undo_last_deletes(self, user_id, count=1):
+        """批量撤销最近若干次删除"""
+        return await self._memory_manager.undo_last_deletes(user_id, count)
     
     async def export_raw_messages(self, user_id, format="jsonl", start_date=None, end_date=None, limit=None):
         """导出原始消息"""
@@ -211,6 +275,10 @@ class MemoryFacade:
         """获取用户画像"""
         return await self._profile_manager.get_user_profile(user_id)
     
+    async def get_user_profile_cached(self, user_id):
+        """获取用户画像（LRU + TTL 缓存，只读场景使用）"""
+        return await self._profile_manager.get_user_profile_cached(user_id)
+    
     async def update_user_profile(self, user_id, update_data):
         """更新用户画像"""
         return await self._profile_manager.update_user_profile(user_id, update_data)
@@ -30,19 +30,106 @@ import uuid
 import json
 import re
 import asyncio
+import base64
+import functools
 import time
 import datetime
+import heapq
+import operator
+import io
+import struct
 from threading import Lock
-from collections import Counter
+from collections import Counter, OrderedDict, defaultdict, deque
 from concurrent.futures import ThreadPoolExecutor
 from astrbot.api import logger
 from ..services.intent_classifier import IntentClassifier
+from ..services.provider_resolver import ProviderResolver
+from ..utils import extract_json_text, json_dumps, json_dumps_bytes, json_loads, request_json_completion
+
+_uuid4 = uuid.uuid4
 
 # 预编译正则表达式
 _CHINESE_PATTERN = re.compile(r'[\u4e00-\u9fa5]')
 _ENGLISH_WORD_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z0-9]+)?")
 _CHINESE_BLOCK_PATTERN = re.compile(r"[\u4e00-\u9fa5]+")
 
+# 默认指令前缀
+_DEFAULT_COMMAND_PREFIXES = ("/", "!", "#", "~")
+
+# Chroma 检索专用线程数（与共享线程池隔离，检索不被 DB/文件写入排队阻塞）
+_CHROMA_QUERY_WORKERS = 2
+
+# 导出专用线程数：整表读取 + 序列化耗时长，独立线程池避免占用共享线程池，阻塞删除/撤销等短任务
+_EXPORT_WORKERS = 1
+
+# 已删除向量的墓碑标记：删除时仅把 user_id 改写为该值（所有检索均按 user_id 过滤，自然排除），
+# 物理删除由记忆维护任务批量完成
+_CHROMA_TOMBSTONE_USER_ID = "__engram_deleted__"
+
+# 并发向量检索的合并窗口（秒）
+_QUERY_COALESCE_WINDOW = 0.01
+
+# 关键词切分用的停用词与保留的短英文词
+_KEYWORD_STOPWORDS = frozenset({
+    "a", "an", "the", "to", "of", "in", "on", "at", "is", "are", "i", "you", "he", "she", "it",
+    "我", "你", "他", "她", "它", "这", "那", "了", "啊", "呀", "吗", "呢", "吧", "和", "与", "及", "就", "也"
+})
+_KEYWORD_PROTECTED_TOKENS = frozenset({"ai", "ml", "db", "go", "c", "r"})
+
+# 查询关键词预处理结果缓存条数（重复提问、工具多次调用时命中）
+_KEYWORD_CACHE_MAX = 256
+
+# 导出时的角色映射（未列出的角色一律视为用户）
+_EXPORT_ROLE_MAP = {"assistant": "assistant"}
+_SHAREGPT_ROLE_MAP = {"assistant": "gpt"}
+
+
+class _RetrievalCandidate:
+    """检索候选记录（__slots__ 代替逐条 dict，减少内存占用与键查找）"""
+
+    __slots__ = (
+        "index_id", "summary", "metadata", "distance", "keyword_score",
+        "rank_score", "display_score", "created_at_dt", "active_score",
+        "vector_score", "recency_score", "keyword_score_norm", "activity_score",
+    )
+
+    def __init__(self, index_id, summary, metadata, distance, keyword_score):
+        self.index_id = index_id
+        self.summary = summary
+        self.metadata = metadata
+        self.distance = distance
+        self.keyword_score = keyword_score
+        self.rank_score = 0.0
+        self.display_score = 0.0
+        self.created_at_dt = None
+        self.active_score = 100.0
+        self.vector_score = 0.0
+        self.recency_score = 0.5
+        self.keyword_score_norm = 0.0
+        self.activity_score = 0.0
+
+
+_BY_RANK_SCORE = operator.attrgetter("rank_score")
+_BY_DISTANCE = operator.attrgetter("distance")
+
+
+def _set_future_result(future, result):
+    if not future.cancelled():
+        future.set_result(result)
+
+
+def _set_future_exception(future, exc):
+    if not future.cancelled():
+        future.set_exception(exc)
+
+
+def _call_soon_threadsafe(loop, callback, *args):
+    """从工作线程回调事件循环；循环已关闭时（插件卸载中）静默丢弃结果"""
+    try:
+        loop.call_soon_threadsafe(callback, *args)
+    except RuntimeError:
+        pass
+
 
 class MemoryManager:
     """记忆管理器"""
@@ -50,13 +137,17 @@ class MemoryManager:
     # MemoryManager 运行所需的 DB 契约（用于启动阶段自检）
     REQUIRED_DB_METHODS = (
         "save_raw_memory",
+        "save_raw_memories",
         "get_unarchived_raw",
+        "get_unarchived_raw_filtered",
         "get_last_memory_index",
         "mark_as_archived",
         "save_memory_index",
+        "commit_summaries",
         "get_all_user_ids",
         "get_summaries_by_type",
         "get_memory_list",
+        "get_memory_by_sequence",
         "get_memory_indexes_by_ids",
         "get_prev_indices_by_ids",
         "get_raw_memories_map_by_uuid_lists",
@@ -64,12 +155,15 @@ class MemoryManager:
         "update_active_score",
         "delete_raw_memories_by_uuids",
         "delete_memory_index",
+        "remove_memory_index",
         "get_all_raw_messages",
         "get_message_stats",
         "get_all_users_messages",
         "get_all_users_stats",
         "save_delete_history",
         "get_last_delete_history",
+        "get_recent_delete_histories",
+        "restore_deleted_memories",
         "mark_delete_history_restored",
         "enqueue_pending_vector_jobs",
         "get_pending_vector_jobs",
@@ -97,11 +191,19 @@ class MemoryManager:
         self.db = db_manager
         self.profile_manager = profile_manager
         self._intent_classifier = IntentClassifier(config=self.config, context=self.context)
+        self._provider_resolver = ProviderResolver(self.context)
         self.default_source_type = str(default_source_type or "private").strip() or "private"
 
         # 启动阶段接口自检：避免 DB 契约漂移导致运行时 AttributeError
         self._verify_db_contract(stage="MemoryManager.__init__")
 
+        # 消息过滤用的指令前缀（预先规范为 tuple，供 str.startswith 直接使用）
+        self._command_prefixes = self._build_command_prefixes()
+        # 单字符前缀走集合查找，多字符前缀才需要 startswith
+        self._single_char_prefixes = frozenset(p for p in self._command_prefixes if len(p) == 1)
+        self._multi_char_prefixes = tuple(p for p in self._command_prefixes if len(p) > 1)
+        self._compact_uuid = bool(self.config.get("use_compact_uuid", False))
+
         # 近期动态（A/B）
         self._recent_events = []
         self._recent_events_lock = Lock()
@@ -112,17 +214,29 @@ class MemoryManager:
         self.chroma_client = None
         self.collection = None
         self._chroma_init_lock = asyncio.Lock()
+        self._loop = None
         self._chroma_initialized = False
+        self._chroma_query_executor = None
+        self._export_executor = None
+        self._pending_queries = []  # [(query, n_results, where, future)]
+        self._keyword_prep_cache = OrderedDict()  # {(query, min_n, max_n): prepared}
+        self._query_flush_task = None
 
         # 内存中记录最后聊天时间（带自动清理机制）
-        self.last_chat_time = {}     # {user_id: timestamp}
+        # last_chat_time 按最近活跃排序（最久未活跃在前），兼作 LRU
+        self.last_chat_time = OrderedDict()  # {user_id: timestamp}
         self.unsaved_msg_count = {}  # {user_id: count}
+        # 按最后聊天时间排序的小顶堆 [(timestamp, user_id)]，过期项惰性跳过
+        self._chat_time_heap = []
         self._max_inactive_users = 100  # 最大缓存用户数
         self._inactive_threshold = 7 * 24 * 3600  # 7天无活动则清理
+        self._cleanup_interval = 600  # 不活跃用户清理的最小间隔（秒）
+        self._last_cleanup_ts = 0.0
 
         # 撤销删除缓存（热缓存，真相源为 DB）
-        self._delete_history = {}
-        self._max_undo_history = 3
+        self._max_undo_history = max(0, int(self.config.get("max_undo_history", 3) or 0))
+        # {user_id: deque(maxlen=_max_undo_history)}，最新的在左端；定长 deque 超出容量时自动丢弃最旧的记录
+        self._delete_history = defaultdict(self._new_delete_history)
 
         self._is_shutdown = False
         self._embedding_provider_id = str(self.config.get("embedding_provider", "")).strip()
@@ -134,9 +248,61 @@ class MemoryManager:
         self._pending_retry_lock = asyncio.Lock()
         self._pending_retry_started = False
 
+        # 原始消息写入缓冲：短时间内的多条消息合并为一次事务提交
+        self._pending_raw = []
+        self._raw_flush_lock = asyncio.Lock()
+        self._raw_flush_task = None
+        self._raw_flush_wakeup = asyncio.Event()  # 缓冲区满时提前唤醒后台刷新任务
+        self._raw_flush_interval = 0.5
+        self._raw_flush_batch_size = 100
+
     def shutdown(self):
         """关闭记忆管理器"""
         self._is_shutdown = True
+        if self._raw_flush_task is not None and not self._raw_flush_task.done():
+            self._raw_flush_task.cancel()
+        # 线程池关闭前同步落库剩余缓冲消息
+        batch, self._pending_raw = self._pending_raw, []
+        if batch:
+            self._save_raw_batch(batch)
+        if self._chroma_query_executor is not None:
+            self._chroma_query_executor.shutdown(wait=False)
+            self._chroma_query_executor = None
+        if self._export_executor is not None:
+            self._export_executor.shutdown(wait=False)
+            self._export_executor = None
+
+    def _get_loop(self):
+        """获取并缓存当前事件循环，省去每次调度线程池时的循环查找"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            loop = self._loop = asyncio.get_running_loop()
+        return loop
+
+    def _spawn_blocking(self, fn, *args, **kwargs):
+        """
+        在共享线程池中执行阻塞调用，返回可直接 await 的 asyncio.Future
+
+        直接 submit 到线程池，由工作线程通过 call_soon_threadsafe 回填结果，
+        省去 run_in_executor 在 concurrent.futures.Future 与 asyncio.Future 之间的双向状态同步。
+        """
+        return self._spawn_blocking_in(self.executor, fn, *args, **kwargs)
+
+    def _spawn_blocking_in(self, executor, fn, *args, **kwargs):
+        """同 _spawn_blocking，但提交到指定线程池"""
+        loop = self._get_loop()
+        future = loop.create_future()
+
+        def _run():
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                _call_soon_threadsafe(loop, _set_future_exception, future, e)
+            else:
+                _call_soon_threadsafe(loop, _set_future_result, future, result)
+
+        executor.submit(_run)
+        return future
 
     def _verify_db_contract(self, stage="startup"):
         """校验 DB 接口契约，优先复用稳定接口层的 verify_contract。"""
@@ -159,6 +325,31 @@ class MemoryManager:
 
     # ========== ChromaDB 管理 ==========
 
+    def _build_hnsw_metadata(self):
+        """按配置构建 HNSW 调优元数据；未配置时返回空 dict，沿用 Chroma 默认参数"""
+        try:
+            search_ef = int(self.config.get("chroma_hnsw_search_ef", 0) or 0)
+        except (TypeError, ValueError):
+            search_ef = 0
+        if search_ef <= 0:
+            return {}
+        return {"hnsw:search_ef": search_ef}
+
+    def _open_memory_collection(self, client):
+        """
+        打开长期记忆集合（需在线程池中调用）。
+
+        HNSW 参数只在集合创建时生效：已有集合原样打开，避免改动距离空间等不可变参数；
+        新建集合（首次初始化或 /mem_rebuild_vector full 重建）时写入调优元数据。
+        """
+        metadata = self._build_hnsw_metadata()
+        if not metadata:
+            return client.get_or_create_collection(name="long_term_memories")
+        try:
+            return client.get_collection(name="long_term_memories")
+        except Exception:
+            return client.create_collection(name="long_term_memories", metadata=metadata)
+
     async def _ensure_chroma_initialized(self):
         """确保 ChromaDB 已初始化（延迟初始化，避免构造函数阻塞）"""
         # 仅日志告警：向量模型未配置时不抛错，后续检索/写入链路会优雅降级
@@ -179,11 +370,11 @@ class MemoryManager:
                 return
 
             # 在线程池中初始化 ChromaDB（避免构造函数阻塞）
-            loop = asyncio.get_event_loop()
+            loop = self._get_loop()
 
             def _init_chroma():
                 client = chromadb.PersistentClient(path=self.chroma_path)
-                collection = client.get_or_create_collection(name="long_term_memories")
+                collection = self._open_memory_collection(client)
                 return client, collection
 
             try:
@@ -203,29 +394,57 @@ class MemoryManager:
 
     def _cleanup_inactive_users(self):
         """清理长期不活跃的用户缓存，防止内存泄漏"""
-        now_ts = time.time()
+        deadline = time.time() - self._inactive_threshold
+        # 超出上限的部分即 LRU 头部的 excess 个用户
+        excess = len(self.last_chat_time) - self._max_inactive_users
+
+        # 从最久未活跃的一端扫描：遇到既未超时、又在保留名额内的用户即可停止
+        to_remove = []
+        for position, (user_id, last_time) in enumerate(self.last_chat_time.items()):
+            if last_time >= deadline and position >= excess:
+                break
+            # 只有在已归档后才清理
+            if self.unsaved_msg_count.get(user_id, 0) == 0:
+                to_remove.append(user_id)
 
-        # 找出所有超过阈值的不活跃用户
-        inactive_users = [
-            user_id for user_id, last_time in self.last_chat_time.items()
-            if now_ts - last_time > self._inactive_threshold
-        ]
+        for user_id in to_remove:
+            self.last_chat_time.pop(user_id, None)
+            self.unsaved_msg_count.pop(user_id, None)
 
-        # 清理不活跃用户（但只有在已归档后才清理）
-        for user_id in inactive_users:
-            if self.unsaved_msg_count.get(user_id, 0) == 0:
-                self.last_chat_time.pop(user_id, None)
-                self.unsaved_msg_count.pop(user_id, None)
+    @staticmethod
+    def _pack_embedding(embedding):
+        """撤销备份中的向量按 float32 小端字节 + base64 存储（约为 JSON 浮点文本的 1/4，且无损）"""
+        values = [float(v) for v in embedding]
+        return {"f32": base64.b64encode(struct.pack(f"<{len(values)}f", *values)).decode("ascii")}
 
-        # 如果用户数仍然过多，按最后活跃时间排序，保留最近的
-        if len(self.last_chat_time) > self._max_inactive_users:
-            sorted_users = sorted(self.last_chat_time.items(), key=lambda x: x[1], reverse=True)
-            users_to_keep = set(u[0] for u in sorted_users[:self._max_inactive_users])
+    @staticmethod
+    def _unpack_embedding(value):
+        """还原撤销备份中的向量（兼容旧版直接存储的浮点列表）"""
+        if isinstance(value, dict) and value.get("f32"):
+            raw = base64.b64decode(value["f32"])
+            return list(struct.unpack(f"<{len(raw) // 4}f", raw))
+        if isinstance(value, (list, tuple)) and value:
+            return list(value)
+        return None
 
-            for user_id in list(self.last_chat_time.keys()):
-                if user_id not in users_to_keep and self.unsaved_msg_count.get(user_id, 0) == 0:
-                    self.last_chat_time.pop(user_id, None)
-                    self.unsaved_msg_count.pop(user_id, None)
+    @staticmethod
+    def _metadata_timestamp(created_at):
+        """向量元数据中的时间统一存为整数秒（比格式化字符串更省空间，也可直接做数值范围过滤）"""
+        if hasattr(created_at, "timestamp"):
+            return int(created_at.timestamp())
+        if isinstance(created_at, (int, float)):
+            return int(created_at)
+        try:
+            return int(datetime.datetime.strptime(str(created_at), "%Y-%m-%d %H:%M:%S").timestamp())
+        except (TypeError, ValueError):
+            return str(created_at or "")
+
+    @staticmethod
+    def _format_metadata_time(value, default="未知时间"):
+        """将向量元数据中的时间格式化用于展示（兼容旧版字符串格式）"""
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return datetime.datetime.fromtimestamp(value).strftime("%Y-%m-%d %H:%M:%S")
+        return value or default
 
     @staticmethod
     def _ensure_datetime(timestamp):
@@ -237,6 +456,15 @@ class MemoryManager:
             return datetime.datetime.fromtimestamp(timestamp)
         return timestamp
 
+    def _build_command_prefixes(self) -> tuple:
+        """读取并规范化指令前缀配置；未启用指令过滤时返回空 tuple"""
+        if not self.config.get("enable_command_filter", True):
+            return ()
+        command_prefixes = self.config.get("command_prefixes", _DEFAULT_COMMAND_PREFIXES)
+        if isinstance(command_prefixes, str):
+            command_prefixes = [command_prefixes]
+        return tuple(str(p) for p in command_prefixes if str(p))
+
     def _is_valid_message_content(self, content: str) -> bool:
         """
         统一的消息内容过滤逻辑，用于判断消息是否应被纳入归档/检索。
@@ -251,22 +479,20 @@ class MemoryManager:
         content = content.strip()
 
         # 1. 过滤以配置的指令前缀开头的消息
-        if self.config.get("enable_command_filter", True):
-            command_prefixes = self.config.get("command_prefixes", ["/", "!", "#", "~"])
-            if isinstance(command_prefixes, str):
-                command_prefixes = [command_prefixes]
-            command_prefixes = [str(p) for p in command_prefixes if str(p)]
-            if command_prefixes and content.startswith(tuple(command_prefixes)):
-                return False
+        if content[:1] in self._single_char_prefixes:
+            return False
+        if self._multi_char_prefixes and content.startswith(self._multi_char_prefixes):
+            return False
 
         # 2. 专门清洗带下划线的内部指令
         if "_" in content and " " not in content:
             return False
 
-        # 3. 统计中文数量或检查总长度
-        chinese_chars = _CHINESE_PATTERN.findall(content)
-        if len(chinese_chars) < 2 and len(content) < 10:
-            return False
+        # 3. 短消息（总长度不足10）至少需要2个中文字符；长消息无需统计
+        if len(content) < 10:
+            first = _CHINESE_PATTERN.search(content)
+            if first is None or _CHINESE_PATTERN.search(content, first.end()) is None:
+                return False
 
         return True
 
@@ -281,17 +507,18 @@ class MemoryManager:
             allowed.add(extra_type)
         return allowed
 
-    def _generate_query_keywords(self, query: str):
-        """生成中英混合关键词：英文按词切分，中文按 2~4 gram 切分。"""
+    def _get_keyword_ngram_range(self):
+        """读取中文 n-gram 长度范围 (min_n, max_n)"""
         min_n = max(2, int(self.config.get("keyword_ngram_min", 2)))
         max_n = max(min_n, int(self.config.get("keyword_ngram_max", 4)))
         max_n = min(max_n, 6)  # 防御性上限，避免极端配置导致组合爆炸
+        return min_n, max_n
 
-        common_stopwords = {
-            "a", "an", "the", "to", "of", "in", "on", "at", "is", "are", "i", "you", "he", "she", "it",
-            "我", "你", "他", "她", "它", "这", "那", "了", "啊", "呀", "吗", "呢", "吧", "和", "与", "及", "就", "也"
-        }
-        protected_tokens = {"ai", "ml", "db", "go", "c", "r"}
+    def _generate_query_keywords(self, query: str):
+        """生成中英混合关键词：英文按词切分，中文按 2~4 gram 切分。"""
+        min_n, max_n = self._get_keyword_ngram_range()
+        common_stopwords = _KEYWORD_STOPWORDS
+        protected_tokens = _KEYWORD_PROTECTED_TOKENS
 
         english_tokens = _ENGLISH_WORD_PATTERN.findall(query.lower())
         query_keywords = set()
@@ -321,41 +548,59 @@ class MemoryManager:
 
         return query_keywords
 
-    def _count_keyword_matches(self, keyword: str, summary_tokens_en, summary_ngrams_zh):
-        """边界感知匹配：英文按词边界，中文按 n-gram 精确计数。"""
-        if not keyword:
-            return 0
-
-        if _CHINESE_PATTERN.search(keyword):
-            return summary_ngrams_zh.get(keyword, 0)
+    def _prepare_keyword_scoring(self, query: str):
+        """
+        预处理查询关键词：生成一次并区分中文 n-gram，同一查询的多条候选复用。
+        结果按 (query, n-gram 范围) 做 LRU 缓存，返回值不可修改。
 
-        return summary_tokens_en.get(keyword.lower(), 0)
+        Returns:
+            tuple: (query_keywords, zh_keywords, min_n, max_n)
+        """
+        min_n, max_n = self._get_keyword_ngram_range()
+        cache_key = (query, min_n, max_n)
+        cache = self._keyword_prep_cache
+        prepared = cache.get(cache_key)
+        if prepared is not None:
+            cache.move_to_end(cache_key)
+            return prepared
+
+        query_keywords = frozenset(self._generate_query_keywords(query))
+        zh_keywords = frozenset(k for k in query_keywords if _CHINESE_PATTERN.search(k))
+        prepared = (query_keywords, zh_keywords, min_n, max_n)
+        cache[cache_key] = prepared
+        if len(cache) > _KEYWORD_CACHE_MAX:
+            cache.popitem(last=False)
+        return prepared
 
-    def _calc_keyword_score(self, query: str, summary: str, corpus_stats: dict):
+    @staticmethod
+    def _count_overlapping(text: str, sub: str) -> int:
+        """统计子串的重叠出现次数（与逐位置切分 n-gram 计数一致）"""
+        count = 0
+        pos = text.find(sub)
+        while pos != -1:
+            count += 1
+            pos = text.find(sub, pos + 1)
+        return count
+
+    def _calc_keyword_score(self, query: str, summary: str, corpus_stats: dict, prepared=None):
         """计算关键词得分（边界感知匹配 + 近似 IDF）。"""
-        query_keywords = self._generate_query_keywords(query)
+        query_keywords, zh_keywords, min_n, max_n = prepared or self._prepare_keyword_scoring(query)
         if not query_keywords or not summary:
             return 0.0, query_keywords
 
         summary_lower = summary.lower()
         summary_tokens_en = Counter(_ENGLISH_WORD_PATTERN.findall(summary_lower))
 
-        min_n = max(2, int(self.config.get("keyword_ngram_min", 2)))
-        max_n = max(min_n, int(self.config.get("keyword_ngram_max", 4)))
-        max_n = min(max_n, 6)
-
-        summary_ngrams_zh = Counter()
-        chinese_blocks = _CHINESE_BLOCK_PATTERN.findall(summary)
-        for block in chinese_blocks:
+        # 中文 n-gram 总数按块长度直接计算；命中次数只针对查询关键词统计，无需展开全部 n-gram
+        zh_gram_total = 0
+        for block in _CHINESE_BLOCK_PATTERN.findall(summary):
             block_len = len(block)
             for n in range(min_n, max_n + 1):
-                if block_len < n:
-                    continue
-                for i in range(0, block_len - n + 1):
-                    summary_ngrams_zh[block[i:i + n]] += 1
+                if block_len >= n:
+                    zh_gram_total += block_len - n + 1
 
         matched_tf_sum = 0
-        doc_len = max(1, len(summary_tokens_en) + sum(summary_ngrams_zh.values()))
+        doc_len = max(1, len(summary_tokens_en) + zh_gram_total)
 
         _bm25_k1 = 1.2
         _bm25_b = 0.75
@@ -366,7 +611,11 @@ class MemoryManager:
         keyword_df = corpus_stats.get("keyword_doc_freq", {})
 
         for keyword in query_keywords:
-            tf = self._count_keyword_matches(keyword, summary_tokens_en, summary_ngrams_zh)
+            if keyword in zh_keywords:
+                # 中文关键词全由汉字组成，出现位置必然落在汉字块内
+                tf = self._count_overlapping(summary, keyword)
+            else:
+                tf = summary_tokens_en.get(keyword.lower(), 0)
             if tf <= 0:
                 continue
 
@@ -481,7 +730,7 @@ class MemoryManager:
             metadata = row.get("metadata")
             if not isinstance(metadata, dict):
                 metadata = {
-                    "created_at": str(row.get("created_at", "") or ""),
+                    "created_at": self._metadata_timestamp(row.get("created_at", "")),
                 }
 
             payload.append({
@@ -526,10 +775,10 @@ class MemoryManager:
             return {"loaded": 0, "success": 0, "failed": 0}
 
         async with self._pending_retry_lock:
-            loop = asyncio.get_event_loop()
+            loop = self._get_loop()
             rows = await loop.run_in_executor(
                 self.executor,
-                lambda: self.db.get_pending_vector_jobs(limit=max(1, int(batch_size))),
+                functools.partial(self.db.get_pending_vector_jobs, limit=max(1, int(batch_size))),
             )
             if not rows:
                 return {"loaded": 0, "success": 0, "failed": 0}
@@ -843,9 +1092,10 @@ class MemoryManager:
             "metadatas": metadatas,
             "embeddings": embeddings,
         }
-        loop = asyncio.get_event_loop()
+        loop = self._get_loop()
         try:
-            await loop.run_in_executor(self.executor, lambda: self.collection.add(**add_params))
+            # upsert：撤销删除时墓碑向量可能尚未回收，需覆盖而非因重复 id 被忽略
+            await loop.run_in_executor(self.executor, functools.partial(self.collection.upsert, **add_params))
             return True
         except Exception as e:
             if self._is_dimension_mismatch_error(e):
@@ -857,21 +1107,82 @@ class MemoryManager:
                 return False
             raise
 
+    def _get_chroma_query_executor(self):
+        """获取 Chroma 检索专用线程池（首次使用时创建）"""
+        if self._chroma_query_executor is None:
+            self._chroma_query_executor = ThreadPoolExecutor(
+                max_workers=_CHROMA_QUERY_WORKERS,
+                thread_name_prefix="engram-chroma-query",
+            )
+        return self._chroma_query_executor
+
+    def _get_export_executor(self):
+        """获取导出专用线程池（首次使用时创建；关闭后回退共享线程池）"""
+        if self._is_shutdown:
+            return self.executor
+        if self._export_executor is None:
+            self._export_executor = ThreadPoolExecutor(
+                max_workers=_EXPORT_WORKERS,
+                thread_name_prefix="engram-export",
+            )
+        return self._export_executor
+
     async def _collection_query_text(self, query, n_results, where):
-        """统一查询 Chroma，强制使用外部 query_embeddings。不可用时返回 None。"""
-        query_vectors = await self._ensure_embeddings([query])
-        if not query_vectors:
-            self._warn_embedding_unavailable("查询向量生成失败，已跳过本次记忆检索")
-            return None
+        """
+        统一查询 Chroma，强制使用外部 query_embeddings。不可用时返回 None。
+
+        短时间窗口内的并发检索会被合并：查询向量一次性批量生成，
+        过滤条件与返回条数相同的查询合并为一次 collection.query，结果再按序分发。
+        """
+        loop = self._get_loop()
+        future = loop.create_future()
+        self._pending_queries.append((query, n_results, where, future))
+        if self._query_flush_task is None or self._query_flush_task.done():
+            self._query_flush_task = asyncio.create_task(self._flush_query_batch())
+        return await future
+
+    async def _flush_query_batch(self):
+        """合并窗口结束后批量执行待处理的向量检索"""
+        await asyncio.sleep(_QUERY_COALESCE_WINDOW)
+        batch, self._pending_queries = self._pending_queries, []
+        if not batch:
+            return
 
+        try:
+            query_vectors = await self._ensure_embeddings([item[0] for item in batch])
+            if not query_vectors or len(query_vectors) != len(batch):
+                self._warn_embedding_unavailable("查询向量生成失败，已跳过本次记忆检索")
+                for item in batch:
+                    if not item[3].done():
+                        item[3].set_result(None)
+                return
+
+            groups = {}
+            for item, vector in zip(batch, query_vectors):
+                key = (json.dumps(item[2], ensure_ascii=False, sort_keys=True, default=str), item[1])
+                groups.setdefault(key, []).append((item, vector))
+
+            await asyncio.gather(*(self._run_grouped_query(members) for members in groups.values()))
+        except Exception as e:
+            for item in batch:
+                if not item[3].done():
+                    item[3].set_exception(e)
+
+    async def _run_grouped_query(self, members):
+        """对过滤条件相同的一组查询执行单次 collection.query，并把结果分发给各自的等待方"""
+        first = members[0][0]
         query_params = {
-            "query_embeddings": [query_vectors[0]],
-            "n_results": n_results,
-            "where": where,
+            "query_embeddings": [vector for _, vector in members],
+            "n_results": first[1],
+            "where": first[2],
+            # 不回传 documents：摘要正文在距离过滤后由 SQLite 索引补全，被过滤的候选不再传输正文
+            "include": ["distances", "metadatas"],
         }
-        loop = asyncio.get_event_loop()
+        loop = self._get_loop()
         try:
-            return await loop.run_in_executor(self.executor, lambda: self.collection.query(**query_params))
+            # 检索走专用线程池：并发会话可并行查询，且不占用共享线程池的 DB/文件任务
+            query_executor = self.executor if self._is_shutdown else self._get_chroma_query_executor()
+            results = await loop.run_in_executor(query_executor, functools.partial(self.collection.query, **query_params))
         except Exception as e:
             if self._is_dimension_mismatch_error(e):
                 logger.warning(
@@ -879,24 +1190,51 @@ class MemoryManager:
                     "请执行管理员指令 /mem_rebuild_vector full 重建向量库，"
                     "或切回原 embedding_provider。"
                 )
-                return None
-            raise
+                results, error = None, None
+            else:
+                results, error = None, e
+            for item, _ in members:
+                if not item[3].done():
+                    if error is not None:
+                        item[3].set_exception(error)
+                    else:
+                        item[3].set_result(None)
+            return
+
+        total = len(members)
+        for i, (item, _) in enumerate(members):
+            if not item[3].done():
+                item[3].set_result(self._slice_query_result(results, i, total))
+
+    @staticmethod
+    def _slice_query_result(results, position, total):
+        """从批量查询结果中取出第 position 条查询的结果（保持单查询的返回结构）"""
+        if total == 1 or not isinstance(results, dict):
+            return results
+        sliced = {}
+        for key, value in results.items():
+            if key != "included" and isinstance(value, list) and len(value) == total:
+                sliced[key] = [value[position]]
+            else:
+                sliced[key] = value
+        return sliced
 
     # ========== 消息记录 ==========
 
-    async def record_message(self, user_id, session_id, role, content, msg_type="text", user_name=None, **extra_fields):
-        """记录原始消息"""
+    def _new_uuid(self):
+        """生成新 ID：开启紧凑格式时使用 32 位 hex，否则保持带连字符的标准格式"""
+        value = _uuid4()
+        return value.hex if self._compact_uuid else str(value)
+
+    def _build_raw_record(self, user_id, session_id, role, content, msg_type="text", user_name=None):
+        """构建原始消息入库参数，内容无效时返回 None"""
         normalized_content = str(content or "").strip()
         if not self._is_valid_message_content(normalized_content):
             logger.debug("Engram：已跳过空白/无效原始消息 role=%s user_id=%s", role, user_id)
-            return
-
-        msg_uuid = str(uuid.uuid4())
+            return None
 
-        # 异步保存到 SQLite
-        loop = asyncio.get_event_loop()
-        params = {
-            "uuid": msg_uuid,
+        return {
+            "uuid": self._new_uuid(),
             "session_id": session_id,
             "user_id": user_id,
             "user_name": user_name,
@@ -905,12 +1243,79 @@ class MemoryManager:
             "msg_type": msg_type,
             "timestamp": datetime.datetime.now()
         }
-        await loop.run_in_executor(self.executor, lambda: self.db.save_raw_memory(**params))
 
-        # 更新记录
+    def _mark_raw_recorded(self, user_id, role, now_ts=None):
+        """原始消息入库后更新内存中的聊天状态（now_ts 传入消息时间戳时复用，避免重复读取时钟）"""
         if role == "user":
-            self.last_chat_time[user_id] = datetime.datetime.now().timestamp()
+            if now_ts is None:
+                now_ts = time.time()
+            self.last_chat_time[user_id] = now_ts
+            self.last_chat_time.move_to_end(user_id)
             self.unsaved_msg_count[user_id] = self.unsaved_msg_count.get(user_id, 0) + 1
+            self._push_chat_time(user_id, now_ts)
+
+    def _push_chat_time(self, user_id, last_time):
+        """登记用户最后聊天时间到超时堆（旧条目保留在堆中，弹出时按 last_chat_time 判定失效）"""
+        heap = self._chat_time_heap
+        heapq.heappush(heap, (last_time, user_id))
+        # 失效条目过多时按当前状态重建，避免高频用户撑大堆
+        if len(heap) > 2 * len(self.last_chat_time) + 64:
+            self._chat_time_heap = [(t, uid) for uid, t in self.last_chat_time.items()]
+            heapq.heapify(self._chat_time_heap)
+
+    async def record_message(self, user_id, session_id, role, content, msg_type="text", user_name=None, **extra_fields):
+        """记录原始消息（写入缓冲区，由后台批量落库）"""
+        params = self._build_raw_record(user_id, session_id, role, content, msg_type=msg_type, user_name=user_name)
+        if params is None:
+            return
+
+        self._pending_raw.append(params)
+
+        # 更新记录（与入库时间戳保持一致）
+        self._mark_raw_recorded(user_id, role, params["timestamp"].timestamp())
+
+        # 落库始终由后台任务完成，消息记录路径不等待线程池
+        if self._raw_flush_task is None or self._raw_flush_task.done():
+            self._raw_flush_task = asyncio.create_task(self._delayed_raw_flush())
+        if len(self._pending_raw) >= self._raw_flush_batch_size:
+            self._raw_flush_wakeup.set()
+
+    async def _delayed_raw_flush(self):
+        """等待一个刷新间隔（缓冲区满时提前唤醒）后批量落库，聚合同一时间窗口内的消息"""
+        try:
+            try:
+                await asyncio.wait_for(self._raw_flush_wakeup.wait(), timeout=self._raw_flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._raw_flush_wakeup.clear()
+            await self.flush_pending_raw()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Engram：原始消息批量落库失败：{e}")
+
+    def _save_raw_batch(self, batch):
+        """同步落库一批原始消息；整批失败时逐条重试，避免单条脏数据拖垮整批"""
+        try:
+            self.db.save_raw_memories(batch)
+            return
+        except Exception as e:
+            logger.warning(f"Engram：原始消息批量写入失败，改为逐条写入（共 {len(batch)} 条）：{e}")
+
+        for params in batch:
+            try:
+                self.db.save_raw_memory(**params)
+            except Exception as e:
+                logger.error(f"Engram：原始消息写入失败 uuid={params.get('uuid')}：{e}")
+
+    async def flush_pending_raw(self):
+        """将缓冲区中的原始消息一次性写入 SQLite"""
+        async with self._raw_flush_lock:
+            if not self._pending_raw:
+                return
+            batch, self._pending_raw = self._pending_raw, []
+            loop = self._get_loop()
+            await loop.run_in_executor(self.executor, self._save_raw_batch, batch)
 
     # ========== 近期动态 ==========
 
@@ -981,47 +1386,83 @@ class MemoryManager:
     
     async def check_and_summarize(self):
         """检查是否需要进行记忆归档（画像更新由独立调度器处理）"""
-        now_ts = datetime.datetime.now().timestamp()
+        now_ts = time.time()
+        # 无待落库消息、无待检查用户时直接返回（仍按间隔执行缓存清理）
+        if not self._pending_raw and not self._chat_time_heap:
+            self._maybe_cleanup_inactive_users(now_ts)
+            return
+
+        await self.flush_pending_raw()
         timeout = self._get_archive_timeout()
         min_count = self._get_archive_min_msg_count()
 
-        for user_id, last_time in list(self.last_chat_time.items()):
-            if now_ts - last_time > timeout and self.unsaved_msg_count.get(user_id, 0) >= min_count:
+        # 只弹出已超时的条目：无人超时时为 O(1)，不再逐个扫描全部用户
+        heap = self._chat_time_heap
+        deadline = now_ts - timeout
+        while heap and heap[0][0] < deadline:
+            last_time, user_id = heapq.heappop(heap)
+            if self.last_chat_time.get(user_id) != last_time:
+                continue  # 用户之后又有新消息，或已被清理
+            if self.unsaved_msg_count.get(user_id, 0) < min_count:
+                continue  # 新消息会重新入堆
+            try:
                 # 触发记忆归档
                 await self._summarize_private_chat(user_id)
-                self.unsaved_msg_count[user_id] = 0
+            except Exception:
+                # 归档失败时放回堆中，下一轮重试
+                heapq.heappush(self._chat_time_heap, (last_time, user_id))
+                raise
+            self.unsaved_msg_count[user_id] = 0
+            heap = self._chat_time_heap
 
         # 定期清理不活跃用户缓存，防止内存泄漏
+        self._maybe_cleanup_inactive_users(now_ts)
+
+    def _maybe_cleanup_inactive_users(self, now_ts):
+        """按最小间隔执行不活跃用户清理，避免每个调度周期都全量扫描"""
+        if now_ts - self._last_cleanup_ts < self._cleanup_interval:
+            return
+        self._last_cleanup_ts = now_ts
         self._cleanup_inactive_users()
 
     async def _summarize_private_chat(self, user_id):
         """对私聊进行总结并存入长期记忆（按天分组处理）"""
-        from itertools import groupby
         source_type = str(self.default_source_type or "private").strip() or "private"
 
-        # 1. 获取未归档的原始消息
-        loop = asyncio.get_event_loop()
-        # 获取所有未归档消息，不设限制
-        raw_msgs = await loop.run_in_executor(self.executor, lambda: self.db.get_unarchived_raw(user_id, limit=None))
-        if not raw_msgs:
-            return
-
-        # 按时间正序排列（数据库返回的是倒序）
-        raw_msgs.reverse()
+        # 1. 获取未归档的原始消息（先落库缓冲区中的消息）
+        await self.flush_pending_raw()
+        loop = self._get_loop()
 
         # 计算回溯截止时间
         max_days = self.config.get("max_history_days", 0)
         cutoff_date = None
+        cutoff_dt = None
         if max_days > 0:
             cutoff_date = (datetime.datetime.now() - datetime.timedelta(days=max_days)).date()
+            cutoff_dt = datetime.datetime.combine(cutoff_date, datetime.time.min)
+
+        # 获取所有未归档消息，不设限制；指令前缀、超出回溯天数等廉价规则已在 SQL 中剔除，被剔除的消息直接归档
+        raw_msgs, skipped_uuids = await loop.run_in_executor(
+            self.executor,
+            functools.partial(
+                self.db.get_unarchived_raw_filtered,
+                user_id,
+                self._command_prefixes,
+                before=cutoff_dt,
+            )
+        )
+        if not raw_msgs:
+            if skipped_uuids:
+                await loop.run_in_executor(self.executor, self.db.mark_as_archived, skipped_uuids)
+            return
 
-        # 按日期分组
-        def get_date_key(m):
-            timestamp = m.timestamp
+        # 按日期分桶：每个日期恰好一组，不依赖输入有序
+        # 数据库返回倒序，逆序遍历使桶内消息按时间正序排列
+        date_groups = defaultdict(list)
+        ensure_datetime = self._ensure_datetime
+        for m in reversed(raw_msgs):
             # 处理时间戳可能是整数或浮点数的情况
-            if isinstance(timestamp, (int, float)):
-                timestamp = datetime.datetime.fromtimestamp(timestamp)
-            return timestamp.date()
+            date_groups[ensure_datetime(m.timestamp).date()].append(m)
 
         # 仅查询一次最近的记忆索引，构建新批次的链表
         last_index = await loop.run_in_executor(self.executor, self.db.get_last_memory_index, user_id)
@@ -1033,12 +1474,11 @@ class MemoryManager:
             "metadatas": []
         }
         index_params_list = []
-        archive_uuids_forced = []
+        archive_uuids_forced = list(skipped_uuids)
         archive_uuids_summarized = []
 
-        for date_key, group in groupby(raw_msgs, key=get_date_key):
-            # 将 group 转为列表，因为 groupby 的迭代器只能用一次
-            group_msgs = list(group)
+        for date_key in sorted(date_groups):
+            group_msgs = date_groups[date_key]
             ref_uuids = [m.uuid for m in group_msgs]
 
             # 检查是否超过回溯天数限制
@@ -1060,21 +1500,21 @@ class MemoryManager:
             created_at = summary_result["created_at"]
             ref_uuids = summary_result["ref_uuids"]
 
-            index_id = str(uuid.uuid4())
+            index_id = self._new_uuid()
             ai_name = str(self.config.get("ai_name") or "").strip()
             batch_add["ids"].append(index_id)
             batch_add["documents"].append(summary)
             batch_add["metadatas"].append({
                 "user_id": user_id,
                 "source_type": source_type,
-                "created_at": created_at.strftime("%Y-%m-%d %H:%M:%S"),
+                "created_at": self._metadata_timestamp(created_at),
                 "ai_name": ai_name
             })
 
             index_params_list.append({
                 "index_id": index_id,
                 "summary": summary,
-                "ref_uuids": json.dumps(ref_uuids),
+                "ref_uuids": json_dumps(ref_uuids),
                 "prev_index_id": prev_index_id,
                 "source_type": source_type,
                 "user_id": user_id,
@@ -1083,16 +1523,21 @@ class MemoryManager:
             prev_index_id = index_id
             archive_uuids_summarized.extend(ref_uuids)
 
-        # 先归档无需总结的消息
-        if archive_uuids_forced:
-            await loop.run_in_executor(self.executor, self.db.mark_as_archived, archive_uuids_forced)
-
         if not batch_add["ids"]:
+            # 无新总结时仅归档无需总结的消息
+            if archive_uuids_forced:
+                await loop.run_in_executor(self.executor, self.db.mark_as_archived, archive_uuids_forced)
             return
 
         # 先落库（SQLite）再尝试向量写入，避免 embedding 问题导致总结丢失
+        # 全部日期分组的索引与原文归档标记在同一事务中提交
+        await loop.run_in_executor(
+            self.executor,
+            self.db.commit_summaries,
+            index_params_list,
+            archive_uuids_forced + archive_uuids_summarized
+        )
         for index_params in index_params_list:
-            await loop.run_in_executor(self.executor, lambda p=index_params: self.db.save_memory_index(**p))
             self._record_memory_event(
                 summary=index_params.get("summary"),
                 user_id=index_params.get("user_id"),
@@ -1107,10 +1552,6 @@ class MemoryManager:
                 meta={"user_id": str(user_id)},
             )
 
-        # 归档已总结的消息
-        if archive_uuids_summarized:
-            await loop.run_in_executor(self.executor, self.db.mark_as_archived, archive_uuids_summarized)
-
         # 最后写入向量库；失败时记录待补偿任务，不影响主链路成功
         max_retries = 3
         retry_delay = 2
@@ -1169,7 +1610,7 @@ class MemoryManager:
                     "metadata": {
                         "user_id": user_id,
                         "source_type": index_params.get("source_type", "private"),
-                        "created_at": created_str,
+                        "created_at": self._metadata_timestamp(created_at),
                         "ai_name": str(self.config.get("ai_name") or "").strip(),
                     },
                     "created_at": created_str,
@@ -1183,12 +1624,23 @@ class MemoryManager:
                 len(self._pending_vector_jobs)
             )
 
+    async def _request_summary_text(self, provider, prompt):
+        """
+        请求归档总结文本。
+
+        开启 enable_summary_stream 且提供商支持 text_chat_stream 时改用流式接收，
+        顶层 JSON 对象闭合即停止读取，省去模型尾部多余输出的等待。
+        """
+        return await request_json_completion(
+            provider, prompt, stream=bool(self.config.get("enable_summary_stream", False))
+        )
+
     async def _process_single_summary_batch(self, user_id, raw_msgs, date_key):
         """处理单批次（单日）消息的总结"""
         # 使用公共过滤方法
         filtered_msgs = [m for m in raw_msgs if self._is_valid_message_content(m.content)]
 
-        loop = asyncio.get_event_loop()
+        loop = self._get_loop()
 
         if not filtered_msgs:
             # 如果没有符合条件的消息，也标记原本的所有消息为已归档
@@ -1200,26 +1652,26 @@ class MemoryManager:
                 "archive": True
             }
 
-        # 构造对话文本
-        chat_lines = [f"【日期：{date_key.strftime('%Y-%m-%d')}】"]
+        # 构造对话文本（StringIO 流式拼接，长历史不再堆积行列表）
         ai_name = str(self.config.get("ai_name") or "").strip()
+        ensure_datetime = self._ensure_datetime
+        buf = io.StringIO()
+        write = buf.write
+        write(f"【日期：{date_key:%Y-%m-%d}】")
         for m in filtered_msgs:
-            # 确保时间戳是 datetime 对象
-            ts = self._ensure_datetime(m.timestamp)
-            time_str = ts.strftime("%H:%M")
             if m.role == "user":
-                name = m.user_name if m.user_name else "user"
+                name = m.user_name or "user"
             elif m.role == "assistant":
-                name = m.user_name if m.user_name else ai_name
+                name = m.user_name or ai_name
             else:
                 name = m.role
-            chat_lines.append(f"[{time_str}] {name}: {m.content}")
-        chat_text = "\n".join(chat_lines)
+            # 确保时间戳是 datetime 对象
+            write(f"\n[{ensure_datetime(m.timestamp):%H:%M}] {name}: {m.content}")
+        chat_text = buf.getvalue()
 
         # 2. 调用 LLM 总结
         # 从配置获取提示词模板并替换占位符
         custom_prompt = self.config.get("summarize_prompt")
-        ai_name = str(self.config.get("ai_name") or "").strip()
         prompt = custom_prompt.replace("{{chat_text}}", chat_text).replace("{{ai_name}}", ai_name)
 
         max_retries = 3
@@ -1229,19 +1681,12 @@ class MemoryManager:
         for attempt in range(max_retries):
             try:
                 # 获取指定的模型或默认模型
-                summarize_model = self.config.get("summarize_model", "").strip()
-                if summarize_model:
-                    provider = self.context.get_provider_by_id(summarize_model)
-                    if not provider:
-                        provider = self.context.get_using_provider()
-                else:
-                    provider = self.context.get_using_provider()
+                provider = self._provider_resolver.resolve(self.config.get("summarize_model", ""))
 
                 if not provider:
                     break
 
-                resp = await provider.text_chat(prompt=prompt)
-                full_content = resp.completion_text
+                full_content = await self._request_summary_text(provider, prompt)
 
                 if full_content and len(full_content) >= 5:
                     break # 成功获取总结
@@ -1262,12 +1707,7 @@ class MemoryManager:
 
         # 尝试解析结构化 JSON，生成可检索摘要
         try:
-            content = full_content.strip()
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "{" in content and "}" in content:
-                content = content[content.find("{"):content.rfind("}") + 1]
-
+            content = extract_json_text(full_content.strip())
             payload = json.loads(content)
             if isinstance(payload, dict):
                 summary = self._build_structured_summary(payload)
@@ -1286,7 +1726,7 @@ class MemoryManager:
 
     async def summarize_all_users(self):
         """强制归档所有用户的未归档消息"""
-        loop = asyncio.get_event_loop()
+        loop = self._get_loop()
         user_ids = await loop.run_in_executor(self.executor, self.db.get_all_user_ids)
         if not user_ids:
             return 0
@@ -1324,7 +1764,7 @@ class MemoryManager:
         level_label
     ):
         """通用折叠逻辑：将 lower-level 摘要折叠为 higher-level 摘要。"""
-        loop = asyncio.get_event_loop()
+        loop = self._get_loop()
 
         try:
             days = max(1, int(days))
@@ -1377,16 +1817,10 @@ class MemoryManager:
 
         for attempt in range(max_retries):
             try:
-                preferred_model = str(self.config.get(model_config_key, "")).strip()
-                summarize_model = str(self.config.get("summarize_model", "")).strip()
-
-                provider = None
-                if preferred_model:
-                    provider = self.context.get_provider_by_id(preferred_model)
-                if not provider and summarize_model:
-                    provider = self.context.get_provider_by_id(summarize_model)
-                if not provider:
-                    provider = self.context.get_using_provider()
+                provider = self._provider_resolver.resolve(
+                    self.config.get(model_config_key, ""),
+                    self.config.get("summarize_model", ""),
+                )
 
                 if not provider:
                     break
@@ -1413,7 +1847,7 @@ class MemoryManager:
             return None
 
         created_at = datetime.datetime.now()
-        index_id = str(uuid.uuid4())
+        index_id = self._new_uuid()
         ai_name = str(self.config.get("ai_name") or "").strip()
         source_ids = [item.index_id for item in selected]
 
@@ -1427,7 +1861,7 @@ class MemoryManager:
             "metadatas": [{
                 "user_id": user_id,
                 "source_type": output_source_type,
-                "created_at": created_at.strftime("%Y-%m-%d %H:%M:%S"),
+                "created_at": self._metadata_timestamp(created_at),
                 "ai_name": ai_name,
                 "folding_days": days,
                 "folding_level": output_source_type,
@@ -1441,7 +1875,7 @@ class MemoryManager:
         index_params = {
             "index_id": index_id,
             "summary": summary_text,
-            "ref_uuids": json.dumps(source_ids),
+            "ref_uuids": json_dumps(source_ids),
             "prev_index_id": prev_index_id,
             "source_type": output_source_type,
             "user_id": user_id,
@@ -1449,7 +1883,7 @@ class MemoryManager:
             "member_id": scope_fields.get("member_id"),
             "created_at": created_at
         }
-        await loop.run_in_executor(self.executor, lambda: self.db.save_memory_index(**index_params))
+        await loop.run_in_executor(self.executor, functools.partial(self.db.save_memory_index, **index_params))
         self._record_memory_event(
             summary=index_params.get("summary"),
             user_id=index_params.get("user_id"),
@@ -1483,7 +1917,7 @@ class MemoryManager:
                     "metadata": {
                         "user_id": user_id,
                         "source_type": output_source_type,
-                        "created_at": created_at.strftime("%Y-%m-%d %H:%M:%S"),
+                        "created_at": self._metadata_timestamp(created_at),
                         "ai_name": str(self.config.get("ai_name") or "").strip(),
                     },
                     "created_at": created_at.strftime("%Y-%m-%d %H:%M:%S"),
@@ -1585,14 +2019,14 @@ class MemoryManager:
         source_types=None,
     ):
         """向量不可用时的兜底检索：SQLite 关键词召回 + 本地重排。"""
-        loop = asyncio.get_event_loop()
+        loop = self._get_loop()
 
         candidate_limit = min(
             max(10, limit * 8),
             max(20, int(self.config.get("memory_query_max_results", 60)))
         )
 
-        keyword_tokens = list(self._generate_query_keywords(query))
+        keyword_tokens = list(self._prepare_keyword_scoring(query)[0])
         if query and str(query).strip():
             keyword_tokens.append(str(query).strip())
         keyword_tokens = list(dict.fromkeys([k for k in keyword_tokens if k]))[:30]
@@ -1638,25 +2072,20 @@ class MemoryManager:
         if not filtered:
             return []
 
-        # 构造关键词文档频率用于轻量 IDF
-        query_keywords = self._generate_query_keywords(query)
+        # 构造关键词文档频率用于轻量 IDF（只需判断是否命中，无需统计次数）
+        prepared = self._prepare_keyword_scoring(query)
+        query_keywords, zh_keywords = prepared[0], prepared[1]
         keyword_doc_freq = {k: 0 for k in query_keywords}
         for item in filtered:
             summary = str(getattr(item, "summary", "") or "")
-            summary_lower = summary.lower()
-            summary_tokens_en = Counter(_ENGLISH_WORD_PATTERN.findall(summary_lower))
-
-            summary_ngrams_zh = Counter()
-            for block in _CHINESE_BLOCK_PATTERN.findall(summary):
-                block_len = len(block)
-                for n in (2, 3, 4):
-                    if block_len < n:
-                        continue
-                    for i in range(0, block_len - n + 1):
-                        summary_ngrams_zh[block[i:i + n]] += 1
+            summary_tokens_en = set(_ENGLISH_WORD_PATTERN.findall(summary.lower()))
 
             for kw in query_keywords:
-                if self._count_keyword_matches(kw, summary_tokens_en, summary_ngrams_zh) > 0:
+                if kw in zh_keywords:
+                    hit = 2 <= len(kw) <= 4 and kw in summary
+                else:
+                    hit = kw.lower() in summary_tokens_en
+                if hit:
                     keyword_doc_freq[kw] += 1
 
         corpus_stats = {
@@ -1667,7 +2096,7 @@ class MemoryManager:
         rescored = []
         for item in filtered:
             summary = str(getattr(item, "summary", "") or "")
-            keyword_score, _ = self._calc_keyword_score(query, summary, corpus_stats)
+            keyword_score, _ = self._calc_keyword_score(query, summary, corpus_stats, prepared)
             recency_ts = self._ensure_datetime(item.created_at).timestamp() if getattr(item, "created_at", None) else 0
             rescored.append({
                 "item": item,
@@ -1728,7 +2157,7 @@ class MemoryManager:
             if not db_index.ref_uuids:
                 continue
             try:
-                uuids = json.loads(db_index.ref_uuids)
+                uuids = json_loads(db_index.ref_uuids)
             except (TypeError, ValueError):
                 uuids = []
             if uuids:
@@ -1829,7 +2258,7 @@ class MemoryManager:
         # 确保 ChromaDB 已初始化
         await self._ensure_chroma_initialized()
 
-        loop = asyncio.get_event_loop()
+        loop = self._get_loop()
 
         # limit 统一归一：默认读取配置 max_recent_memories
         try:
@@ -1930,6 +2359,7 @@ class MemoryManager:
         enable_keyword_boost = self.config.get("enable_keyword_boost", True)
         enable_memory_decay = self.config.get("enable_memory_decay", True)
         enable_context_hint = bool(self.config.get("enable_memory_context_hint", True))
+        enable_raw_preview = bool(self.config.get("enable_memory_raw_preview", True))
         try:
             memory_context_window = int(self.config.get("memory_context_window", 2))
         except (TypeError, ValueError):
@@ -1998,7 +2428,8 @@ class MemoryManager:
         # - ngram: 中英混合 n-gram（配置开关）
         enable_ngram_keyword_rank = bool(self.config.get("enable_ngram_keyword_rank", True))
         if enable_ngram_keyword_rank:
-            query_keywords = {k.lower() for k in self._generate_query_keywords(query)}
+            keyword_prepared = self._prepare_keyword_scoring(query)
+            query_keywords = {k.lower() for k in keyword_prepared[0]}
         else:
             query_keywords = {k.lower() for k in re.split(r'[^\w]+', query) if k.strip()}
 
@@ -2013,7 +2444,9 @@ class MemoryManager:
             "keyword_doc_freq": {},
         }
 
-        for i in range(len(results['ids'][0])):
+        # 先按距离过滤，再为保留的候选批量查询索引（active_score、created_at 与摘要正文）
+        kept_hits = []
+        for i, index_id in enumerate(results['ids'][0]):
             distance = distances[i] if distances and i < len(distances) else float('inf')
 
             # 过滤低相关性结果
@@ -2021,12 +2454,26 @@ class MemoryManager:
                 logger.debug(f"Engram：记忆距离 {distance:.3f} 超过阈值 {similarity_threshold}，已跳过")
                 continue
 
-            index_id = results['ids'][0][i]
-            summary = results['documents'][0][i]
             metadata = metadatas[i] if i < len(metadatas) and metadatas[i] else {}
+            kept_hits.append((index_id, metadata, distance))
+
+        if not kept_hits:
+            return []
+
+        index_map = await loop.run_in_executor(
+            self.executor, self.db.get_memory_indexes_by_ids, [hit[0] for hit in kept_hits]
+        )
+
+        for index_id, metadata, distance in kept_hits:
+            db_index = index_map.get(index_id)
+            if db_index is None:
+                # 向量库中残留、索引已删除的记录不再参与检索
+                logger.debug(f"Engram：向量命中 {index_id[:8]} 在索引表中不存在，已跳过")
+                continue
+            summary = db_index.summary or ""
 
             if enable_ngram_keyword_rank:
-                keyword_score, _ = self._calc_keyword_score(query, summary, corpus_stats)
+                keyword_score, _ = self._calc_keyword_score(query, summary, corpus_stats, keyword_prepared)
             else:
                 # BM25 风格关键词匹配：TF 饱和 + 文档长度归一化
                 keyword_score = 0.0
@@ -2042,28 +2489,16 @@ class MemoryManager:
                         keyword_weight = max(1.0, min(3.0, len(keyword) / 2.0))
                         keyword_score += norm_tf * keyword_weight
 
-            memory_data.append({
-                'index_id': index_id,
-                'summary': summary,
-                'metadata': metadata,
-                'distance': distance,
-                'keyword_score': keyword_score,
-                'rank_score': 0.0,
-                'display_score': 0.0
-            })
+            memory_data.append(_RetrievalCandidate(index_id, summary, metadata, distance, keyword_score))
 
         if not memory_data:
             return []
 
-        # 批量查询索引信息（active_score, created_at）
-        index_ids = [item['index_id'] for item in memory_data]
-        index_map = await loop.run_in_executor(self.executor, self.db.get_memory_indexes_by_ids, index_ids)
-
         # 可选：按时间窗口过滤（基于 DB created_at，避免 metadata 时间格式误差）
         if start_time or end_time:
             filtered_by_time = []
             for item in memory_data:
-                db_index = index_map.get(item['index_id'])
+                db_index = index_map.get(item.index_id)
                 created_dt = db_index.created_at if db_index else None
                 if not created_dt:
                     continue
@@ -2077,36 +2512,32 @@ class MemoryManager:
             if not memory_data:
                 return []
 
-            # 过滤后重建索引映射
-            index_ids = [item['index_id'] for item in memory_data]
-            index_map = await loop.run_in_executor(self.executor, self.db.get_memory_indexes_by_ids, index_ids)
-
         # 30天半衰期：越近的记忆 recency 越高
         recency_half_life_days = float(self.config.get("rank_recency_half_life_days", 30))
         recency_half_life_days = max(1.0, recency_half_life_days)
         recency_lambda = 0.693 / (recency_half_life_days * 86400)
 
         active_scores = []
-        keyword_scores = [item['keyword_score'] for item in memory_data]
-        now_ts = datetime.datetime.now().timestamp()
+        keyword_scores = [item.keyword_score for item in memory_data]
+        now_ts = time.time()
 
         for item in memory_data:
-            db_index = index_map.get(item['index_id'])
+            db_index = index_map.get(item.index_id)
             created_dt = db_index.created_at if db_index else None
             active_score = float(db_index.active_score) if db_index else 100.0
-            item['created_at_dt'] = created_dt
-            item['active_score'] = active_score
+            item.created_at_dt = created_dt
+            item.active_score = active_score
             active_scores.append(active_score)
 
             # 向量分：由 distance 归一化
-            item['vector_score'] = max(0.0, min(1.0, 1 - item['distance'] / max(similarity_threshold, 1e-6)))
+            item.vector_score = max(0.0, min(1.0, 1 - item.distance / max(similarity_threshold, 1e-6)))
 
             # 时间衰减分
             if created_dt:
                 age_seconds = max(0.0, now_ts - created_dt.timestamp())
-                item['recency_score'] = max(0.0, min(1.0, pow(2.718281828, -recency_lambda * age_seconds)))
+                item.recency_score = max(0.0, min(1.0, pow(2.718281828, -recency_lambda * age_seconds)))
             else:
-                item['recency_score'] = 0.5
+                item.recency_score = 0.5
 
         # 归一化 keyword_score / active_score
         max_keyword = max(keyword_scores) if keyword_scores else 0.0
@@ -2115,8 +2546,8 @@ class MemoryManager:
         active_range = max(max_active - min_active, 1e-6)
 
         for item in memory_data:
-            item['keyword_score_norm'] = (item['keyword_score'] / max_keyword) if max_keyword > 0 else 0.0
-            item['activity_score'] = (item['active_score'] - min_active) / active_range
+            item.keyword_score_norm = (item.keyword_score / max_keyword) if max_keyword > 0 else 0.0
+            item.activity_score = (item.active_score - min_active) / active_range
 
         # 3. 排序策略：RRF（可回退）或 Hybrid（四路融合）
         rrf_k = 60
@@ -2127,39 +2558,39 @@ class MemoryManager:
                 vector_w = 1.0 - keyword_boost_weight
                 keyword_w = keyword_boost_weight
 
-                sorted_by_vector = sorted(range(len(memory_data)), key=lambda idx: memory_data[idx]['distance'])
+                sorted_by_vector = sorted(range(len(memory_data)), key=lambda idx: memory_data[idx].distance)
                 vector_rank = {idx: rank + 1 for rank, idx in enumerate(sorted_by_vector)}
 
-                sorted_by_keyword = sorted(range(len(memory_data)), key=lambda idx: memory_data[idx]['keyword_score'], reverse=True)
+                sorted_by_keyword = sorted(range(len(memory_data)), key=lambda idx: memory_data[idx].keyword_score, reverse=True)
                 keyword_rank = {idx: rank + 1 for rank, idx in enumerate(sorted_by_keyword)}
 
                 for i, data in enumerate(memory_data):
                     rrf_vector = vector_w / (rrf_k + vector_rank[i])
                     rrf_keyword = keyword_w / (rrf_k + keyword_rank[i])
-                    data['rank_score'] = rrf_vector + rrf_keyword
-                    data['display_score'] = data['rank_score']
+                    data.rank_score = rrf_vector + rrf_keyword
+                    data.display_score = data.rank_score
 
-                memory_data.sort(key=lambda x: x['rank_score'], reverse=True)
+                memory_data.sort(key=_BY_RANK_SCORE, reverse=True)
             else:
                 for data in memory_data:
-                    data['rank_score'] = data['vector_score']
-                    data['display_score'] = data['rank_score']
-                memory_data.sort(key=lambda x: x['distance'])
+                    data.rank_score = data.vector_score
+                    data.display_score = data.rank_score
+                memory_data.sort(key=_BY_DISTANCE)
         else:
             total_w = weight_vector + weight_keyword + weight_recency + weight_activity
             if total_w <= 0:
                 total_w = 1.0
 
             for data in memory_data:
-                data['rank_score'] = (
-                    weight_vector * data['vector_score'] +
-                    weight_keyword * (data['keyword_score_norm'] if enable_keyword_boost else 0.0) +
-                    weight_recency * data['recency_score'] +
-                    weight_activity * data['activity_score']
+                data.rank_score = (
+                    weight_vector * data.vector_score +
+                    weight_keyword * (data.keyword_score_norm if enable_keyword_boost else 0.0) +
+                    weight_recency * data.recency_score +
+                    weight_activity * data.activity_score
                 ) / total_w
-                data['display_score'] = data['rank_score']
+                data.display_score = data.rank_score
 
-            memory_data.sort(key=lambda x: x['rank_score'], reverse=True)
+            memory_data.sort(key=_BY_RANK_SCORE, reverse=True)
 
         # 4. 只保留前 limit 条
         memory_data = memory_data[:limit]
@@ -2167,16 +2598,21 @@ class MemoryManager:
         # retrieve_memories 的时间过滤不会改变记忆增强逻辑；仅缩小候选范围
 
         # 5. 批量拉取索引、前序链路、原文，避免循环内多次 run_in_executor
-        index_ids = [item['index_id'] for item in memory_data]
+        index_ids = [item.index_id for item in memory_data]
         db_indices = {}
         prev_index_map = {}
         raw_map = {}
 
         if index_ids:
-            db_indices = await loop.run_in_executor(self.executor, self.db.get_memory_indexes_by_ids, index_ids)
+            # 复用第 2 步已批量查询的索引映射，不再重复访问数据库
+            db_indices = {idx: index_map[idx] for idx in index_ids if idx in index_map}
+
+            async def _walk_prev_chain():
+                """按窗口宽度批量向前追溯上下文链路（每层一次批量查询）"""
+                chain_map = {}
+                if not (enable_context_hint and memory_context_window > 0):
+                    return chain_map
 
-            # 按窗口宽度批量向前追溯上下文链路
-            if enable_context_hint and memory_context_window > 0:
                 pending_prev_ids = {
                     db_indices[idx].prev_index_id
                     for idx in index_ids
@@ -2186,83 +2622,99 @@ class MemoryManager:
                     if not pending_prev_ids:
                         break
 
-                    if hasattr(self.db, "get_prev_indices_by_ids"):
-                        fetched_prev = await loop.run_in_executor(
-                            self.executor,
-                            self.db.get_prev_indices_by_ids,
-                            list(pending_prev_ids)
-                        )
-                    else:
-                        # 兼容旧版 DBManager：退化为通用批量索引查询
-                        fetched_prev = await loop.run_in_executor(
-                            self.executor,
-                            self.db.get_memory_indexes_by_ids,
-                            list(pending_prev_ids)
-                        )
-
-                    if not fetched_prev:
+                    # 前序索引若已在候选映射中，直接复用，仅查询缺失部分
+                    level_map = {pid: index_map[pid] for pid in pending_prev_ids if pid in index_map}
+                    missing_ids = [pid for pid in pending_prev_ids if pid not in level_map]
+
+                    if missing_ids:
+                        if hasattr(self.db, "get_prev_indices_by_ids"):
+                            fetched_prev = await loop.run_in_executor(
+                                self.executor,
+                                self.db.get_prev_indices_by_ids,
+                                missing_ids
+                            )
+                        else:
+                            # 兼容旧版 DBManager：退化为通用批量索引查询
+                            fetched_prev = await loop.run_in_executor(
+                                self.executor,
+                                self.db.get_memory_indexes_by_ids,
+                                missing_ids
+                            )
+                        if fetched_prev:
+                            level_map.update(fetched_prev)
+
+                    if not level_map:
                         break
-                    prev_index_map.update(fetched_prev)
+                    chain_map.update(level_map)
                     pending_prev_ids = {
                         item.prev_index_id
-                        for item in fetched_prev.values()
-                        if item.prev_index_id and item.prev_index_id not in prev_index_map
+                        for item in level_map.values()
+                        if item.prev_index_id and item.prev_index_id not in chain_map
                     }
+                return chain_map
+
+            async def _fetch_raw_map():
+                """批量解析 ref_uuids 后，一次性获取所有原文"""
+                if not enable_raw_preview:
+                    return {}
+                index_uuid_map = {}
+                for idx, db_index in db_indices.items():
+                    if not db_index.ref_uuids:
+                        continue
+                    try:
+                        uuids = json_loads(db_index.ref_uuids)
+                    except (TypeError, ValueError):
+                        uuids = []
+                    if uuids:
+                        index_uuid_map[idx] = uuids
 
-            # 批量解析 ref_uuids 后，一次性获取所有原文
-            index_uuid_map = {}
-            for idx, db_index in db_indices.items():
-                if not db_index.ref_uuids:
-                    continue
-                try:
-                    uuids = json.loads(db_index.ref_uuids)
-                except (TypeError, ValueError):
-                    uuids = []
-                if uuids:
-                    index_uuid_map[idx] = uuids
+                if not index_uuid_map:
+                    return {}
 
-            if index_uuid_map:
                 if hasattr(self.db, "get_raw_memories_map_by_uuid_lists"):
-                    raw_map = await loop.run_in_executor(
+                    return await loop.run_in_executor(
                         self.executor,
                         self.db.get_raw_memories_map_by_uuid_lists,
                         index_uuid_map
                     )
-                else:
-                    # 兼容旧版 DBManager：按每条索引兜底查询
-                    def _legacy_build_raw_map():
-                        _result = {}
-                        for _idx, _uuids in index_uuid_map.items():
-                            try:
-                                _result[_idx] = self.db.get_memories_by_uuids(_uuids)
-                            except Exception as e:
-                                logger.debug(
-                                    "Engram：旧版 get_memories_by_uuids 调用失败，index=%s，已回退为空原文映射：%s",
-                                    str(_idx)[:8],
-                                    e,
-                                )
-                                _result[_idx] = []
-                        return _result
-
-                    raw_map = await loop.run_in_executor(self.executor, _legacy_build_raw_map)
+
+                # 兼容旧版 DBManager：按每条索引兜底查询
+                def _legacy_build_raw_map():
+                    _result = {}
+                    for _idx, _uuids in index_uuid_map.items():
+                        try:
+                            _result[_idx] = self.db.get_memories_by_uuids(_uuids)
+                        except Exception as e:
+                            logger.debug(
+                                "Engram：旧版 get_memories_by_uuids 调用失败，index=%s，已回退为空原文映射：%s",
+                                str(_idx)[:8],
+                                e,
+                            )
+                            _result[_idx] = []
+                    return _result
+
+                return await loop.run_in_executor(self.executor, _legacy_build_raw_map)
+
+            # 前序链路与原文互不依赖，并发查询：总等待约为两者中较慢的一路
+            prev_index_map, raw_map = await asyncio.gather(_walk_prev_chain(), _fetch_raw_map())
 
         # 6. 构造带时间线背景和评分的记忆文本
         all_memories = []
 
         for data in memory_data:
-            index_id = data['index_id']
-            summary = data['summary']
-            metadata = data['metadata']
-            distance = data['distance']
-            created_at = metadata.get("created_at", "未知时间")
+            index_id = data.index_id
+            summary = data.summary
+            metadata = data.metadata
+            distance = data.distance
+            created_at = self._format_metadata_time(metadata.get("created_at"))
 
             if rank_strategy == "rrf" and use_keyword and memory_data:
                 quality_factor = max(0.0, 1.5 - distance) / 1.5
-                best_score = memory_data[0].get('display_score', 1e-9)
-                raw_percent = data.get('display_score', 0) / max(best_score, 1e-9) * 100
+                best_score = memory_data[0].display_score
+                raw_percent = data.display_score / max(best_score, 1e-9) * 100
                 relevance_percent = max(0, min(100, int(raw_percent * quality_factor)))
             else:
-                relevance_percent = max(0, min(100, int(data.get('display_score', 0) * 100)))
+                relevance_percent = max(0, min(100, int(data.display_score * 100)))
 
             # 尝试通过链表获取"前情提要"（可配置开关）
             context_hint = ""
@@ -2309,54 +2761,51 @@ class MemoryManager:
         # 7. Reinforce：被成功召回的记忆增强 active_score
         reinforce_bonus = self.config.get("memory_reinforce_bonus", 20)
         if all_memories and reinforce_bonus > 0:
-            for data in memory_data:
-                try:
-                    await loop.run_in_executor(
-                        self.executor,
-                        self.db.update_active_score,
-                        data['index_id'],
-                        reinforce_bonus
-                    )
-                except Exception as e:
-                    logger.debug(f"Engram：增强记忆 {data['index_id'][:8]} 活跃度失败：{e}")
+            def _reinforce_all(ids):
+                for index_id in ids:
+                    try:
+                        self.db.update_active_score(index_id, reinforce_bonus)
+                    except Exception as e:
+                        logger.debug(f"Engram：增强记忆 {index_id[:8]} 活跃度失败：{e}")
+
+            # 合并为一次线程池提交，避免每条记忆一次事件循环往返
+            await loop.run_in_executor(
+                self.executor,
+                _reinforce_all,
+                [data.index_id for data in memory_data]
+            )
 
         return all_memories
 
     async def get_memory_detail(self, user_id, sequence_num):
         """获取指定序号记忆的完整原文详情"""
-        loop = asyncio.get_event_loop()
-
-        # 1. 获取最近的 N 条记忆（为了找到对应的序号）
-        # 假设用户输入的序号是基于 mem_list 的（最新的为 1）
-        limit = sequence_num + 2
-        memories = await loop.run_in_executor(self.executor, self.db.get_memory_list, user_id, limit)
-
-        if not memories or len(memories) < sequence_num:
+        # 1. 按序号直接定位目标记忆（序号基于 mem_list，最新的为 1）
+        target_memory = await self._spawn_blocking(self.db.get_memory_by_sequence, user_id, sequence_num)
+        if target_memory is None:
             return None, "找不到该序号的记忆，请确认序号是否存在。"
 
-        # 2. 锁定目标记忆
-        target_memory = memories[sequence_num - 1]
-
-        # 3. 解析原文 UUID
+        # 2. 解析原文 UUID
         if not target_memory.ref_uuids:
             return target_memory, []
 
-        uuids = json.loads(target_memory.ref_uuids)
-        raw_msgs = await loop.run_in_executor(self.executor, self.db.get_memories_by_uuids, uuids)
+        uuids = json_loads(target_memory.ref_uuids)
+        raw_msgs = await self._spawn_blocking(self.db.get_memories_by_uuids, uuids)
 
         return target_memory, raw_msgs
 
     async def _find_memory_by_short_id(self, user_id, short_id):
         """按短 ID（8位）或完整 ID 查询记忆索引。"""
-        loop = asyncio.get_event_loop()
-
         def _find_memory():
             with self.db.db.connection_context():
                 MemoryIndex = self.db.MemoryIndex
                 if len(short_id) == 8:
+                    # 用区间代替 LIKE 'prefix%'：SQLite 的 LIKE 默认不区分大小写，无法走 (user_id, index_id) 索引；
+                    # index_id 为小写 UUID，前缀统一转小写以保持原有的大小写不敏感匹配
+                    prefix = short_id.lower()
                     query = MemoryIndex.select().where(
                         (MemoryIndex.user_id == user_id) &
-                        (MemoryIndex.index_id.startswith(short_id))
+                        (MemoryIndex.index_id >= prefix) &
+                        (MemoryIndex.index_id < prefix + "\uffff")
                     )
                 else:
                     query = MemoryIndex.select().where(
@@ -2365,7 +2814,7 @@ class MemoryManager:
                     )
                 return query.first()
 
-        return await loop.run_in_executor(self.executor, _find_memory)
+        return await self._spawn_blocking(_find_memory)
 
     async def get_memory_detail_by_id(self, user_id, short_id):
         """
@@ -2378,8 +2827,6 @@ class MemoryManager:
         Returns:
             (memory_index, raw_msgs) 或 (None, error_message)
         """
-        loop = asyncio.get_event_loop()
-
         target_memory = await self._find_memory_by_short_id(user_id, short_id)
 
         if not target_memory:
@@ -2389,8 +2836,8 @@ class MemoryManager:
         if not target_memory.ref_uuids:
             return target_memory, []
 
-        uuids = json.loads(target_memory.ref_uuids)
-        raw_msgs = await loop.run_in_executor(self.executor, self.db.get_memories_by_uuids, uuids)
+        uuids = json_loads(target_memory.ref_uuids)
+        raw_msgs = await self._spawn_blocking(self.db.get_memories_by_uuids, uuids)
 
         return target_memory, raw_msgs
 
@@ -2403,7 +2850,6 @@ class MemoryManager:
 
     async def _delete_memory_entry(self, user_id, target_memory, delete_raw=False):
         """删除单条记忆索引（统一序号/ID 两种入口），并写入撤销历史。"""
-        loop = asyncio.get_event_loop()
         index_id = target_memory.index_id
         summary = target_memory.summary
 
@@ -2412,44 +2858,34 @@ class MemoryManager:
             await self._ensure_chroma_initialized()
 
             # 保存删除前的数据（用于撤销）
-            deleted_uuids = json.loads(target_memory.ref_uuids) if target_memory.ref_uuids else []
+            scope_key = self._build_delete_scope_key(user_id, target_memory.source_type)
+            source_type = str(target_memory.source_type or self.default_source_type or "private")
 
-            # 获取向量数据（用于恢复）
-            vector_data = None
-            try:
-                chroma_result = await loop.run_in_executor(
-                    self.executor,
-                    lambda: self.collection.get(ids=[index_id], include=['embeddings', 'metadatas', 'documents'])
-                )
-                if chroma_result and chroma_result['ids']:
-                    vector_data = {
-                        'embedding': chroma_result['embeddings'][0] if chroma_result.get('embeddings') else None,
-                        'metadata': chroma_result['metadatas'][0] if chroma_result.get('metadatas') else {},
-                        'document': chroma_result['documents'][0] if chroma_result.get('documents') else summary
-                    }
-            except Exception as e:
-                logger.debug(f"Engram：获取备份向量数据失败：{e}")
+            def _delete_sync():
+                """备份向量、写入撤销历史、删除向量与 SQLite 数据，整体一次提交到线程池"""
+                collection = self.collection
+                db = self.db
+                # ref_uuids 可能很长，解析也放在线程池内，避免阻塞事件循环
+                deleted_uuids = json_loads(target_memory.ref_uuids) if target_memory.ref_uuids else []
 
-            # 创建删除记录（DB 持久化为真相源）
-            delete_record = {
-                'index_id': index_id,
-                'summary': summary,
-                'ref_uuids': target_memory.ref_uuids,
-                'prev_index_id': target_memory.prev_index_id,
-                'source_type': target_memory.source_type,
-                'user_id': user_id,
-                'created_at': target_memory.created_at,
-                'active_score': target_memory.active_score,
-                'delete_raw': delete_raw,
-                'deleted_uuids': deleted_uuids,
-                'vector_data': vector_data,
-            }
+                # 获取向量数据（用于原样恢复）；max_undo_history 为 0 时不拉取，撤销时重新生成向量
+                vector_data = None
+                if self._max_undo_history > 0:
+                    try:
+                        chroma_result = collection.get(ids=[index_id], include=['embeddings', 'metadatas', 'documents'])
+                        if chroma_result and chroma_result['ids']:
+                            embeddings = chroma_result.get('embeddings')
+                            embedding = embeddings[0] if embeddings is not None and len(embeddings) else None
+                            vector_data = {
+                                'embedding': self._pack_embedding(embedding) if embedding is not None else None,
+                                'metadata': chroma_result['metadatas'][0] if chroma_result.get('metadatas') else {},
+                                'document': chroma_result['documents'][0] if chroma_result.get('documents') else summary
+                            }
+                    except Exception as e:
+                        logger.debug(f"Engram：获取备份向量数据失败：{e}")
 
-            scope_key = self._build_delete_scope_key(user_id, target_memory.source_type)
-            source_type = str(target_memory.source_type or self.default_source_type or "private")
-            delete_history_id = await loop.run_in_executor(
-                self.executor,
-                lambda: self.db.save_delete_history(
+                # 撤销历史（DB 持久化为真相源）
+                history_id = db.save_delete_history(
                     scope_key=scope_key,
                     user_id=str(user_id or ""),
                     group_id=str(user_id or "") if source_type.startswith("group") else "",
@@ -2461,36 +2897,33 @@ class MemoryManager:
                     created_at=target_memory.created_at,
                     active_score=target_memory.active_score,
                     delete_raw=bool(delete_raw),
-                    deleted_uuids=json.dumps(deleted_uuids, ensure_ascii=False),
+                    deleted_uuids=json_dumps(deleted_uuids),
                     vector_data=vector_data,
-                ),
-            )
-            delete_record["_history_id"] = delete_history_id
+                )
 
-            # 热缓存保留最近若干条，便于同进程快速撤销
-            if user_id not in self._delete_history:
-                self._delete_history[user_id] = []
-            self._delete_history[user_id].insert(0, delete_record)
-            self._delete_history[user_id] = self._delete_history[user_id][:self._max_undo_history]
-
-            # 1. 从 ChromaDB 删除向量数据
-            await loop.run_in_executor(self.executor, lambda: self.collection.delete(ids=[index_id]))
-
-            # 2. 如果需要，删除关联的原始消息
-            if delete_raw and target_memory.ref_uuids:
-                uuids = json.loads(target_memory.ref_uuids)
-                await loop.run_in_executor(self.executor, self.db.delete_raw_memories_by_uuids, uuids)
-            else:
-                # 不删除原始消息时，将其标记为未归档，以便重新总结
-                if deleted_uuids:
-                    def _mark_unarchived():
-                        RawMemory = self.db.RawMemory
-                        with self.db.db.connection_context():
-                            RawMemory.update(is_archived=False).where(RawMemory.uuid << deleted_uuids).execute()
-                    await loop.run_in_executor(self.executor, _mark_unarchived)
+                # 1. 向量打墓碑（仅改写元数据，避免逐条物理删除触发 HNSW 变更），由维护任务统一回收
+                collection.update(ids=[index_id], metadatas=[{"user_id": _CHROMA_TOMBSTONE_USER_ID}])
+                # 2~3. 单事务删除（或恢复为未归档以便重新总结）关联原文，并删除记忆索引
+                db.remove_memory_index(index_id, deleted_uuids, delete_raw=bool(delete_raw))
+                return deleted_uuids, vector_data, history_id
 
-            # 3. 从 SQLite 删除记忆索引
-            await loop.run_in_executor(self.executor, self.db.delete_memory_index, index_id)
+            deleted_uuids, vector_data, delete_history_id = await self._spawn_blocking(_delete_sync)
+
+            # 热缓存保留最近若干条，便于同进程快速撤销
+            self._delete_history[user_id].appendleft({
+                'index_id': index_id,
+                'summary': summary,
+                'ref_uuids': target_memory.ref_uuids,
+                'prev_index_id': target_memory.prev_index_id,
+                'source_type': target_memory.source_type,
+                'user_id': user_id,
+                'created_at': target_memory.created_at,
+                'active_score': target_memory.active_score,
+                'delete_raw': delete_raw,
+                'deleted_uuids': deleted_uuids,
+                'vector_data': vector_data,
+                '_history_id': delete_history_id,
+            })
 
             return True, "删除成功", summary
         except Exception as e:
@@ -2509,130 +2942,152 @@ class MemoryManager:
         Returns:
             (success: bool, message: str, summary: str)
         """
-        loop = asyncio.get_event_loop()
-
         # 1. 获取目标记忆
-        limit = sequence_num + 2
-        memories = await loop.run_in_executor(self.executor, self.db.get_memory_list, user_id, limit)
-
-        if not memories or len(memories) < sequence_num:
+        target_memory = await self._spawn_blocking(self.db.get_memory_by_sequence, user_id, sequence_num)
+        if target_memory is None:
             return False, "找不到该序号的记忆，请确认序号是否存在。", ""
-
-        target_memory = memories[sequence_num - 1]
         return await self._delete_memory_entry(user_id, target_memory, delete_raw=delete_raw)
 
+    def _new_delete_history(self):
+        """创建用户的撤销热缓存（defaultdict 工厂）"""
+        return deque(maxlen=self._max_undo_history)
+
+    @staticmethod
+    def _delete_record_from_history(row, user_id):
+        """将 DB 删除历史行转换为撤销所需的记录字典"""
+        try:
+            deleted_uuids = json_loads(row.deleted_uuids or "[]")
+            if not isinstance(deleted_uuids, list):
+                deleted_uuids = []
+        except Exception:
+            deleted_uuids = []
+        return {
+            'history_id': row.id,
+            'index_id': row.index_id,
+            'summary': row.summary,
+            'ref_uuids': row.ref_uuids,
+            'prev_index_id': row.prev_index_id,
+            'source_type': row.source_type,
+            'user_id': row.user_id or user_id,
+            'created_at': row.created_at,
+            'active_score': row.active_score,
+            'delete_raw': row.delete_raw,
+            'deleted_uuids': deleted_uuids,
+            'vector_data': row.vector_data,
+        }
+
     async def undo_last_delete(self, user_id):
         """撤销最近一次删除操作（优先使用 DB 历史，支持跨重启）。"""
-        loop = asyncio.get_event_loop()
+        restored, message, summaries = await self.undo_last_deletes(user_id, 1)
+        return restored > 0, message, summaries[0] if summaries else ""
 
-        scope_private = self._build_delete_scope_key(user_id, "private")
-        scope_group = self._build_delete_scope_key(user_id, "group")
+    async def undo_last_deletes(self, user_id, count=1):
+        """
+        批量撤销最近的若干次删除操作
 
-        row_private = await loop.run_in_executor(self.executor, self.db.get_last_delete_history, scope_private)
-        row_group = await loop.run_in_executor(self.executor, self.db.get_last_delete_history, scope_group)
+        SQLite 索引与撤销历史在单事务内恢复，带备份向量的记录合并为一次 collection.upsert，
+        无备份的记录合并为一次 embedding 请求。
 
-        candidates = [r for r in [row_private, row_group] if r is not None]
-        if not candidates:
-            # 回退内存热缓存（兼容极端旧数据）
-            if user_id not in self._delete_history or not self._delete_history[user_id]:
-                return False, "没有可撤销的删除操作。", ""
-            delete_record = self._delete_history[user_id].pop(0)
-            history_id = None
+        Args:
+            user_id: 用户ID
+            count: 最多撤销的条数
+
+        Returns:
+            (restored: int, message: str, summaries: list)
+        """
+        count = max(1, int(count or 1))
+
+        scope_keys = (
+            self._build_delete_scope_key(user_id, "private"),
+            self._build_delete_scope_key(user_id, "group"),
+        )
+        rows = await self._spawn_blocking(self.db.get_recent_delete_histories, scope_keys, count)
+        if rows:
+            records = [self._delete_record_from_history(row, user_id) for row in rows]
         else:
-            selected = sorted(candidates, key=lambda r: (r.deleted_at, r.id), reverse=True)[0]
-            history_id = selected.id
-            try:
-                deleted_uuids = json.loads(selected.deleted_uuids or "[]")
-                if not isinstance(deleted_uuids, list):
-                    deleted_uuids = []
-            except Exception:
-                deleted_uuids = []
-            delete_record = {
-                'index_id': selected.index_id,
-                'summary': selected.summary,
-                'ref_uuids': selected.ref_uuids,
-                'prev_index_id': selected.prev_index_id,
-                'source_type': selected.source_type,
-                'user_id': selected.user_id or user_id,
-                'created_at': selected.created_at,
-                'active_score': selected.active_score,
-                'delete_raw': selected.delete_raw,
-                'deleted_uuids': deleted_uuids,
-                'vector_data': selected.vector_data,
-            }
+            # 回退内存热缓存（兼容极端旧数据）；只读路径用 get，避免为无历史的用户创建空队列
+            history = self._delete_history.get(user_id)
+            if not history:
+                return 0, "没有可撤销的删除操作。", []
+            records = [history.popleft() for _ in range(min(count, len(history)))]
+        summaries = [record['summary'] for record in records]
 
         try:
-            # 1) 恢复 SQLite 索引
-            index_params = {
-                'index_id': delete_record['index_id'],
-                'summary': delete_record['summary'],
-                'ref_uuids': delete_record['ref_uuids'],
-                'prev_index_id': delete_record['prev_index_id'],
-                'source_type': delete_record['source_type'],
-                'user_id': delete_record['user_id'],
-                'created_at': delete_record['created_at'],
-                'active_score': delete_record.get('active_score', 100)
-            }
-            await loop.run_in_executor(self.executor, lambda: self.db.save_memory_index(**index_params))
-            self._record_memory_event(
-                summary=index_params.get("summary"),
-                user_id=index_params.get("user_id"),
-                source_type=index_params.get("source_type"),
-            )
+            # 恢复 SQLite 索引与原文归档状态（commit_summaries 单事务写入）
+            index_params_list = []
+            archived_uuids = []
+            for record in records:
+                index_params_list.append({
+                    'index_id': record['index_id'],
+                    'summary': record['summary'],
+                    'ref_uuids': record['ref_uuids'],
+                    'prev_index_id': record['prev_index_id'],
+                    'source_type': record['source_type'],
+                    'user_id': record['user_id'],
+                    'created_at': record['created_at'],
+                    'active_score': record.get('active_score', 100)
+                })
+                archived_uuids.extend(record['deleted_uuids'] or [])
 
-            # 2) 恢复向量
+            # 按是否有备份向量分组：有备份的直接写回，无备份的重新生成
             await self._ensure_chroma_initialized()
-            vector_data = delete_record.get('vector_data')
-            if vector_data and vector_data.get('embedding'):
-                add_params = {
-                    'ids': [delete_record['index_id']],
-                    'documents': [vector_data.get('document', delete_record['summary'])],
-                    'metadatas': [vector_data.get('metadata', {'user_id': user_id})],
-                    'embeddings': [vector_data['embedding']]
-                }
-                await loop.run_in_executor(self.executor, lambda: self.collection.add(**add_params))
-            else:
-                add_params = {
-                    'ids': [delete_record['index_id']],
-                    'documents': [delete_record['summary']],
-                    'metadatas': [{
-                        'user_id': user_id,
-                        'source_type': delete_record['source_type'],
-                        'created_at': delete_record['created_at'].strftime("%Y-%m-%d %H:%M:%S") if hasattr(delete_record['created_at'], 'strftime') else str(delete_record['created_at'])
-                    }]
-                }
+            vector_params = {'ids': [], 'documents': [], 'metadatas': [], 'embeddings': []}
+            text_records = []
+            for record in records:
+                vector_data = record.get('vector_data')
+                embedding = self._unpack_embedding(vector_data.get('embedding')) if vector_data else None
+                if not embedding:
+                    text_records.append(record)
+                    continue
+                vector_params['ids'].append(record['index_id'])
+                vector_params['documents'].append(vector_data.get('document', record['summary']))
+                vector_params['metadatas'].append(vector_data.get('metadata', {'user_id': user_id}))
+                vector_params['embeddings'].append(embedding)
+            history_ids = [record['history_id'] for record in records if record.get('history_id')]
+
+            # 备份向量写回与 SQLite 恢复合并为一次线程池调用：
+            # 先写向量（失败时 SQLite 保持原状可重试），再单事务恢复索引、归档状态并标记撤销历史
+            def _restore_sync():
+                if vector_params['ids']:
+                    # 墓碑向量尚未回收时 id 仍存在，add 会被忽略；upsert 同时覆盖墓碑元数据
+                    self.collection.upsert(**vector_params)
+                self.db.restore_deleted_memories(index_params_list, archived_uuids, history_ids)
+
+            await self._spawn_blocking(_restore_sync)
+            for index_params in index_params_list:
+                self._record_memory_event(
+                    summary=index_params.get("summary"),
+                    user_id=index_params.get("user_id"),
+                    source_type=index_params.get("source_type"),
+                )
+
+            if text_records:
+                # 无备份向量：通过 embedding provider 一次性重新生成
                 added = await self._collection_add_texts(
-                    ids=add_params["ids"],
-                    documents=add_params["documents"],
-                    metadatas=add_params["metadatas"]
+                    ids=[record['index_id'] for record in text_records],
+                    documents=[record['summary'] for record in text_records],
+                    metadatas=[{
+                        'user_id': user_id,
+                        'source_type': record['source_type'],
+                        'created_at': self._metadata_timestamp(record['created_at'])
+                    } for record in text_records]
                 )
                 if not added:
                     logger.warning("Engram：撤销操作已跳过向量恢复（embedding provider 不可用）")
 
-            # 3) 恢复原文归档状态
-            if delete_record['deleted_uuids']:
-                def _mark_archived():
-                    RawMemory = self.db.RawMemory
-                    with self.db.db.connection_context():
-                        RawMemory.update(is_archived=True).where(
-                            RawMemory.uuid << delete_record['deleted_uuids']
-                        ).execute()
-                try:
-                    await loop.run_in_executor(self.executor, _mark_archived)
-                except Exception as e:
-                    logger.debug(f"Engram：恢复原始消息归档状态失败：{e}")
-
-            if history_id:
-                await loop.run_in_executor(self.executor, self.db.mark_delete_history_restored, history_id)
-
-            return True, "撤销成功", delete_record['summary']
+            return len(records), "撤销成功", summaries
 
         except Exception as e:
             logger.error(f"Engram：撤销删除失败：{e}")
-            if not history_id:
-                self._delete_history.setdefault(user_id, []).insert(0, delete_record)
-                self._delete_history[user_id] = self._delete_history[user_id][:self._max_undo_history]
-            return False, f"撤销失败：{e}", delete_record['summary']
+            if not rows:
+                self._delete_history[user_id].extendleft(reversed(records))
+            return 0, f"撤销失败：{e}", summaries
+
+    async def vacuum_deleted_vectors(self):
+        """物理删除所有打了墓碑的向量（单次 collection.delete），返回是否执行成功"""
+        await self._ensure_chroma_initialized()
+        await self._spawn_blocking(self.collection.delete, where={"user_id": _CHROMA_TOMBSTONE_USER_ID})
+        return True
 
     async def delete_memory_by_id(self, user_id, short_id, delete_raw=False):
         """
@@ -2668,7 +3123,6 @@ class MemoryManager:
         except (TypeError, ValueError):
             batch_size = 200
 
-        loop = asyncio.get_event_loop()
         backup_dir = ""
 
         def _load_all_indexes():
@@ -2711,11 +3165,11 @@ class MemoryManager:
                     self.chroma_client.delete_collection(name="long_term_memories")
                 except Exception as e:
                     logger.debug(f"Engram：删除旧 Chroma 集合已跳过或失败，将继续重建：{e}")
-                self.collection = self.chroma_client.get_or_create_collection(name="long_term_memories")
+                self.collection = self._open_memory_collection(self.chroma_client)
 
-            await loop.run_in_executor(self.executor, _backup_and_reset_collection)
+            await self._spawn_blocking(_backup_and_reset_collection)
 
-        all_rows = await loop.run_in_executor(self.executor, _load_all_indexes)
+        all_rows = await self._spawn_blocking(_load_all_indexes)
         if not all_rows:
             return {
                 "success": True,
@@ -2738,11 +3192,10 @@ class MemoryManager:
 
             for row in batch:
                 created_at = row["created_at"]
-                created_str = created_at.strftime("%Y-%m-%d %H:%M:%S") if hasattr(created_at, "strftime") else str(created_at)
                 metadata = {
                     "user_id": row["user_id"],
                     "source_type": row["source_type"],
-                    "created_at": created_str,
+                    "created_at": self._metadata_timestamp(created_at),
                     "ai_name": str(self.config.get("ai_name") or "").strip()
                 }
                 if row.get("group_id"):
@@ -2798,39 +3251,34 @@ class MemoryManager:
         Returns:
             (success: bool, data: str, stats: dict)
         """
-        loop = asyncio.get_event_loop()
+        # 不支持的格式在任何 DB 查询之前直接返回
+        exporter = self._get_exporter(format)
+        if exporter is None:
+            return False, f"不支持的导出格式：{format}", {}
+        export_executor = self._get_export_executor()
 
         try:
-            # 获取原始消息
-            raw_msgs = await loop.run_in_executor(
-                self.executor,
-                self.db.get_all_raw_messages,
-                user_id,
-                start_date,
-                end_date,
-                limit
+            await self.flush_pending_raw()
+            # 原始消息（导出线程池）与统计信息（共享线程池）并发查询
+            raw_msgs, stats = await asyncio.gather(
+                self._spawn_blocking_in(
+                    export_executor,
+                    self.db.get_all_raw_messages,
+                    user_id,
+                    start_date,
+                    end_date,
+                    limit
+                ),
+                self._spawn_blocking(self.db.get_message_stats, user_id),
             )
 
             if not raw_msgs:
                 return False, "没有找到可导出的消息", {}
 
-            # 获取统计信息
-            stats = await loop.run_in_executor(self.executor, self.db.get_message_stats, user_id)
             stats["exported"] = len(raw_msgs)
 
-            # 根据格式导出
-            if format == "jsonl":
-                data = self._export_as_jsonl(raw_msgs)
-            elif format == "json":
-                data = self._export_as_json(raw_msgs)
-            elif format == "txt":
-                data = self._export_as_txt(raw_msgs)
-            elif format == "alpaca":
-                data = self._export_as_alpaca(raw_msgs)
-            elif format == "sharegpt":
-                data = self._export_as_sharegpt(raw_msgs)
-            else:
-                return False, f"不支持的导出格式：{format}", {}
+            # 根据格式导出（序列化为 CPU 密集型操作，放入线程池避免阻塞事件循环）
+            data = await self._spawn_blocking_in(export_executor, exporter, raw_msgs)
 
             return True, data, stats
 
@@ -2851,38 +3299,33 @@ class MemoryManager:
         Returns:
             (success: bool, data: str, stats: dict)
         """
-        loop = asyncio.get_event_loop()
+        # 不支持的格式在任何 DB 查询之前直接返回
+        exporter = self._get_exporter(format)
+        if exporter is None:
+            return False, f"不支持的导出格式：{format}", {}
+        export_executor = self._get_export_executor()
 
         try:
-            # 获取所有用户的消息
-            raw_msgs = await loop.run_in_executor(
-                self.executor,
-                self.db.get_all_users_messages,
-                start_date,
-                end_date,
-                limit
+            await self.flush_pending_raw()
+            # 所有用户的消息（导出线程池）与统计信息（共享线程池）并发查询
+            raw_msgs, stats = await asyncio.gather(
+                self._spawn_blocking_in(
+                    export_executor,
+                    self.db.get_all_users_messages,
+                    start_date,
+                    end_date,
+                    limit
+                ),
+                self._spawn_blocking(self.db.get_all_users_stats),
             )
 
             if not raw_msgs:
-                return self._format_export_output(format, [], {})
+                return False, "没有找到可导出的消息", {}
 
-            # 获取统计信息
-            stats = await loop.run_in_executor(self.executor, self.db.get_all_users_stats)
             stats["exported"] = len(raw_msgs)
 
-            # 根据格式导出
-            if format == "jsonl":
-                data = self._export_as_jsonl(raw_msgs)
-            elif format == "json":
-                data = self._export_as_json(raw_msgs)
-            elif format == "txt":
-                data = self._export_as_txt(raw_msgs)
-            elif format == "alpaca":
-                data = self._export_as_alpaca(raw_msgs)
-            elif format == "sharegpt":
-                data = self._export_as_sharegpt(raw_msgs)
-            else:
-                return False, f"不支持的导出格式：{format}", {}
+            # 根据格式导出（序列化为 CPU 密集型操作，放入线程池避免阻塞事件循环）
+            data = await self._spawn_blocking_in(export_executor, exporter, raw_msgs)
 
             return True, data, stats
 
@@ -2890,92 +3333,142 @@ class MemoryManager:
             logger.error(f"Engram：导出全部用户消息失败：{e}")
             return False, f"导出失败：{e}", {}
 
+    def _get_exporter(self, format):
+        """按导出格式返回对应的导出函数，不支持的格式返回 None"""
+        return {
+            "jsonl": self._export_as_jsonl,
+            "json": self._export_as_json,
+            "txt": self._export_as_txt,
+            "alpaca": self._export_as_alpaca,
+            "sharegpt": self._export_as_sharegpt,
+        }.get(format)
+
+    @staticmethod
+    def _write_json_array(buf, items):
+        """
+        逐元素写入 JSON 数组（UTF-8 字节缓冲），输出与 json.dumps(items, indent=2) 一致
+
+        JSON 字符串内的换行均已转义，因此可直接对单个元素的输出整体缩进。
+        """
+        first = True
+        for item in items:
+            buf.write(b"[\n  " if first else b",\n  ")
+            buf.write(json_dumps_bytes(item, indent=True).replace(b"\n", b"\n  "))
+            first = False
+        buf.write(b"[]" if first else b"\n]")
+
+    @classmethod
+    def _export_time_formatter(cls):
+        """
+        返回带单项缓存的导出时间格式化函数
+
+        导出按时间升序遍历，一问一答常落在同一时间戳上，命中时省去一次 strftime。
+        """
+        last = [None, ""]
+
+        def _format(timestamp):
+            if timestamp != last[0]:
+                last[0] = timestamp
+                last[1] = cls._ensure_datetime(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+            return last[1]
+
+        return _format
+
+    def _iter_valid_messages(self, raw_msgs):
+        """过滤无效内容的导出行生成器，所有导出格式共用同一套过滤"""
+        is_valid = self._is_valid_message_content
+        return (msg for msg in raw_msgs if is_valid(msg["content"]))
+
+    def _iter_export_messages(self, raw_msgs):
+        """逐条生成可导出的消息字典"""
+        format_time = self._export_time_formatter()
+        map_role = _EXPORT_ROLE_MAP.get
+        for msg in self._iter_valid_messages(raw_msgs):
+            yield {
+                "role": map_role(msg["role"], "user"),
+                "content": msg["content"],
+                "timestamp": format_time(msg["timestamp"]),
+                "user_id": msg["user_id"],
+                "user_name": msg["user_name"]
+            }
+
     def _export_as_jsonl(self, raw_msgs):
         """导出为 JSONL 格式（每行一个 JSON 对象）"""
-        lines = []
-        for msg in raw_msgs:
-            if not self._is_valid_message_content(msg.content):
-                continue
-            ts = self._ensure_datetime(msg.timestamp)
-            obj = {
-                "role": "assistant" if msg.role == "assistant" else "user",
-                "content": msg.content,
-                "timestamp": ts.strftime("%Y-%m-%d %H:%M:%S"),
-                "user_id": msg.user_id,
-                "user_name": msg.user_name
-            }
-            lines.append(json.dumps(obj, ensure_ascii=False))
-        return "\n".join(lines)
+        # orjson 直接产出 UTF-8 字节，逐行写入字节缓冲，最后统一解码一次
+        buf = io.BytesIO()
+        write = buf.write
+        first = True
+        for obj in self._iter_export_messages(raw_msgs):
+            if not first:
+                write(b"\n")
+            write(json_dumps_bytes(obj))
+            first = False
+        return buf.getvalue().decode("utf-8")
 
     def _export_as_json(self, raw_msgs):
         """导出为 JSON 数组格式"""
-        messages = []
-        for msg in raw_msgs:
-            if not self._is_valid_message_content(msg.content):
-                continue
-            ts = self._ensure_datetime(msg.timestamp)
-            messages.append({
-                "role": "assistant" if msg.role == "assistant" else "user",
-                "content": msg.content,
-                "timestamp": ts.strftime("%Y-%m-%d %H:%M:%S"),
-                "user_id": msg.user_id,
-                "user_name": msg.user_name
-            })
-        return json.dumps(messages, ensure_ascii=False, indent=2)
+        buf = io.BytesIO()
+        self._write_json_array(buf, self._iter_export_messages(raw_msgs))
+        return buf.getvalue().decode("utf-8")
 
     def _export_as_txt(self, raw_msgs):
         """导出为纯文本格式"""
-        lines = []
-        for msg in raw_msgs:
-            if not self._is_valid_message_content(msg.content):
-                continue
-            ts = self._ensure_datetime(msg.timestamp)
-            role_name = "助手" if msg.role == "assistant" else (msg.user_name or "用户")
-            time_str = ts.strftime("%Y-%m-%d %H:%M:%S")
-            lines.append(f"[{time_str}] {role_name}: {msg.content}")
-        return "\n".join(lines)
-
-    def _export_as_alpaca(self, raw_msgs):
-        """导出为 Alpaca 格式（用于微调）"""
-        conversations = []
+        buf = io.StringIO()
+        write = buf.write
+        format_time = self._export_time_formatter()
+        first = True
+        for msg in self._iter_valid_messages(raw_msgs):
+            content = msg["content"]
+            role_name = "助手" if msg["role"] == "assistant" else (msg["user_name"] or "用户")
+            if not first:
+                write("\n")
+            time_str = format_time(msg["timestamp"])
+            write(f"[{time_str}] {role_name}: {content}")
+            first = False
+        return buf.getvalue()
+
+    def _iter_alpaca_pairs(self, raw_msgs):
+        """逐个生成 Alpaca 问答对"""
         current_instruction = None
 
-        for msg in raw_msgs:
-            if not self._is_valid_message_content(msg.content):
-                continue
-
-            if msg.role == "user":
-                current_instruction = msg.content
-            elif msg.role == "assistant" and current_instruction:
-                conversations.append({
+        for msg in self._iter_valid_messages(raw_msgs):
+            content = msg["content"]
+            role = msg["role"]
+            if role == "user":
+                current_instruction = content
+            elif role == "assistant" and current_instruction:
+                yield {
                     "instruction": current_instruction,
                     "input": "",
-                    "output": msg.content
-                })
+                    "output": content
+                }
                 current_instruction = None
 
-        return json.dumps(conversations, ensure_ascii=False, indent=2)
+    def _export_as_alpaca(self, raw_msgs):
+        """导出为 Alpaca 格式（用于微调）"""
+        buf = io.BytesIO()
+        self._write_json_array(buf, self._iter_alpaca_pairs(raw_msgs))
+        return buf.getvalue().decode("utf-8")
 
-    def _export_as_sharegpt(self, raw_msgs):
-        """导出为 ShareGPT 格式（用于微调）"""
-        conversations = []
+    def _iter_sharegpt_conversations(self, raw_msgs):
+        """逐个生成 ShareGPT 对话"""
+        map_role = _SHAREGPT_ROLE_MAP.get
         current_conversation = []
 
-        for msg in raw_msgs:
-            if not self._is_valid_message_content(msg.content):
-                continue
-
-            role = "gpt" if msg.role == "assistant" else "human"
+        for msg in self._iter_valid_messages(raw_msgs):
+            role = map_role(msg["role"], "human")
             current_conversation.append({
                 "from": role,
-                "value": msg.content
+                "value": msg["content"]
             })
 
             # 每个对话轮次（一问一答）作为一个完整对话
-            if msg.role == "assistant" and len(current_conversation) >= 2:
-                conversations.append({
-                    "conversations": current_conversation.copy()
-                })
+            if role == "gpt" and len(current_conversation) >= 2:
+                yield {"conversations": current_conversation}
                 current_conversation = []
 
-        return json.dumps(conversations, ensure_ascii=False, indent=2)
+    def _export_as_sharegpt(self, raw_msgs):
+        """导出为 ShareGPT 格式（用于微调）"""
+        buf = io.BytesIO()
+        self._write_json_array(buf, self._iter_sharegpt_conversations(raw_msgs))
+        return buf.getvalue().decode("utf-8")
@@ -5,15 +5,48 @@
 """
 
 import os
+import copy
 import json
 import asyncio
+import functools
+import itertools
+import time
 import datetime
+from collections import OrderedDict
 from datetime import date
 from typing import Any, Dict, List
 
 from astrbot.api import logger
 
 from ..services.profile_guardian import ProfileGuardian
+from ..services.provider_resolver import ProviderResolver
+from ..utils import (
+    extract_json_text,
+    json_dumps,
+    read_json_file,
+    read_json_file_async,
+    request_json_completion,
+    write_json_file,
+    write_json_file_async,
+)
+
+
+# LLM 热路径画像读缓存：TTL（秒）与最大用户数
+_PROFILE_CACHE_TTL = 60.0
+_PROFILE_CACHE_MAX = 512
+
+# 列表型画像字段：写入/读取时统一规范为 list，读路径无需再做类型判断
+_PROFILE_LIST_FIELDS = (
+    ("attributes", "personality_tags"),
+    ("attributes", "hobbies"),
+    ("attributes", "skills"),
+    ("dev_metadata", "tech_stack"),
+    ("preferences", "favorite_foods"),
+    ("preferences", "favorite_items"),
+    ("preferences", "favorite_activities"),
+    ("preferences", "likes"),
+    ("preferences", "dislikes"),
+)
 
 
 class ProfileManager:
@@ -36,6 +69,14 @@ class ProfileManager:
         self._profile_preference_ttl_days = int(self.config.get("profile_preference_ttl_days", 90) or 90)
 
         self._guardian = ProfileGuardian(config=config)
+        self._provider_resolver = ProviderResolver(context)
+        self._loop = None
+
+        # {user_id: (cached_at, profile)}，合并更新写穿透，其余写入路径失效
+        self._profile_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._profile_locks: Dict[str, asyncio.Lock] = {}
+        # {user_id: (profile, prompt_text)}，与缓存中的画像对象绑定，画像替换即失效
+        self._profile_prompt_cache: Dict[str, tuple] = {}
 
     def _build_default_profile(self, user_id: str) -> Dict[str, Any]:
         profile = {
@@ -90,90 +131,178 @@ class ProfileManager:
 
         return profile
 
+    @staticmethod
+    def _normalize_list_fields(profile: Dict[str, Any]) -> Dict[str, Any]:
+        """将列表型字段规范为 list（None/空串 -> []，标量 -> [标量]）"""
+        for section_key, field in _PROFILE_LIST_FIELDS:
+            section = profile.get(section_key)
+            if not isinstance(section, dict) or field not in section:
+                continue
+            value = section[field]
+            if isinstance(value, list):
+                continue
+            if value in (None, ""):
+                section[field] = []
+            elif isinstance(value, (tuple, set)):
+                section[field] = list(value)
+            else:
+                section[field] = [value]
+        return profile
+
     def _get_profile_path(self, user_id):
         return os.path.join(self.profiles_dir, f"{user_id}.json")
 
     def _get_profile_history_path(self, user_id):
         return os.path.join(self.history_dir, f"{user_id}.json")
 
-    async def get_user_profile(self, user_id):
-        loop = asyncio.get_event_loop()
+    def _complete_loaded_profile(self, user_id, loaded):
+        """为磁盘读取结果补齐默认顶层字段，非法内容回退为默认画像"""
+        default_profile = self._build_default_profile(user_id)
+        if not isinstance(loaded, dict):
+            return default_profile
+
+        for top_key, default_val in default_profile.items():
+            if top_key not in loaded:
+                loaded[top_key] = default_val
+
+        return self._normalize_list_fields(loaded)
+
+    async def _load_profile_async(self, user_id):
+        """异步读取画像（aiofiles 可用时不占用共享线程池）"""
         path = self._get_profile_path(user_id)
+        if not os.path.exists(path):
+            return self._build_default_profile(user_id)
 
-        def _read():
-            default_profile = self._build_default_profile(user_id)
+        try:
+            loaded = await read_json_file_async(path, self.executor)
+        except Exception as e:
+            logger.debug(f"Engram 画像管理器：读取画像失败（{path}），已回退为空画像：{e}")
+            loaded = None
+        return self._complete_loaded_profile(user_id, loaded)
+
+    def _get_cached_profile(self, user_id):
+        """读取未过期的缓存画像（调用方不得修改返回对象）"""
+        entry = self._profile_cache.get(user_id)
+        if entry and time.monotonic() - entry[0] < _PROFILE_CACHE_TTL:
+            self._profile_cache.move_to_end(user_id)
+            return entry[1]
+        return None
+
+    def _put_cached_profile(self, user_id, profile):
+        """写入画像缓存（写穿透），超出容量时淘汰最久未用的用户"""
+        self._profile_cache[user_id] = (time.monotonic(), profile)
+        self._profile_cache.move_to_end(user_id)
+        if len(self._profile_cache) > _PROFILE_CACHE_MAX:
+            evicted_id, _ = self._profile_cache.popitem(last=False)
+            self._profile_prompt_cache.pop(evicted_id, None)
+
+    def _get_loop(self):
+        """获取并缓存当前事件循环，省去每次调度线程池时的循环查找"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            loop = self._loop = asyncio.get_running_loop()
+        return loop
+
+    def _get_profile_lock(self, user_id) -> asyncio.Lock:
+        lock = self._profile_locks.get(user_id)
+        if lock is None:
+            lock = self._profile_locks[user_id] = asyncio.Lock()
+        return lock
 
-            if not os.path.exists(path):
-                return default_profile
+    async def get_user_profile(self, user_id):
+        """获取画像副本（调用方可自由修改）"""
+        return copy.deepcopy(await self.get_user_profile_cached(user_id))
 
-            try:
-                with open(path, 'r', encoding='utf-8') as f:
-                    loaded = json.load(f)
-            except Exception as e:
-                logger.debug(f"Engram 画像管理器：读取画像失败（{path}），已回退为空画像：{e}")
-                return default_profile
+    async def get_user_profile_cached(self, user_id):
+        """带 LRU + TTL 的画像读取（返回共享对象，仅供只读场景，如 LLM 注入）"""
+        profile = self._get_cached_profile(user_id)
+        if profile is not None:
+            return profile
 
-            if not isinstance(loaded, dict):
-                return default_profile
+        # 未命中时在每用户锁内读盘回填，避免写入方失效缓存后又被本次读到的旧画像覆盖
+        async with self._get_profile_lock(user_id):
+            profile = self._get_cached_profile(user_id)
+            if profile is None:
+                profile = await self._load_profile_async(user_id)
+                self._put_cached_profile(user_id, profile)
+        return profile
 
-            for top_key, default_val in default_profile.items():
-                if top_key not in loaded:
-                    loaded[top_key] = default_val
+    def invalidate_profile_cache(self, user_id=None):
+        """失效画像读缓存（user_id 为空时清空全部）"""
+        if user_id is None:
+            self._profile_cache.clear()
+            self._profile_prompt_cache.clear()
+        else:
+            self._profile_cache.pop(user_id, None)
+            self._profile_prompt_cache.pop(user_id, None)
+
+    def _get_profile_prompt_text(self, user_id, profile):
+        """获取画像的缩进 JSON 文本（用于提示词），同一画像对象只序列化一次"""
+        entry = self._profile_prompt_cache.get(user_id)
+        if entry is not None and entry[0] is profile:
+            return entry[1]
+        text = json_dumps(profile, indent=True)
+        self._profile_prompt_cache[user_id] = (profile, text)
+        return text
+
+    @staticmethod
+    def _merge_profile_value(old_value, new_value):
+        if isinstance(new_value, dict):
+            base = old_value if isinstance(old_value, dict) else {}
+            merged = dict(base)
+            for k, v in new_value.items():
+                merged[k] = ProfileManager._merge_profile_value(merged.get(k), v)
+            return merged
+
+        if isinstance(new_value, list):
+            base = old_value if isinstance(old_value, list) else ([] if old_value in (None, "") else [old_value])
+            # 常见的纯字符串标签列表：dict.fromkeys 单趟保序去重，无需逐项构造标记
+            if all(type(item) is str for item in base) and all(type(item) is str for item in new_value):
+                merged = dict.fromkeys(base)
+                merged.update(dict.fromkeys(new_value))
+                return list(merged)
+
+            merged = []
+            seen = set()
+            for item in itertools.chain(base, new_value):
+                marker = json.dumps(item, ensure_ascii=False, sort_keys=True) if isinstance(item, (dict, list)) else repr(item)
+                if marker in seen:
+                    continue
+                seen.add(marker)
+                merged.append(item)
+            return merged
 
-            return loaded
+        return new_value
 
-        return await loop.run_in_executor(self.executor, _read)
+    def _build_updated_profile(self, user_id, loaded, update_data):
+        """以默认画像 + 已有画像为基底合并更新数据（不修改传入对象）"""
+        profile = self._build_default_profile(user_id)
+        if isinstance(loaded, dict):
+            profile = self._merge_profile_value(profile, loaded)
+        return self._normalize_list_fields(self._merge_profile_value(profile, update_data))
 
     async def update_user_profile(self, user_id, update_data):
         if not update_data:
             return
 
-        loop = asyncio.get_event_loop()
         path = self._get_profile_path(user_id)
-
-        def _merge_value(old_value, new_value):
-            if isinstance(new_value, dict):
-                base = old_value if isinstance(old_value, dict) else {}
-                merged = dict(base)
-                for k, v in new_value.items():
-                    merged[k] = _merge_value(merged.get(k), v)
-                return merged
-
-            if isinstance(new_value, list):
-                base = old_value if isinstance(old_value, list) else ([] if old_value in (None, "") else [old_value])
-                merged = []
-                seen = set()
-                for item in list(base) + list(new_value):
-                    marker = json.dumps(item, ensure_ascii=False, sort_keys=True) if isinstance(item, (dict, list)) else repr(item)
-                    if marker in seen:
-                        continue
-                    seen.add(marker)
-                    merged.append(item)
-                return merged
-
-            return new_value
-
-        def _update():
-            profile = self._build_default_profile(user_id)
-            if os.path.exists(path):
+        async with self._get_profile_lock(user_id):
+            loaded = self._get_cached_profile(user_id)
+            if loaded is None and os.path.exists(path):
                 try:
-                    with open(path, 'r', encoding='utf-8') as f:
-                        loaded = json.load(f)
-                        if isinstance(loaded, dict):
-                            profile = _merge_value(profile, loaded)
+                    loaded = await read_json_file_async(path, self.executor)
                 except Exception as e:
                     logger.debug(f"Engram 画像管理器：加载已有画像失败（{path}），继续使用默认画像：{e}")
 
-            profile = _merge_value(profile, update_data)
-
-            with open(path, 'w', encoding='utf-8') as f:
-                json.dump(profile, f, ensure_ascii=False, indent=4)
+            profile = self._build_updated_profile(user_id, loaded, update_data)
+            # 合并结果与已有画像一致时跳过写盘（常见于重复的标签/同步信息）
+            if profile != loaded:
+                await write_json_file_async(path, profile, self.executor)
+            self._put_cached_profile(user_id, profile)
             return profile
 
-        return await loop.run_in_executor(self.executor, _update)
-
     async def remove_profile_list_item(self, user_id: str, field_path: str, value: str) -> tuple:
-        loop = asyncio.get_event_loop()
+        loop = self._get_loop()
         path = self._get_profile_path(user_id)
 
         field_path = str(field_path or "").strip()
@@ -186,10 +315,9 @@ class ProfileManager:
             profile = self._build_default_profile(user_id)
             if os.path.exists(path):
                 try:
-                    with open(path, 'r', encoding='utf-8') as f:
-                        loaded = json.load(f)
-                        if isinstance(loaded, dict):
-                            profile.update(loaded)
+                    loaded = read_json_file(path)
+                    if isinstance(loaded, dict):
+                        profile.update(loaded)
                 except Exception as e:
                     logger.debug(f"Engram 画像管理器：加载已有画像失败（{path}），继续使用默认画像：{e}")
 
@@ -227,25 +355,25 @@ class ProfileManager:
                 meta["fields"] = fields
                 profile["_meta"] = meta
 
-            with open(path, 'w', encoding='utf-8') as f:
-                json.dump(profile, f, ensure_ascii=False, indent=4)
+            write_json_file(path, profile)
 
             return True, "删除成功"
 
-        return await loop.run_in_executor(self.executor, _remove)
+        # 与 update_user_profile 共用每用户锁，避免其缓存的旧画像覆盖本次删除
+        async with self._get_profile_lock(user_id):
+            result = await loop.run_in_executor(self.executor, _remove)
+            self.invalidate_profile_cache(user_id)
+        return result
 
     async def clear_user_profile(self, user_id):
-        loop = asyncio.get_event_loop()
-        path = self._get_profile_path(user_id)
-        history_path = self._get_profile_history_path(user_id)
-
-        def _delete():
-            if os.path.exists(path):
-                os.remove(path)
-            if os.path.exists(history_path):
-                os.remove(history_path)
-
-        await loop.run_in_executor(self.executor, _delete)
+        # 删除本地文件只是一次系统调用，直接执行比调度线程池更快
+        async with self._get_profile_lock(user_id):
+            for path in (self._get_profile_path(user_id), self._get_profile_history_path(user_id)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self.invalidate_profile_cache(user_id)
 
     def _load_profile_history(self, user_id: str) -> List[Dict[str, Any]]:
         history_path = self._get_profile_history_path(user_id)
@@ -253,10 +381,9 @@ class ProfileManager:
             return []
 
         try:
-            with open(history_path, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-                if isinstance(history, list):
-                    return history
+            history = read_json_file(history_path)
+            if isinstance(history, list):
+                return history
         except Exception as e:
             logger.warning(f"Engram：读取画像历史失败（{history_path}）：{e}")
 
@@ -267,8 +394,7 @@ class ProfileManager:
         limit = max(1, int(self._profile_history_limit))
         trimmed = history[-limit:]
 
-        with open(history_path, 'w', encoding='utf-8') as f:
-            json.dump(trimmed, f, ensure_ascii=False, indent=2)
+        write_json_file(history_path, trimmed)
 
     def _snapshot_profile(self, user_id: str, profile: Dict[str, Any]):
         if not isinstance(profile, dict):
@@ -282,7 +408,7 @@ class ProfileManager:
         self._save_profile_history(user_id, history)
 
     async def rollback_user_profile(self, user_id: str, steps: int = 1) -> Dict[str, Any]:
-        loop = asyncio.get_event_loop()
+        loop = self._get_loop()
 
         def _rollback():
             try:
@@ -311,8 +437,7 @@ class ProfileManager:
                 }
 
             path = self._get_profile_path(user_id)
-            with open(path, 'w', encoding='utf-8') as f:
-                json.dump(target, f, ensure_ascii=False, indent=4)
+            write_json_file(path, target)
 
             remain_history = history[:-steps_int]
             self._save_profile_history(user_id, remain_history)
@@ -324,7 +449,10 @@ class ProfileManager:
                 "rolled_back_steps": steps_int,
             }
 
-        return await loop.run_in_executor(self.executor, _rollback)
+        async with self._get_profile_lock(user_id):
+            result = await loop.run_in_executor(self.executor, _rollback)
+            self.invalidate_profile_cache(user_id)
+        return result
 
     def _merge_profile_meta(self, old_meta: Dict[str, Any], accepted_updates: List[str], evidence_ref: str) -> Dict[str, Any]:
         meta = old_meta if isinstance(old_meta, dict) else {}
@@ -449,13 +577,13 @@ class ProfileManager:
         return entries[:top_n_int]
 
     async def update_persona_daily(self, user_id, start_time=None, end_time=None):
-        loop = asyncio.get_event_loop()
+        loop = self._get_loop()
 
         if start_time is not None:
             if end_time is not None:
                 memories = await loop.run_in_executor(
                     self.executor,
-                    lambda: self.db.get_memories_in_range(user_id, start_time, end_time)
+                    functools.partial(self.db.get_memories_in_range, user_id, start_time, end_time)
                 )
             else:
                 memories = await loop.run_in_executor(
@@ -471,13 +599,15 @@ class ProfileManager:
         if not memories:
             return
 
-        current_persona = await self.get_user_profile(user_id)
+        cached_persona = await self.get_user_profile_cached(user_id)
+        persona_text = self._get_profile_prompt_text(user_id, cached_persona)
+        current_persona = copy.deepcopy(cached_persona)
         memory_texts = "\n".join([f"- {m.summary}" for m in memories])
 
         custom_prompt = self.config.get("persona_update_prompt", "{{current_persona}}\n{{memory_texts}}")
         prompt = (
             custom_prompt
-            .replace("{{current_persona}}", json.dumps(current_persona, ensure_ascii=False, indent=2))
+            .replace("{{current_persona}}", persona_text)
             .replace("{{memory_texts}}", memory_texts)
         )
 
@@ -486,26 +616,16 @@ class ProfileManager:
             logger.debug(f"Engram：用于画像更新的记忆文本：\n{memory_texts}")
 
         try:
-            persona_model = self.config.get("persona_model", "").strip()
-            if persona_model:
-                provider = self.context.get_provider_by_id(persona_model)
-                if not provider:
-                    provider = self.context.get_using_provider()
-            else:
-                provider = self.context.get_using_provider()
+            provider = self._provider_resolver.resolve(self.config.get("persona_model", ""))
 
             if not provider:
                 return
 
-            resp = await provider.text_chat(prompt=prompt)
-            content = resp.completion_text
-
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "{" in content:
-                content = content[content.find("{"):content.rfind("}") + 1]
+            content = await request_json_completion(
+                provider, prompt, stream=bool(self.config.get("enable_persona_stream", False))
+            )
 
-            proposal = json.loads(content)
+            proposal = json.loads(extract_json_text(content))
 
             validated_persona, conflicts, decisions = self._guardian.validate_update(
                 current_persona,
@@ -522,16 +642,19 @@ class ProfileManager:
                     evidence_ref,
                 )
 
-            validated_persona = self._decay_stale_preferences(validated_persona, now)
+            validated_persona = self._normalize_list_fields(
+                self._decay_stale_preferences(validated_persona, now)
+            )
 
             path = self._get_profile_path(user_id)
 
             def _write():
                 self._snapshot_profile(user_id, current_persona)
-                with open(path, 'w', encoding='utf-8') as f:
-                    json.dump(validated_persona, f, ensure_ascii=False, indent=4)
+                write_json_file(path, validated_persona)
 
-            await loop.run_in_executor(self.executor, _write)
+            async with self._get_profile_lock(user_id):
+                await loop.run_in_executor(self.executor, _write)
+                self.invalidate_profile_cache(user_id)
 
             if conflicts:
                 logger.warning(f"Engram：user_id={user_id} 本次画像更新存在冲突项，已转入 pending")
@@ -540,7 +663,7 @@ class ProfileManager:
             logger.error(f"Engram：每日画像更新异常：{e}")
 
     async def update_interaction_stats(self, user_id):
-        loop = asyncio.get_event_loop()
+        loop = self._get_loop()
         profile = await self.get_user_profile(user_id)
         social = profile.get("social_graph", {})
         stats = social.get("interaction_stats", {})
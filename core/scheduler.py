@@ -26,6 +26,7 @@ class MemoryScheduler:
         self.config = config
         self._is_shutdown = False
         self._tasks = []  # 追踪后台任务
+        self._last_daily_persona_date = None  # 每日画像更新已执行的日期（防止同一天重复执行）
         self._task_metrics = {}  # 任务可观测指标：耗时/成功率/失败率/跳过原因
 
     def _push_activity(self, title: str, *, category: str = "task", source: str = "private", meta: dict | None = None):
@@ -211,6 +212,17 @@ class MemoryScheduler:
                 logger.info(f"Engram：每日画像更新已调度，距离执行约 {sleep_seconds/3600:.1f} 小时")
                 await asyncio.sleep(sleep_seconds)
 
+                # 睡眠可能因时钟漂移提前醒来：补足剩余时间，确保已跨过 00:00
+                remaining = (tomorrow - datetime.datetime.now()).total_seconds()
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+
+                # 同一天只执行一次，避免提前唤醒后在同一个 00:00 重复调度
+                run_date = tomorrow.date()
+                if self._last_daily_persona_date == run_date:
+                    self._observe_skip(task_name, "already_ran_today")
+                    continue
+
                 # 关闭检查：在执行更新前检查状态
                 if self._is_shutdown or getattr(self.logic, "_is_shutdown", False):
                     self._observe_skip(task_name, "shutdown_signal")
@@ -225,6 +237,7 @@ class MemoryScheduler:
                     break
 
                 # 执行画像更新 - 带并发控制和延迟
+                self._last_daily_persona_date = run_date
                 started_at = time.perf_counter()
                 try:
                     await self._execute_daily_persona_update()
@@ -283,7 +296,7 @@ class MemoryScheduler:
                     )
                     today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
 
-                    loop = asyncio.get_event_loop()
+                    loop = asyncio.get_running_loop()
                     # 查询昨天一整天的记忆（从昨天00:00到今天00:00）
                     memories = await loop.run_in_executor(
                         self.logic.executor,
@@ -591,7 +604,7 @@ class MemoryScheduler:
         delay = int(self.config.get("monthly_folding_delay", 1))
         jitter = int(self.config.get("monthly_folding_jitter", 0))
 
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
         try:
             user_ids = await loop.run_in_executor(self.logic.executor, self.logic.db.get_all_user_ids)
         except Exception as e:
@@ -650,7 +663,7 @@ class MemoryScheduler:
         delay = int(self.config.get("yearly_folding_delay", 1))
         jitter = int(self.config.get("yearly_folding_jitter", 0))
 
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
         try:
             user_ids = await loop.run_in_executor(self.logic.executor, self.logic.db.get_all_user_ids)
         except Exception as e:
@@ -744,11 +757,21 @@ class MemoryScheduler:
                     logger.error(f"Engram 记忆维护调度异常：{e}")
                 await asyncio.sleep(60)
 
+    async def _vacuum_deleted_vectors(self) -> bool:
+        """回收已删除记忆的墓碑向量（与衰减/修剪开关无关，始终执行）"""
+        try:
+            await self.logic.vacuum_deleted_vectors()
+            logger.debug("Engram：已回收已删除记忆的墓碑向量")
+            return True
+        except Exception as e:
+            logger.warning(f"Engram：回收墓碑向量失败：{e}")
+            return False
+
     async def _execute_memory_maintenance(self):
         """执行衰减 + 修剪"""
         task_name = "execute_memory_maintenance"
         started_at = time.perf_counter()
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
 
         enable_decay = self.config.get("enable_memory_decay", True)
         decay_rate = self.config.get("memory_decay_rate", 1)
@@ -758,6 +781,7 @@ class MemoryScheduler:
 
         if (not enable_decay or decay_rate <= 0) and not enable_prune:
             self._observe_skip(task_name, "decay_and_prune_disabled")
+            await self._vacuum_deleted_vectors()
             return
 
         # 1. Decay：全局衰减
@@ -811,6 +835,10 @@ class MemoryScheduler:
         else:
             self._observe_skip(task_name, "prune_disabled")
 
+        # 3. Vacuum：批量物理删除已删除记忆的墓碑向量
+        if not await self._vacuum_deleted_vectors():
+            had_error = True
+
         if had_error:
             self._observe_run(task_name, started_at, False, RuntimeError("memory_maintenance_partial_failure"))
             self._push_activity(
@@ -44,6 +44,8 @@ class MemoryIndex(BaseModel):
         indexes = (
             # 复合索引：用户+时间查询
             (('user_id', 'created_at'), False),
+            # 复合索引：按用户 + 短 ID 前缀查找记忆
+            (('user_id', 'index_id'), False),
         )
 
 
@@ -128,15 +130,20 @@ class DatabaseManager:
         except Exception as e:
             logger.warning("Engram：DB 初始化路径解析失败：%s", e)
 
-        self.db = SqliteExtDatabase(
-            self.db_path,
-            pragmas={
+        pragmas = {
+            "cache_size": -64 * 1024,
+            "synchronous": 1,
+            "foreign_keys": 1,
+            "temp_store": 2,
+        }
+        # 内存库不支持 WAL/mmap，仅文件库启用
+        if self.db_path != ":memory:" and not str(self.db_path).startswith("file::memory:"):
+            pragmas.update({
                 "journal_mode": "wal",
-                "cache_size": -64 * 1024,
-                "synchronous": 1,
-                "foreign_keys": 1
-            }
-        )
+                "wal_autocheckpoint": 1000,
+                "mmap_size": 256 * 1024 * 1024,
+            })
+        self.db = SqliteExtDatabase(self.db_path, pragmas=pragmas)
 
         # 为每个 DatabaseManager 生成独立模型，避免多 DB 互相覆盖
         self.RawMemory = self._bind_model(RawMemory, self.db)
@@ -313,6 +320,16 @@ class DatabaseManager:
         with self.db.connection_context():
             return self.RawMemory.create(**kwargs)
 
+    def save_raw_memories(self, rows):
+        """批量写入原始消息（单事务提交）"""
+        if not rows:
+            return 0
+        with self.db.connection_context():
+            with self.db.atomic():
+                for batch in chunked(rows, 100):
+                    self.RawMemory.insert_many(batch).execute()
+        return len(rows)
+
     def get_unarchived_raw(self, session_id, limit=None):
         with self.db.connection_context():
             query = self.RawMemory.select().where((self.RawMemory.session_id == session_id) & (self.RawMemory.is_archived == False)).order_by(self.RawMemory.timestamp.desc())
@@ -320,9 +337,49 @@ class DatabaseManager:
                 query = query.limit(limit)
             return list(query)
 
+    def get_unarchived_raw_filtered(self, session_id, command_prefixes=(), before=None):
+        """
+        获取未归档消息，并在 SQL 中预先剔除明显无需总结的消息。
+
+        仅下推廉价且保守的规则（指令前缀、带下划线且无空格的内部指令），
+        中文字符数等规则仍由调用方在 Python 中判定。
+        传入 before（datetime）时，早于该时间的消息同样只返回 uuid，
+        不再加载正文（用于超出回溯天数、直接归档的消息）。
+
+        Returns:
+            tuple: (保留的 RawMemory 列表（时间倒序）, 被剔除消息的 uuid 列表)
+        """
+        RawMemory = self.RawMemory
+        content = RawMemory.content
+        skip_expr = (fn.instr(content, "_") > 0) & (fn.instr(content, " ") == 0)
+        for prefix in command_prefixes or ():
+            prefix = str(prefix)
+            if prefix:
+                skip_expr = skip_expr | (fn.substr(content, 1, len(prefix)) == prefix)
+        if before is not None:
+            # 仅对文本格式的时间戳下推比较，历史遗留的数值时间戳交由调用方判定
+            timestamp = RawMemory.timestamp
+            skip_expr = skip_expr | ((fn.typeof(timestamp) == "text") & (timestamp < before))
+
+        base = (RawMemory.session_id == session_id) & (RawMemory.is_archived == False)
+        with self.db.connection_context():
+            kept = list(
+                RawMemory.select()
+                .where(base & ~skip_expr)
+                .order_by(RawMemory.timestamp.desc())
+            )
+            skipped = [
+                row[0]
+                for row in RawMemory.select(RawMemory.uuid).where(base & skip_expr).tuples()
+            ]
+        return kept, skipped
+
     def mark_as_archived(self, uuids):
+        """标记原文为已归档（分批 IN 查询避免超出 SQLite 变量上限，单事务提交）"""
         with self.db.connection_context():
-            self.RawMemory.update(is_archived=True).where(self.RawMemory.uuid << uuids).execute()
+            with self.db.atomic():
+                for batch in chunked(list(uuids or []), 500):
+                    self.RawMemory.update(is_archived=True).where(self.RawMemory.uuid << batch).execute()
 
     def get_memories_by_uuids(self, uuids):
         with self.db.connection_context():
@@ -352,6 +409,18 @@ class DatabaseManager:
         with self.db.connection_context():
             return self.MemoryIndex.create(**kwargs)
 
+    def commit_summaries(self, index_rows, archive_uuids):
+        """单事务提交总结：写入记忆索引并标记对应原文为已归档"""
+        if not index_rows and not archive_uuids:
+            return 0
+        with self.db.connection_context():
+            with self.db.atomic():
+                for batch in chunked(index_rows or [], 100):
+                    self.MemoryIndex.insert_many(batch).execute()
+                for batch in chunked(archive_uuids or [], 500):
+                    self.RawMemory.update(is_archived=True).where(self.RawMemory.uuid << batch).execute()
+        return len(index_rows or [])
+
     def get_last_memory_index(self, user_id):
         with self.db.connection_context():
             return self.MemoryIndex.select().where(self.MemoryIndex.user_id == user_id).order_by(self.MemoryIndex.created_at.desc()).first()
@@ -404,6 +473,20 @@ class DatabaseManager:
         with self.db.connection_context():
             return list(self.MemoryIndex.select().where(self.MemoryIndex.user_id == user_id).order_by(self.MemoryIndex.created_at.desc()).limit(limit))
 
+    def get_memory_by_sequence(self, user_id, sequence_num):
+        """按 mem_list 序号（最新的为 1）取单条记忆，LIMIT 1 OFFSET 直接定位"""
+        if sequence_num < 1:
+            return None
+        with self.db.connection_context():
+            return (
+                self.MemoryIndex.select()
+                .where(self.MemoryIndex.user_id == user_id)
+                .order_by(self.MemoryIndex.created_at.desc())
+                .offset(sequence_num - 1)
+                .limit(1)
+                .first()
+            )
+
     def _search_memory_indexes_by_keywords_like(
         self,
         user_id,
@@ -577,10 +660,23 @@ class DatabaseManager:
         with self.db.connection_context():
             self.MemoryIndex.delete().where(self.MemoryIndex.index_id == index_id).execute()
     
+    def remove_memory_index(self, index_id, raw_uuids=(), delete_raw=False):
+        """单事务删除记忆索引；关联原文按 delete_raw 删除，或恢复为未归档以便重新总结"""
+        with self.db.connection_context():
+            with self.db.atomic():
+                for batch in chunked(list(raw_uuids or []), 500):
+                    if delete_raw:
+                        self.RawMemory.delete().where(self.RawMemory.uuid << batch).execute()
+                    else:
+                        self.RawMemory.update(is_archived=False).where(self.RawMemory.uuid << batch).execute()
+                self.MemoryIndex.delete().where(self.MemoryIndex.index_id == index_id).execute()
+
     def delete_raw_memories_by_uuids(self, uuids):
-        """删除指定 UUID 的原始消息"""
+        """删除指定 UUID 的原始消息（分批 IN 查询，单事务提交）"""
         with self.db.connection_context():
-            self.RawMemory.delete().where(self.RawMemory.uuid << uuids).execute()
+            with self.db.atomic():
+                for batch in chunked(list(uuids or []), 500):
+                    self.RawMemory.delete().where(self.RawMemory.uuid << batch).execute()
     
     def clear_user_data(self, user_id):
         """清除用户的所有记忆数据 (原始消息和总结索引)"""
@@ -590,10 +686,20 @@ class DatabaseManager:
             # 删除总结索引
             self.MemoryIndex.delete().where(self.MemoryIndex.user_id == user_id).execute()
     
+    def _export_columns(self):
+        """导出仅需的列（配合 .dicts() 跳过模型实例化）"""
+        return (
+            self.RawMemory.role,
+            self.RawMemory.content,
+            self.RawMemory.timestamp,
+            self.RawMemory.user_id,
+            self.RawMemory.user_name,
+        )
+
     def get_all_raw_messages(self, user_id, start_date=None, end_date=None, limit=None):
-        """获取用户的所有原始消息（支持时间范围过滤）"""
+        """获取用户的所有原始消息（支持时间范围过滤），返回仅含导出列的字典列表"""
         with self.db.connection_context():
-            query = self.RawMemory.select().where(self.RawMemory.user_id == user_id)
+            query = self.RawMemory.select(*self._export_columns()).where(self.RawMemory.user_id == user_id)
             
             # 时间范围过滤
             if start_date:
@@ -607,7 +713,7 @@ class DatabaseManager:
             if limit:
                 query = query.limit(limit)
             
-            return list(query)
+            return list(query.dicts())
     
     def get_message_stats(self, user_id):
         """获取用户的消息统计信息"""
@@ -626,9 +732,9 @@ class DatabaseManager:
             }
     
     def get_all_users_messages(self, start_date=None, end_date=None, limit=None):
-        """获取所有用户的原始消息"""
+        """获取所有用户的原始消息，返回仅含导出列的字典列表"""
         with self.db.connection_context():
-            query = self.RawMemory.select()
+            query = self.RawMemory.select(*self._export_columns())
             
             if start_date:
                 query = query.where(self.RawMemory.timestamp >= start_date)
@@ -640,7 +746,7 @@ class DatabaseManager:
             if limit:
                 query = query.limit(limit)
             
-            return list(query)
+            return list(query.dicts())
 
     def get_all_user_ids(self):
         """获取所有出现过的用户ID"""
@@ -698,6 +804,19 @@ class DatabaseManager:
                 .first()
             )
 
+    def get_recent_delete_histories(self, scope_keys, limit=1):
+        """按删除时间倒序获取多个作用域下尚未撤销的删除历史"""
+        with self.db.connection_context():
+            return list(
+                self.DeleteHistory.select()
+                .where(
+                    (self.DeleteHistory.scope_key << list(scope_keys))
+                    & (self.DeleteHistory.is_restored == False)
+                )
+                .order_by(self.DeleteHistory.deleted_at.desc(), self.DeleteHistory.id.desc())
+                .limit(limit)
+            )
+
     def mark_delete_history_restored(self, record_id):
         with self.db.connection_context():
             return (
@@ -709,6 +828,25 @@ class DatabaseManager:
                 .execute()
             )
 
+    def restore_deleted_memories(self, index_rows, archive_uuids, history_ids):
+        """撤销删除：单事务恢复记忆索引与原文归档状态，并标记对应删除历史为已撤销"""
+        with self.db.connection_context():
+            with self.db.atomic():
+                for batch in chunked(index_rows or [], 100):
+                    self.MemoryIndex.insert_many(batch).execute()
+                for batch in chunked(archive_uuids or [], 500):
+                    self.RawMemory.update(is_archived=True).where(self.RawMemory.uuid << batch).execute()
+                if history_ids:
+                    (
+                        self.DeleteHistory.update(
+                            is_restored=True,
+                            restored_at=datetime.datetime.now(),
+                        )
+                        .where(self.DeleteHistory.id << list(history_ids))
+                        .execute()
+                    )
+        return len(index_rows or [])
+
     # ========== 向量补偿任务持久化 ==========
 
     def enqueue_pending_vector_jobs(self, rows):
@@ -781,16 +919,20 @@ class StableDatabaseInterface:
     # 覆盖当前插件主链路使用到的 DB 方法（启动阶段一次性自检）
     REQUIRED_METHODS = (
         "save_raw_memory",
+        "save_raw_memories",
         "get_unarchived_raw",
+        "get_unarchived_raw_filtered",
         "mark_as_archived",
         "get_memories_by_uuids",
         "save_memory_index",
+        "commit_summaries",
         "get_last_memory_index",
         "get_memory_index_by_id",
         "get_memory_indexes_by_ids",
         "get_prev_indices_by_ids",
         "get_raw_memories_map_by_uuid_lists",
         "get_memory_list",
+        "get_memory_by_sequence",
         "get_memories_since",
         "get_memories_in_range",
         "get_summaries_by_type",
@@ -798,6 +940,7 @@ class StableDatabaseInterface:
         "update_active_score",
         "get_cold_memory_ids",
         "delete_memory_index",
+        "remove_memory_index",
         "delete_raw_memories_by_uuids",
         "clear_user_data",
         "get_all_raw_messages",
@@ -808,6 +951,8 @@ class StableDatabaseInterface:
         "get_all_users_stats",
         "save_delete_history",
         "get_last_delete_history",
+        "get_recent_delete_histories",
+        "restore_deleted_memories",
         "mark_delete_history_restored",
         "enqueue_pending_vector_jobs",
         "get_pending_vector_jobs",
@@ -77,7 +77,10 @@ class ExportHandler:
         """处理统计命令"""
         user_id = event.get_sender_id()
 
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
+
+        # 统计前落库写缓冲，保证计入最近的消息
+        await self.logic.flush_pending_raw()
 
         # 获取当前用户统计
         user_stats = await loop.run_in_executor(
@@ -23,6 +23,32 @@ import json
 from astrbot.api import logger
 
 
+def _resolve_memory_selector(index: str, action: str, usage: str, max_seq: int = 50):
+    """
+    解析记忆选择器：数字且 ≤ max_seq 视为序号，否则视为记忆 ID
+
+    Args:
+        index: 用户输入的序号或ID
+        action: 操作名（用于提示文案，如"查看"/"删除"）
+        usage: ID 过短时的示例用法
+        max_seq: 序号上限
+
+    Returns:
+        tuple: ("seq", int) / ("id", str) / ("error", 提示文案)
+    """
+    if index.isdigit():
+        seq = int(index)
+        if seq <= 0:
+            return "error", "⚠️ 序号必须大于 0。"
+        if seq > max_seq:
+            return "error", f"⚠️ 序号超过 {max_seq}，请使用记忆 ID 进行{action}。"
+        return "seq", seq
+
+    if len(index) < 8:
+        return "error", f"⚠️ 记忆 ID 至少需要 8 位，例如：{usage}"
+    return "id", index
+
+
 class MemoryCommandHandler:
     """记忆命令处理器"""
     
@@ -62,25 +88,27 @@ class MemoryCommandHandler:
         else:
             limit = self.config.get("list_memory_count", 5)
         
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
         memories = await loop.run_in_executor(self.executor, self.db.get_memory_list, user_id, limit)
         
         if not memories:
             return "🧐 你目前还没有生成的长期记忆。"
         
-        result = [f"📜 最近的 {len(memories)} 条长期记忆：\n" + "—" * 15]
-        for i, m in enumerate(memories):
-            created_at = self.memory._ensure_datetime(m.created_at)
-            short_id = str(getattr(m, "index_id", "") or "")[:8] or "未知ID"
-            result.append(
-                f"{i+1}. 🆔 {short_id} | ⏰ {created_at.strftime('%m-%d %H:%M')}\n"
-                f"   📝 {m.summary}\n"
-            )
+        ensure_dt = self.memory._ensure_datetime
+        rows = "\n".join(
+            f"{i}. 🆔 {str(getattr(m, 'index_id', '') or '')[:8] or '未知ID'} | "
+            f"⏰ {ensure_dt(m.created_at).strftime('%m-%d %H:%M')}\n"
+            f"   📝 {m.summary}\n"
+            for i, m in enumerate(memories, 1)
+        )
 
-        result.append("\n💡 发送 /mem_view <序号或ID> 可查看某条记忆的完整对话原文。")
-        result.append("💡 发送 /mem_delete <ID> 可按记忆 ID 删除指定记忆。")
-        result.append("💡 发送 /mem_list <数量> 可自定义查询条数。")
-        return "\n".join(result)
+        return (
+            f"📜 最近的 {len(memories)} 条长期记忆：\n{'—' * 15}\n"
+            f"{rows}\n"
+            "\n💡 发送 /mem_view <序号或ID> 可查看某条记忆的完整对话原文。\n"
+            "💡 发送 /mem_delete <ID> 可按记忆 ID 删除指定记忆。\n"
+            "💡 发送 /mem_list <数量> 可自定义查询条数。"
+        )
     
     async def handle_mem_view(self, user_id: str, index: str) -> str:
         """
@@ -94,19 +122,15 @@ class MemoryCommandHandler:
             str: 格式化的命令结果
         """
         # 智能判断：数字且 ≤ 50 使用序号查看，否则使用 ID 查看
-        if index.isdigit():
-            seq = int(index)
-            if seq <= 0:
-                return "⚠️ 序号必须大于 0。"
-            if seq > 50:
-                return "⚠️ 序号超过 50，请使用记忆 ID 进行查看。"
+        kind, value = _resolve_memory_selector(index, "查看", "/mem_view bdd54504")
+        if kind == "error":
+            return value
 
+        if kind == "seq":
+            seq = value
             memory_index, raw_msgs = await self.memory.get_memory_detail(user_id, seq)
             display_label = f"序号 {seq}"
         else:
-            if len(index) < 8:
-                return "⚠️ 记忆 ID 至少需要 8 位，例如：/mem_view bdd54504"
-
             memory_index, raw_msgs = await self.memory.get_memory_detail_by_id(user_id, index)
             if not memory_index:
                 return f"❌ {raw_msgs}"
@@ -116,27 +140,27 @@ class MemoryCommandHandler:
         if not memory_index:
             return str(raw_msgs)
 
-        created_at = self.memory._ensure_datetime(memory_index.created_at)
-        result = [
-            f"📖 记忆详情 ({display_label})",
-            f"⏰ 时间：{created_at.strftime('%Y-%m-%d %H:%M')}",
-            f"📝 归档：{memory_index.summary}",
-            "————————————————",
+        ensure_dt = self.memory._ensure_datetime
+        created_at = ensure_dt(memory_index.created_at)
+        header = (
+            f"📖 记忆详情 ({display_label})\n"
+            f"⏰ 时间：{created_at.strftime('%Y-%m-%d %H:%M')}\n"
+            f"📝 归档：{memory_index.summary}\n"
+            "————————————————\n"
             "🎙️ 原始对话回溯："
-        ]
+        )
 
         if not raw_msgs:
-            result.append("(暂无关联的原始对话数据)")
-        else:
-            for m in raw_msgs:
-                if not self.memory._is_valid_message_content(m.content):
-                    continue
-                ts = self.memory._ensure_datetime(m.timestamp)
-                time_str = ts.strftime("%H:%M:%S")
-                role_name = "我" if m.role == "assistant" else (m.user_name or "你")
-                result.append(f"[{time_str}] {role_name}: {m.content}")
+            return f"{header}\n(暂无关联的原始对话数据)"
 
-        return "\n".join(result)
+        is_valid = self.memory._is_valid_message_content
+        lines = "".join(
+            f"\n[{ensure_dt(m.timestamp).strftime('%H:%M:%S')}] "
+            f"{'我' if m.role == 'assistant' else (m.user_name or '你')}: {m.content}"
+            for m in raw_msgs
+            if is_valid(m.content)
+        )
+        return f"{header}{lines}"
     
     async def handle_mem_search(self, user_id: str, query: str) -> str:
         """
@@ -178,13 +202,12 @@ class MemoryCommandHandler:
         cmd_name = "mem_delete_all" if delete_raw else "mem_delete"
         
         # 智能判断：数字且 ≤ 50 使用序号删除，否则使用 ID 删除
-        if index.isdigit():
-            seq = int(index)
-            if seq <= 0:
-                return "⚠️ 序号必须大于 0。"
-            if seq > 50:
-                return "⚠️ 序号超过 50，请使用记忆 ID 进行删除。"
-            
+        kind, value = _resolve_memory_selector(index, "删除", f"/{cmd_name} a1b2c3d4")
+        if kind == "error":
+            return value
+
+        if kind == "seq":
+            seq = value
             # 按序号删除
             success, message, summary = await self.memory.delete_memory_by_sequence(user_id, seq, delete_raw=delete_raw)
             
@@ -197,9 +220,6 @@ class MemoryCommandHandler:
                 return f"❌ {message}"
         else:
             # 按 ID 删除
-            if len(index) < 8:
-                return f"⚠️ 记忆 ID 至少需要 8 位，例如：/{cmd_name} a1b2c3d4"
-            
             success, message, summary = await self.memory.delete_memory_by_id(user_id, index, delete_raw=delete_raw)
             
             if success:
@@ -210,22 +230,43 @@ class MemoryCommandHandler:
             else:
                 return f"❌ {message}"
     
-    async def handle_mem_undo(self, user_id: str) -> str:
+    async def handle_mem_undo(self, user_id: str, count: str = "") -> str:
         """
         处理 mem_undo 命令
         
         Args:
             user_id: 用户ID
+            count: 可选的撤销条数（默认 1）
             
         Returns:
             str: 格式化的命令结果
         """
-        success, message, summary = await self.memory.undo_last_delete(user_id)
-        
-        if success:
-            return f"✅ 撤销成功！已恢复记忆：\n📝 {summary[:80]}{'...' if len(summary) > 80 else ''}\n\n💡 记忆已重新添加到您的记忆库中。"
+        if count and not count.isdigit():
+            return "⚠️ 撤销条数必须是正整数，例如：/mem_undo 3"
+        if count:
+            undo_count = int(count)
+            if undo_count <= 0:
+                return "⚠️ 数量必须大于 0。"
+            elif undo_count > 50:
+                return "⚠️ 单次最多撤销 50 条删除。"
         else:
+            undo_count = 1
+
+        if undo_count == 1:
+            success, message, summary = await self.memory.undo_last_delete(user_id)
+            
+            if success:
+                return f"✅ 撤销成功！已恢复记忆：\n📝 {summary[:80]}{'...' if len(summary) > 80 else ''}\n\n💡 记忆已重新添加到您的记忆库中。"
+            else:
+                return f"❌ {message}"
+
+        restored, message, summaries = await self.memory.undo_last_deletes(user_id, undo_count)
+        if not restored:
             return f"❌ {message}"
+        rows = "\n".join(
+            f"📝 {summary[:50]}{'...' if len(summary) > 50 else ''}" for summary in summaries
+        )
+        return f"✅ 撤销成功！已恢复 {restored} 条记忆：\n{rows}\n\n💡 记忆已重新添加到您的记忆库中。"
     
     async def handle_mem_clear_raw(self, user_id: str, confirm: str = "") -> str:
         """
@@ -241,8 +282,10 @@ class MemoryCommandHandler:
         if confirm != "confirm":
             return "⚠️ 危险操作：此指令将永久删除您所有**尚未归档**的聊天原文，且不可恢复。\n\n如果您确定要执行，请发送：\n/mem_clear_raw confirm"
         
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
         try:
+            # 先落库写缓冲中的消息，否则它们会在删除之后写入，导致已删除的消息“复活”
+            await self.memory.flush_pending_raw()
             RawMemory = self.db.RawMemory
             def _clear_raw():
                 with self.db.db.connection_context():
@@ -270,7 +313,7 @@ class MemoryCommandHandler:
         if confirm != "confirm":
             return "⚠️ 危险操作：此指令将永久删除您所有的**长期记忆归档**及向量检索数据，但会保留原始聊天记录。\n\n如果您确定要执行，请发送：\n/mem_clear_archive confirm"
         
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
         try:
             # 确保 ChromaDB 已初始化
             await self.memory._ensure_chroma_initialized()
@@ -304,12 +347,13 @@ class MemoryCommandHandler:
         if confirm != "confirm":
             return "⚠️ 警告：此指令将永久删除您所有的聊天原文、长期记忆归档及向量检索数据，且不可恢复。\n\n如果您确定要执行，请发送：\n/mem_clear_all confirm"
         
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
         try:
             # 确保 ChromaDB 已初始化
             await self.memory._ensure_chroma_initialized()
             
-            # 清除 SQLite 中的原始消息和索引
+            # 清除 SQLite 中的原始消息和索引（先落库写缓冲，避免缓冲消息在删除后写回）
+            await self.memory.flush_pending_raw()
             await loop.run_in_executor(self.executor, self.db.clear_user_data, user_id)
             # 清除 ChromaDB 中的向量数据
             await loop.run_in_executor(self.executor, lambda: self.memory.collection.delete(where={"user_id": user_id}))
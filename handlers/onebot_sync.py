@@ -20,6 +20,18 @@ import time
 from astrbot.api import logger
 
 
+# OneBot V11 sex 字段映射：male, female, unknown
+_SEX_MAP = {"male": "男", "female": "女", "unknown": "未知"}
+
+# OneBot 字段 -> 画像 basic_info 字段（返回中存在即直接拷贝）
+_ONEBOT_SIMPLE_FIELDS = (
+    ("nickname", "nickname"),
+    ("birthday", "birthday"),
+    ("zodiac", "zodiac"),
+    ("signature", "signature"),
+    ("location", "location"),
+)
+
 class OneBotSyncHandler:
     """OneBot 用户信息同步处理器"""
     
@@ -83,12 +95,9 @@ class OneBotSyncHandler:
                 # 兼容不同版本的 AstrBot 获取 bot 实例的方式
                 bot = getattr(event, 'bot', None)
                 if bot and hasattr(bot, 'get_stranger_info'):
-                    # 某些实现需要整数 ID
-                    try:
-                        uid_int = int(user_id)
-                    except (TypeError, ValueError) as e:
-                        logger.debug(f"Engram OneBot 同步：user_id 转 int 失败（{user_id}），已回退原始 ID：{e}")
-                        uid_int = user_id
+                    # 某些实现需要整数 ID（非 ASCII 纯数字 ID 保持原样；isdigit 对 "²" 等字符也为真）
+                    uid_str = str(user_id)
+                    uid_int = int(uid_str) if uid_str.isascii() and uid_str.isdigit() else user_id
                     
                     stranger_info = await bot.get_stranger_info(user_id=uid_int)
                     if stranger_info:
@@ -118,37 +127,24 @@ class OneBotSyncHandler:
         basic_info = update_payload["basic_info"]
         
         # 映射 OneBot V11 字段到画像结构
-        # sex: male, female, unknown
-        sex_map = {"male": "男", "female": "女", "unknown": "未知"}
-        gender = sex_map.get(stranger_info.get("sex"), "未知")
-        age = stranger_info.get("age", "未知")
-        nickname = stranger_info.get("nickname", user_name)
-        
-        basic_info["gender"] = gender
-        basic_info["age"] = age
-        basic_info["nickname"] = nickname
+        basic_info["gender"] = _SEX_MAP.get(stranger_info.get("sex"), "未知")
+        basic_info["age"] = stranger_info.get("age", "未知")
         
-        # 补充生日、生肖、签名 (OneBot V11 扩展)
-        if "birthday" in stranger_info: 
-            basic_info["birthday"] = stranger_info["birthday"]
+        # 补充昵称、生日、生肖、签名、所在地 (OneBot V11 扩展)
+        for src, dst in _ONEBOT_SIMPLE_FIELDS:
+            if src in stranger_info:
+                basic_info[dst] = stranger_info[src]
         
         # 解析生日并计算星座和生肖
         self._parse_birthday(stranger_info, basic_info)
         
-        if "zodiac" in stranger_info: 
-            basic_info["zodiac"] = stranger_info["zodiac"]
-        if "signature" in stranger_info: 
-            basic_info["signature"] = stranger_info["signature"]
-        
         # 补充职业
         career_id = stranger_info.get("makeFriendCareer")
         if career_id and career_id != "0" and self.utils:
             basic_info["job"] = self.utils.get_career(int(career_id))
 
-        # 某些 OneBot 扩展实现可能会提供 location
-        if "location" in stranger_info:
-            basic_info["location"] = stranger_info["location"]
-        elif stranger_info.get("country") == "中国":
+        # 无 location 扩展字段时回退到国家/省/市
+        if "location" not in basic_info and stranger_info.get("country") == "中国":
             prov = stranger_info.get("province", "")
             city = stranger_info.get("city", "")
             basic_info["location"] = f"{prov}-{city}".strip("-")
@@ -168,14 +164,14 @@ class OneBotSyncHandler:
         b_month = stranger_info.get("birthday_month")
         b_day = stranger_info.get("birthday_day")
 
-        if b_year and b_month and b_day:
-            basic_info["birthday"] = f"{b_year}-{b_month}-{b_day}"
-            basic_info["constellation"] = self.utils.get_constellation(int(b_month), int(b_day))
+        if not (b_year and b_month and b_day):
+            b_str = str(stranger_info.get("birthday", ""))
+            if not (len(b_str) == 8 and b_str.isdigit()):
+                return
+            b_year, b_month, b_day = b_str[:4], b_str[4:6], b_str[6:]
+
+        basic_info["birthday"] = f"{b_year}-{b_month}-{b_day}"
+        basic_info["constellation"] = self.utils.get_constellation(int(b_month), int(b_day))
+        # OneBot 直接返回的生肖优先于按生日推算的结果
+        if "zodiac" not in stranger_info:
             basic_info["zodiac"] = self.utils.get_zodiac(int(b_year), int(b_month), int(b_day))
-        elif "birthday" in stranger_info and str(stranger_info["birthday"]).isdigit():
-            b_str = str(stranger_info["birthday"])
-            if len(b_str) == 8:
-                b_year, b_month, b_day = b_str[:4], b_str[4:6], b_str[6:]
-                basic_info["birthday"] = f"{b_year}-{b_month}-{b_day}"
-                basic_info["constellation"] = self.utils.get_constellation(int(b_month), int(b_day))
-                basic_info["zodiac"] = self.utils.get_zodiac(int(b_year), int(b_month), int(b_day))
@@ -5,10 +5,11 @@
 """
 
 import asyncio
-import json
 import datetime
 from astrbot.api import logger
 
+from ..utils import json_dumps
+
 
 class ProfileCommandHandler:
     """画像命令处理器"""
@@ -27,7 +28,7 @@ class ProfileCommandHandler:
             return False, "👤 您当前还没有建立深度画像。"
 
         try:
-            loop = asyncio.get_event_loop()
+            loop = asyncio.get_running_loop()
             memories = await loop.run_in_executor(self.executor, self.db.get_memory_list, user_id, 100)
             memory_count = len(memories)
 
@@ -50,7 +51,7 @@ class ProfileCommandHandler:
             logger.error(f"Engram：画像渲染失败：{e}")
             import traceback
             logger.debug(traceback.format_exc())
-            return False, f"⚠️ 档案绘制失败，转为文本模式：\n{json.dumps(profile, indent=2, ensure_ascii=False)}"
+            return False, f"⚠️ 档案绘制失败，转为文本模式：\n{json_dumps(profile, indent=True)}"
 
     async def handle_profile_clear(self, user_id: str, confirm: str = "") -> str:
         if confirm != "confirm":
@@ -22,10 +22,16 @@ from .webui_server import EngramWebServer
 from . import utils as utils_module
 
 import asyncio
+import io
+import logging
 import re
 import os
 
 
+# 默认指令前缀
+_DEFAULT_CMD_PREFIXES = ("/", "!", "#", "~")
+
+
 class FriendAddNoticeFilter(filter.CustomFilter):
     """过滤 OneBot friend_add notice 事件。"""
 
@@ -82,9 +88,13 @@ class EngramPlugin(Star):
         self._group_db = None
         self._group_memory_init_lock = asyncio.Lock()
 
-        # 初始化调度器
+        # 调试注入开关（配置变更时框架会重载插件实例）
+        self._debug_injection = bool(self.config.get("debug_injection", False))
+
+        # 初始化调度器（延迟到事件循环就绪后由 _ensure_scheduler 启动）
         self._scheduler = MemoryScheduler(self.logic, self.config)
-        asyncio.create_task(self._scheduler.start())
+        self._scheduler_task = None
+        self._scheduler_lock = asyncio.Lock()
 
         # WebUI 服务端
         self.enable_webui_server = self.config.get("enable_webui_server", False)
@@ -105,25 +115,44 @@ class EngramPlugin(Star):
                 self._webui_server = None
         
 
+    async def initialize(self):
+        """插件初始化钩子：在运行中的事件循环内启动调度器"""
+        await self._ensure_scheduler()
+
+    async def _ensure_scheduler(self):
+        """确保调度器只启动一次（首个事件或 initialize 钩子触发）"""
+        if self._scheduler_task is not None:
+            return
+        async with self._scheduler_lock:
+            if self._scheduler_task is not None:
+                return
+            self._scheduler_task = asyncio.create_task(self._scheduler.start())
+            try:
+                await self._scheduler_task
+            except Exception as e:
+                logger.error(f"Engram：调度器启动失败：{e}")
+
     def _is_command_message(self, content: str) -> bool:
         """检测消息是否为指令"""
-        if not self.config.get("enable_command_filter", True):
-            logger.debug(f"Engram：指令过滤已关闭，不进行过滤：{content[:30]}")
+        cfg_get = self.config.get
+        log_debug = logger.debug
+        if not cfg_get("enable_command_filter", True):
+            log_debug(f"Engram：指令过滤已关闭，不进行过滤：{content[:30]}")
             return False
         
         text = content.strip()
         
         # 1. 检查指令前缀
-        command_prefixes = self.config.get("command_prefixes", ["/", "!", "#", "~"])
-        logger.debug(f"Engram：正在检查消息是否匹配指令前缀 {command_prefixes}：{text[:30]}")
+        command_prefixes = cfg_get("command_prefixes", _DEFAULT_CMD_PREFIXES)
+        log_debug(f"Engram：正在检查消息是否匹配指令前缀 {command_prefixes}：{text[:30]}")
         for prefix in command_prefixes:
             if text.startswith(prefix):
-                logger.debug(f"Engram：消息命中前缀 '{prefix}'，已过滤")
+                log_debug(f"Engram：消息命中前缀 '{prefix}'，已过滤")
                 return True
         
         # 2. 检查完整指令匹配
-        if self.config.get("enable_full_command_detection", False):
-            full_commands = self.config.get("full_command_list", [])
+        if cfg_get("enable_full_command_detection", False):
+            full_commands = cfg_get("full_command_list", [])
             cleaned_text = "".join(text.split())
             for cmd in full_commands:
                 if cleaned_text == "".join(str(cmd).split()):
@@ -343,12 +372,13 @@ class EngramPlugin(Star):
     @filter.on_llm_request()
     async def on_llm_request(self, event: AstrMessageEvent, req):
         """在调用 LLM 前注入长期记忆和用户画像"""
+        await self._ensure_scheduler()
         if event.get_group_id():
             await self._handle_group_llm_request(event, req)
             return
         user_id = event.get_sender_id()
         query = event.message_str
-        profile = await self.logic.get_user_profile(user_id)
+        profile = await self.logic.get_user_profile_cached(user_id)
         profile_block = self._llm_injector.build_profile_block(profile)
         
         memory_block = ""
@@ -398,7 +428,7 @@ class EngramPlugin(Star):
             self._llm_injector.inject_context(req, profile_block, combined_memory_block)
             
             # 调试模式：输出注入的内容
-            if self.config.get("debug_injection", False):
+            if self._debug_injection and logger.isEnabledFor(logging.INFO):
                 logger.info(f"=== Engram 调试模式 [用户: {user_id}] ===")
                 if profile_block:
                     logger.info(f"📋 注入的用户画像:\n{profile_block}")
@@ -410,7 +440,8 @@ class EngramPlugin(Star):
 
     async def _handle_group_llm_request(self, event: AstrMessageEvent, req):
         """群聊记忆注入与缓存（仅 LLM 触发时）。"""
-        if not self.config.get("enable_group_memory", False):
+        cfg_get = self.config.get
+        if not cfg_get("enable_group_memory", False):
             return
 
         if not await self._group_memory_friend_allowed(event):
@@ -421,7 +452,7 @@ class EngramPlugin(Star):
             return
 
         try:
-            min_len = int(self.config.get("group_memory_min_text_length", 6))
+            min_len = int(cfg_get("group_memory_min_text_length", 6))
         except (TypeError, ValueError):
             min_len = 6
 
@@ -436,7 +467,8 @@ class EngramPlugin(Star):
         sender_id = event.get_sender_id()
         user_name = event.get_sender_name()
         storage_id = self._resolve_group_storage_id(group_id, sender_id)
-        group_source_type = str(self.config.get("group_memory_source_type", "group")).strip() or "group"
+        group_source_type = str(cfg_get("group_memory_source_type", "group")).strip() or "group"
+        allow_private_recall = cfg_get("group_memory_allow_private_recall", False)
 
         event.set_extra("group_memory_pending", {
             "storage_id": storage_id,
@@ -466,7 +498,7 @@ class EngramPlugin(Star):
                 logger.debug(f"Engram：群聊话题缓存读取失败，已回退为直接检索：{e}")
                 cache_hit, memories, topic_key = False, [], ""
 
-            if cache_hit and self.config.get("group_memory_allow_private_recall", False):
+            if cache_hit and allow_private_recall:
                 cache_hit = False
 
             if not cache_hit:
@@ -478,7 +510,7 @@ class EngramPlugin(Star):
                     )
                     memories = list(group_memories or [])
                     private_memories = []
-                    if self.config.get("group_memory_allow_private_recall", False):
+                    if allow_private_recall:
                         private_memories = await self.logic.retrieve_memories(
                             sender_id,
                             content,
@@ -520,7 +552,7 @@ class EngramPlugin(Star):
 
         profile_block = ""
         try:
-            profile = await self.logic.get_user_profile(sender_id)
+            profile = await self.logic.get_user_profile_cached(sender_id)
             profile_block = self._llm_injector.build_profile_block(profile)
         except Exception as e:
             logger.debug(f"Engram：群聊画像读取失败，已跳过：{e}")
@@ -529,7 +561,7 @@ class EngramPlugin(Star):
         if profile_block or combined_memory_block:
             self._llm_injector.inject_context(req, profile_block, combined_memory_block)
 
-            if self.config.get("debug_injection", False):
+            if self._debug_injection and logger.isEnabledFor(logging.INFO):
                 logger.info(f"=== Engram 群聊调试模式 [群: {group_id}] ===")
                 if profile_block:
                     logger.info(f"📋 注入的用户画像:\n{profile_block}")
@@ -740,37 +772,39 @@ class EngramPlugin(Star):
         if not memory_index:
             return str(raw_msgs or f"找不到 ID 为 {memory_id} 的记忆。")
 
-        created_at = self.logic._ensure_datetime(memory_index.created_at)
-        detail_lines = [
-            f"📖 记忆详情（ID {memory_index.index_id[:8]}）",
-            f"⏰ 时间：{created_at.strftime('%Y-%m-%d %H:%M')}",
-            f"📝 归档：{memory_index.summary}",
-            "————————————————",
+        ensure_dt = self.logic._ensure_datetime
+        is_valid = self.logic._is_valid_message_content
+        created_at = ensure_dt(memory_index.created_at)
+        buf = io.StringIO()
+        buf.write(
+            f"📖 记忆详情（ID {memory_index.index_id[:8]}）\n"
+            f"⏰ 时间：{created_at.strftime('%Y-%m-%d %H:%M')}\n"
+            f"📝 归档：{memory_index.summary}\n"
+            "————————————————\n"
             "🎙️ 原始对话回溯："
-        ]
+        )
 
         if not raw_msgs:
-            detail_lines.append("(暂无关联的原始对话数据)")
-            return "\n".join(detail_lines)
+            buf.write("\n(暂无关联的原始对话数据)")
+            return buf.getvalue()
 
         shown = 0
         for m in raw_msgs:
-            if not self.logic._is_valid_message_content(m.content):
+            if not is_valid(m.content):
                 continue
 
-            ts = self.logic._ensure_datetime(m.timestamp)
-            time_str = ts.strftime("%H:%M:%S")
+            time_str = ensure_dt(m.timestamp).strftime("%H:%M:%S")
             role_name = "我" if m.role == "assistant" else (m.user_name or "你")
-            detail_lines.append(f"[{time_str}] {role_name}: {m.content}")
+            buf.write(f"\n[{time_str}] {role_name}: {m.content}")
             shown += 1
 
             if shown >= max_messages:
                 break
 
         if shown == 0:
-            detail_lines.append("(原始对话均为空或被过滤)")
+            buf.write("\n(原始对话均为空或被过滤)")
 
-        return "\n".join(detail_lines)
+        return buf.getvalue()
 
     @filter.after_message_sent()
     async def after_message_sent(self, event: AstrMessageEvent):
@@ -808,6 +842,7 @@ class EngramPlugin(Star):
     @filter.event_message_type(filter.EventMessageType.PRIVATE_MESSAGE)
     async def on_private_message(self, event: AstrMessageEvent):
         """在收到私聊消息时记录原始记忆并被动同步 OneBot 用户信息"""
+        await self._ensure_scheduler()
         user_id = event.get_sender_id()
         content = event.message_str
         
@@ -870,10 +905,10 @@ class EngramPlugin(Star):
         yield event.plain_result(result)
 
     @filter.command("mem_undo")
-    async def mem_undo(self, event: AstrMessageEvent):
-        """撤销最近一次删除操作"""
+    async def mem_undo(self, event: AstrMessageEvent, count: str = ""):
+        """撤销最近一次（或最近 N 次）删除操作"""
         user_id = event.get_sender_id()
-        result = await self._mem_handler.handle_mem_undo(user_id=user_id)
+        result = await self._mem_handler.handle_mem_undo(user_id=user_id, count=count)
         yield event.plain_result(result)
 
     @filter.command("mem_clear_raw")
@@ -916,8 +951,7 @@ class EngramPlugin(Star):
         user_id = event.get_sender_id()
         success, result = await self._profile_handler.handle_profile_show(user_id=user_id)
         if success:
-            from astrbot.api.message_components import Image as MsgImage
-            yield event.chain_result([MsgImage.fromBytes(result)])
+            yield event.chain_result([Image.fromBytes(result)])
         else:
             yield event.plain_result(result)
 
@@ -1119,8 +1153,8 @@ class EngramPlugin(Star):
         yield event.plain_result(self._rewrite_group_command_hints(result))
 
     @filter.command("group_mem_undo")
-    async def group_mem_undo(self, event: AstrMessageEvent):
-        """撤销本群最近一次删除操作"""
+    async def group_mem_undo(self, event: AstrMessageEvent, count: str = ""):
+        """撤销本群最近一次（或最近 N 次）删除操作"""
         if not event.get_group_id():
             yield event.plain_result("仅群聊可用。")
             return
@@ -1129,7 +1163,7 @@ class EngramPlugin(Star):
             yield event.plain_result("群聊记忆未开启或未初始化。")
             return
         storage_id = self._resolve_group_storage_id(event.get_group_id(), event.get_sender_id())
-        result = await handler.handle_mem_undo(user_id=storage_id)
+        result = await handler.handle_mem_undo(user_id=storage_id, count=count)
         yield event.plain_result(self._rewrite_group_command_hints(result))
 
     @filter.permission_type(filter.PermissionType.ADMIN)
@@ -1202,6 +1236,10 @@ class EngramPlugin(Star):
             self._scheduler._is_shutdown = True
         
         # 步骤2：取消所有后台任务
+        scheduler_task = getattr(self, "_scheduler_task", None)
+        if scheduler_task is not None and not scheduler_task.done():
+            scheduler_task.cancel()
+
         if hasattr(self, "_scheduler"):
             for task in self._scheduler._tasks:
                 if not task.done():
@@ -1247,5 +1285,5 @@ class EngramPlugin(Star):
         self.logic._memory_manager.shutdown()
         if getattr(self, "_group_memory_manager", None):
             self._group_memory_manager.shutdown()
-        self.logic.executor.shutdown(wait=False)
+        self.logic.release_executor()
         await self.profile_renderer.close()
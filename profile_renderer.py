@@ -9,13 +9,93 @@ v2.1 优化版：
 """
 import io
 import os
+import json
+import time
 import asyncio
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import aiohttp
 from PIL import Image, ImageDraw, ImageFont
 from astrbot.api import logger
 from .services.bond_calculator import BondCalculator
 
 
+# 字体文件名优先匹配的关键词（可爱体 / 常见中文字体）
+_FONT_KEYWORDS = ('cute', 'lixia', 'msyh', 'sim', 'wqy', 'noto')
+_FONT_EXTENSIONS = ('.ttc', '.ttf', '.otf')
+
+# {(custom_style_path, plugin_data_dir): font_path}，仅缓存找到的结果，未找到时下次仍会重新扫描
+_font_path_cache = {}
+
+# 以下绘制资源与渲染器实例无关，放在模块级供所有实例共享（WebUI 每次请求都会新建渲染器）；
+# 渲染线程并发填充时最多重复生成一次，结果相同，无需加锁
+_font_cache = {}  # {(font_path, size): ImageFont}，同一字号跨多次渲染复用已解析的字体
+_grid_backgrounds = {}  # {宽度: Image}，按最大画布高度预绘制的网格背景
+_pill_masks = {}  # {宽度: 圆角遮罩}，标签胶囊按宽度复用，粘贴代替逐个绘制圆角矩形
+
+
+# 渲染专用线程池：进程内所有渲染器实例共享（WebUI 每次请求都会新建渲染器），
+# 线程数控制在核心数一半，避免突发渲染时大量线程争抢 GIL 并各自占用整张画布内存
+_RENDER_WORKERS = max(2, (os.cpu_count() or 2) // 2)
+_render_executor = None
+
+
+def _get_render_executor():
+    """获取渲染线程池（首次使用时创建；仅在事件循环线程中调用）"""
+    global _render_executor
+    if _render_executor is None:
+        _render_executor = ThreadPoolExecutor(
+            max_workers=_RENDER_WORKERS,
+            thread_name_prefix="engram-render",
+        )
+    return _render_executor
+
+
+def _discover_font(custom_style_path, plugin_data_dir):
+    """扫描字体目录并返回首选字体文件路径；结果按 (自定义样式路径, 数据目录) 缓存"""
+    cache_key = (custom_style_path or "", plugin_data_dir)
+    font_path = _font_path_cache.get(cache_key)
+    if font_path:
+        return font_path
+
+    font_search_paths = []
+    if custom_style_path and os.path.exists(custom_style_path):
+        font_search_paths.append(custom_style_path)
+        try:
+            for sub in os.listdir(custom_style_path):
+                sub_p = os.path.join(custom_style_path, sub)
+                if os.path.isdir(sub_p):
+                    font_search_paths.append(sub_p)
+        except OSError as e:
+            logger.debug(f"Engram 画像渲染器：扫描自定义样式路径失败（{custom_style_path}）：{e}")
+
+    font_search_paths.extend([
+        os.path.join(plugin_data_dir, "fonts"),
+        "C:/Windows/Fonts",
+        "/usr/share/fonts/truetype/wqy",
+        "/usr/share/fonts"
+    ])
+
+    for sp in font_search_paths:
+        if not sp or not os.path.exists(sp):
+            continue
+        try:
+            files = [f for f in os.listdir(sp) if f.lower().endswith(_FONT_EXTENSIONS)]
+            if files:
+                best_match = next(
+                    (f for f in files if any(k in f.lower() for k in _FONT_KEYWORDS)),
+                    files[0],
+                )
+                font_path = _font_path_cache[cache_key] = os.path.join(sp, best_match)
+                logger.info(f"Engram：使用字体文件：{font_path}")
+                return font_path
+        except OSError as e:
+            logger.debug(f"Engram 画像渲染器：扫描字体路径失败（{sp}）：{e}")
+            continue
+    return None
+
+
 class ProfileRenderer:
     """画像图片渲染器"""
     
@@ -56,77 +136,129 @@ class ProfileRenderer:
     
     # 等级图标（7级）
     LEVEL_ICONS = ["🌱", "🌿", "🌸", "💐", "🌟", "💫", "✨"]
+
+    # 背景网格间距与画布最大高度
+    GRID_SIZE = 30
+    MAX_CANVAS_HEIGHT = 2200
+
+    # 文本宽度缓存上限（超出时整体清空，避免随用户数无限增长）
+    TEXT_WIDTH_CACHE_MAX = 2048
+
+    # PNG 压缩级别：纯色块为主的卡片图在低级别下体积差异很小，编码却快数倍
+    PNG_COMPRESS_LEVEL = 1
+
+    # 头像显示尺寸（缓存中直接保存该尺寸的圆形头像）
+    AVATAR_SIZE = 140
+    AVATAR_MEM_CACHE_MAX = 64
+
+    # 成品图缓存有效期（秒）与版本号（渲染样式变更时递增，使旧缓存失效）
+    RENDER_CACHE_TTL = 86400
+    RENDER_CACHE_VERSION = 1
+
+    # 标签/成就胶囊尺寸
+    PILL_HEIGHT = 32
+    PILL_RADIUS = 10
     
     def __init__(self, config, plugin_data_dir):
         self.config = config
         self.plugin_data_dir = plugin_data_dir
         self._font_path = None
+        self._font_lookup_failed = False  # 字体扫描未找到结果时置位，避免各字号重复扫描
+        self._text_width_cache = {}  # {(id(font), text): width}，字体对象由模块级 _font_cache 持有，id 稳定
+        self._avatar_mem_cache = OrderedDict()  # {user_id: Image}，LRU，免去缓存命中时的 PNG 解码
         self._session = None  # 复用的 HTTP 会话
         self._bond_calculator = BondCalculator()  # 羁绊计算器（统一计算逻辑）
         
         # 头像缓存目录
         self.avatar_cache_dir = os.path.join(plugin_data_dir, "avatar_cache")
         os.makedirs(self.avatar_cache_dir, exist_ok=True)
+
+        # 成品图缓存目录（画像与记忆数未变化时直接复用上次渲染结果）
+        self.render_cache_dir = os.path.join(plugin_data_dir, "profile_cache")
+        os.makedirs(self.render_cache_dir, exist_ok=True)
     
     def _find_font(self):
-        """查找可用字体"""
-        if self._font_path:
-            return self._font_path
-            
-        custom_style_path = self.config.get("pillowmd_style_path", "")
-        font_search_paths = []
-        
-        if custom_style_path and os.path.exists(custom_style_path):
-            font_search_paths.append(custom_style_path)
-            try:
-                for sub in os.listdir(custom_style_path):
-                    sub_p = os.path.join(custom_style_path, sub)
-                    if os.path.isdir(sub_p):
-                        font_search_paths.append(sub_p)
-            except Exception as e:
-                logger.debug(f"Engram 画像渲染器：扫描自定义样式路径失败（{custom_style_path}）：{e}")
-        
-        font_search_paths.extend([
-            os.path.join(self.plugin_data_dir, "fonts"),
-            "C:/Windows/Fonts",
-            "/usr/share/fonts/truetype/wqy",
-            "/usr/share/fonts"
-        ])
-        
-        for sp in font_search_paths:
-            if not sp or not os.path.exists(sp):
-                continue
-            try:
-                files = [f for f in os.listdir(sp) if f.lower().endswith(('.ttc', '.ttf', '.otf'))]
-                if files:
-                    best_match = files[0]
-                    for f in files:
-                        if any(k in f.lower() for k in ['cute', 'lixia', 'msyh', 'sim', 'wqy', 'noto']):
-                            best_match = f
-                            break
-                    self._font_path = os.path.join(sp, best_match)
-                    logger.info(f"Engram：使用字体文件：{self._font_path}")
-                    return self._font_path
-            except Exception as e:
-                logger.debug(f"Engram 画像渲染器：扫描字体路径失败（{sp}）：{e}")
-                continue
-        return None
+        """查找可用字体（进程级缓存，多个渲染器实例共享扫描结果）"""
+        if not self._font_path and not self._font_lookup_failed:
+            self._font_path = _discover_font(
+                self.config.get("pillowmd_style_path", ""), self.plugin_data_dir
+            )
+            # 本实例内不再重复扫描（每个字号首次加载都会调用这里）
+            self._font_lookup_failed = self._font_path is None
+        return self._font_path
     
     def _get_font(self, size):
-        """获取指定大小的字体"""
+        """获取指定大小的字体（按字体路径和字号进程级缓存，避免每次渲染重新解析字体文件）"""
+        font_path = self._find_font()
+        key = (font_path, size)
+        font = _font_cache.get(key)
+        if font is not None:
+            return font
         try:
-            font_path = self._find_font()
-            if font_path:
-                return ImageFont.truetype(font_path, size)
-            return ImageFont.load_default()
+            font = ImageFont.truetype(font_path, size) if font_path else ImageFont.load_default()
         except Exception as e:
             logger.debug(f"Engram 画像渲染器：加载字体失败（size={size}），已回退默认字体：{e}")
-            return ImageFont.load_default()
+            font = ImageFont.load_default()
+        _font_cache[key] = font
+        return font
+    
+    def _text_width(self, draw, text, font):
+        """测量文本宽度（缓存结果，标签、分类名等常见字符串跨渲染只测量一次）"""
+        key = (id(font), text)
+        width = self._text_width_cache.get(key)
+        if width is None:
+            if len(self._text_width_cache) >= self.TEXT_WIDTH_CACHE_MAX:
+                self._text_width_cache.clear()
+            width = self._text_width_cache[key] = draw.textlength(text, font=font)
+        return width
+
+    def _draw_pill(self, im, x0, y0, x1, fill):
+        """绘制标签胶囊（与 rounded_rectangle([x0, y0, x1, y0+PILL_HEIGHT]) 效果一致）"""
+        left, top = round(x0), round(y0)
+        width = round(x1) - left + 1
+        mask = _pill_masks.get(width)
+        if mask is None:
+            height = self.PILL_HEIGHT + 1
+            mask = Image.new('L', (width, height), 0)
+            ImageDraw.Draw(mask).rounded_rectangle(
+                [0, 0, width - 1, height - 1], radius=self.PILL_RADIUS, fill=255
+            )
+            _pill_masks[width] = mask
+        im.paste(fill, (left, top, left + width, top + mask.height), mask)
+
+    def _fit_text(self, draw, text, font, max_w, ellipsis="..."):
+        """按实际像素宽度截断文本，返回 (文本, 宽度)
+
+        中英文字形宽度差异很大，按字符数截断会过早截断英文或让中文溢出；
+        这里对前缀长度二分查找，找出加省略号后不超过 max_w 的最长前缀。
+        """
+        width = self._text_width(draw, text, font)
+        if width <= max_w:
+            return text, width
+
+        lo, hi = 0, len(text) - 1
+        best, best_w = ellipsis, draw.textlength(ellipsis, font=font)
+        while lo <= hi:
+            mid = (lo + hi + 1) // 2
+            candidate = text[:mid].rstrip() + ellipsis
+            cand_w = draw.textlength(candidate, font=font)
+            if cand_w <= max_w:
+                best, best_w = candidate, cand_w
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        return best, best_w
     
     async def _ensure_session(self):
         """确保 HTTP 会话已初始化"""
         if self._session is None or self._session.closed:
-            self._session = aiohttp.ClientSession()
+            # 复用连接并缓存 DNS，连续下载同一 CDN 的头像时免去重复握手
+            connector = aiohttp.TCPConnector(
+                limit=32, limit_per_host=8, ttl_dns_cache=300, keepalive_timeout=60
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=10)
+            )
         return self._session
     
     async def close(self):
@@ -135,19 +267,27 @@ class ProfileRenderer:
             await self._session.close()
     
     async def _get_cached_avatar(self, user_id, avatar_url):
-        """获取缓存的头像，如果不存在则下载并缓存"""
-        import hashlib
-        
-        # 使用 user_id 作为缓存文件名
-        cache_file = os.path.join(self.avatar_cache_dir, f"{user_id}.png")
+        """获取缓存的头像，如果不存在则下载并缓存
+
+        缓存中保存的是已缩放到 AVATAR_SIZE 并裁成圆形的 RGBA 图片，渲染时可直接粘贴。
+        """
+        # 内存缓存命中：渲染只读取头像像素，可直接复用已解码的图片
+        avatar_img = self._avatar_mem_cache.get(user_id)
+        if avatar_img is not None:
+            self._avatar_mem_cache.move_to_end(user_id)
+            return avatar_img
+
+        cache_file = os.path.join(self.avatar_cache_dir, f"{user_id}_{self.AVATAR_SIZE}.png")
         
         # 如果缓存文件存在且有效，直接使用
         if os.path.exists(cache_file):
             try:
-                # 检查文件是否有效（大于 1KB）
-                if os.path.getsize(cache_file) > 1024:
-                    return Image.open(cache_file).convert("RGBA")
-            except Exception as e:
+                avatar_img = Image.open(cache_file).convert("RGBA")
+                if avatar_img.size == (self.AVATAR_SIZE, self.AVATAR_SIZE):
+                    self._remember_avatar(user_id, avatar_img)
+                    return avatar_img
+                raise ValueError(f"尺寸不符：{avatar_img.size}")
+            except (OSError, ValueError) as e:
                 logger.debug(f"Engram 画像渲染器：加载用户 {user_id} 的头像缓存失败：{e}")
                 # 缓存文件损坏，删除它
                 try:
@@ -161,21 +301,54 @@ class ProfileRenderer:
             async with session.get(avatar_url, timeout=aiohttp.ClientTimeout(total=10)) as resp:
                 if resp.status == 200:
                     avatar_data = await resp.read()
-                    avatar_img = Image.open(io.BytesIO(avatar_data)).convert("RGBA")
-                    
-                    # 保存到缓存
-                    try:
-                        avatar_img.save(cache_file, "PNG")
-                        logger.debug(f"Engram 画像渲染器：已缓存用户 {user_id} 的头像")
-                    except Exception as e:
-                        logger.debug(f"Engram 画像渲染器：缓存用户 {user_id} 头像失败：{e}")
-                    
+                    # 解码、缩放与圆形裁剪放到渲染线程池，与渲染共用同一并发上限
+                    loop = asyncio.get_running_loop()
+                    avatar_img = await loop.run_in_executor(
+                        _get_render_executor(), self._store_avatar, user_id, avatar_data, cache_file
+                    )
+                    self._remember_avatar(user_id, avatar_img)
                     return avatar_img
         except Exception as e:
             logger.debug(f"Engram 画像渲染器：下载用户 {user_id} 头像失败：{e}")
         
         return None
 
+    def _remember_avatar(self, user_id, avatar_img):
+        """写入头像内存缓存，超出上限时淘汰最久未使用的条目"""
+        cache = self._avatar_mem_cache
+        cache[user_id] = avatar_img
+        cache.move_to_end(user_id)
+        while len(cache) > self.AVATAR_MEM_CACHE_MAX:
+            cache.popitem(last=False)
+
+    def _store_avatar(self, user_id, avatar_data, cache_file):
+        """将下载的头像缩放为圆形并写入缓存，返回处理后的图片"""
+        size = self.AVATAR_SIZE
+        avatar_img = Image.open(io.BytesIO(avatar_data)).convert("RGBA")
+        avatar_img = avatar_img.resize((size, size), Image.LANCZOS)
+
+        # 圆形遮罩与原有透明通道取交集
+        mask = Image.new('L', (size, size), 0)
+        ImageDraw.Draw(mask).ellipse((0, 0, size, size), fill=255)
+        alpha = avatar_img.getchannel('A')
+        avatar_img.putalpha(Image.composite(alpha, mask, mask))
+
+        try:
+            avatar_img.save(cache_file, "PNG")
+            logger.debug(f"Engram 画像渲染器：已缓存用户 {user_id} 的头像")
+        except Exception as e:
+            logger.debug(f"Engram 画像渲染器：缓存用户 {user_id} 头像失败：{e}")
+
+        # 清理旧版本保存的原尺寸头像缓存
+        legacy_file = os.path.join(self.avatar_cache_dir, f"{user_id}.png")
+        if os.path.exists(legacy_file):
+            try:
+                os.remove(legacy_file)
+            except Exception as e:
+                logger.debug(f"Engram 画像渲染器：删除旧头像缓存失败（{legacy_file}）：{e}")
+
+        return avatar_img
+
     def _get_tag_categories(self, profile):
         """获取标签分类列表（v2.1 优化版：细分喜好类别）"""
         attrs = profile.get("attributes", {})
@@ -202,8 +375,8 @@ class ProfileRenderer:
         
         return tag_categories
 
-    def _calculate_required_height(self, profile, memory_count, evidence_summary=None):
-        """根据画像内容动态计算所需画布高度"""
+    def _calculate_required_height(self, profile, memory_count, evidence_summary=None, tag_categories=None):
+        """根据画像内容动态计算所需画布高度（可传入已计算的标签分类，避免重复遍历画像）"""
         # 基础信息区域高度估算
         basic = profile.get("basic_info", {})
         infos = []
@@ -217,7 +390,8 @@ class ProfileRenderer:
         base_height = 200 + 55 + 50 + 50 + (info_rows * 45) + 80
         
         # 标签区域高度估算（每个分类只显示一行）
-        tag_categories = self._get_tag_categories(profile)
+        if tag_categories is None:
+            tag_categories = self._get_tag_categories(profile)
         tag_section_count = sum(1 for _, tags in tag_categories if tags)
         # 标题"记忆碎片"(55) + 每个分类(分类名20 + 标签38 + 标签行32 + 间距45 = 135)
         tag_height = 55 + (tag_section_count * 85) if tag_section_count > 0 else 95
@@ -243,37 +417,59 @@ class ProfileRenderer:
         total = base_height + tag_height + bond_height + evidence_height + margin
 
         # 设置最小和最大高度
-        return max(1000, min(total, 2200))
+        return max(1000, min(total, self.MAX_CANVAS_HEIGHT))
 
-    def _render_sync(self, user_id, profile, memory_count, avatar_img, height=900, evidence_summary=None):
-        """同步的图像渲染逻辑（CPU密集型操作，在线程池中执行）"""
+    def _get_grid_background(self, width, height):
+        """
+        获取带背景网格的画布
+
+        网格按宽度在进程内只绘制一次（高度取最大画布高度）并缓存，
+        之后每次渲染从顶部裁剪出所需高度（裁剪结果为独立副本）。
+        """
+        bg = _grid_backgrounds.get(width)
+        if bg is None or bg.height < height:
+            bg_height = max(height, self.MAX_CANVAS_HEIGHT)
+            bg = Image.new("RGB", (width, bg_height), self.COLORS["bg"])
+            draw = ImageDraw.Draw(bg)
+            for x in range(0, width, self.GRID_SIZE):
+                draw.line([(x, 0), (x, bg_height)], fill=self.COLORS["grid"], width=1)
+            for y in range(0, bg_height, self.GRID_SIZE):
+                draw.line([(0, y), (width, y)], fill=self.COLORS["grid"], width=1)
+            _grid_backgrounds[width] = bg
+        return bg.crop((0, 0, width, height))
+
+    def _render_sync(self, user_id, profile, memory_count, avatar_img, height=900, evidence_summary=None,
+                     tag_categories=None, bond_info=None):
+        """同步的图像渲染逻辑（CPU密集型操作，在线程池中执行）
+
+        tag_categories / bond_info 为纯数据计算结果，由 render 预先算好传入；未传入时在此计算。
+        """
         basic = profile.get("basic_info", {})
         attrs = profile.get("attributes", {})
         prefs = profile.get("preferences", {})
         social = profile.get("social_graph", {})
+        # 配色绑定为局部变量（本函数引用数十次，省去重复的属性/字典查找）
         colors = self.COLORS
+        grid_color, card_bg, shadow = colors["grid"], colors["card_bg"], colors["shadow"]
+        text_main, text_dim = colors["text_main"], colors["text_dim"]
+        accent, tag_bg = colors["accent"], colors["tag_bg"]
+        tag_colors = self.TAG_COLORS
         
         W, H = 600, height  # 使用动态高度
-        im = Image.new("RGB", (W, H), colors["bg"])
+        # 1. 背景网格（缓存层裁剪得到，省去逐条画线）
+        im = self._get_grid_background(W, H)
         draw = ImageDraw.Draw(im)
         
         margin = 40
         
-        # 1. 背景网格
-        grid_size = 30
-        for x in range(0, W, grid_size):
-            draw.line([(x, 0), (x, H)], fill=colors["grid"], width=1)
-        for y in range(0, H, grid_size):
-            draw.line([(0, y), (W, y)], fill=colors["grid"], width=1)
-        
         # 2. 主卡片
         card_rect = [margin, 120, W-margin, H-margin]
-        draw.rounded_rectangle([c + 8 for c in card_rect], radius=20, fill=colors["shadow"])
-        draw.rounded_rectangle(card_rect, radius=20, fill=colors["card_bg"])
+        draw.rounded_rectangle([c + 8 for c in card_rect], radius=20, fill=shadow)
+        draw.rounded_rectangle(card_rect, radius=20, fill=card_bg)
         
         # 3. 顶部胶带
         tape_w = 120
-        draw.rectangle([W/2 - tape_w/2, 110, W/2 + tape_w/2, 125], fill=colors["accent"])
+        draw.rectangle([W/2 - tape_w/2, 110, W/2 + tape_w/2, 125], fill=accent)
         
         # 字体
         f_name = self._get_font(40)
@@ -284,37 +480,33 @@ class ProfileRenderer:
         f_tag = self._get_font(20)
         
         # 4. 头像
-        avatar_size = 140
+        avatar_size = self.AVATAR_SIZE
         if avatar_img:
             try:
-                avatar_img = avatar_img.resize((avatar_size, avatar_size))
-                mask = Image.new('L', (avatar_size, avatar_size), 0)
-                ImageDraw.Draw(mask).ellipse((0, 0, avatar_size, avatar_size), fill=255)
+                # 头像在缓存阶段已缩放并裁成圆形，直接以自身透明通道粘贴
                 av_x, av_y = (W - avatar_size) // 2, 60
                 draw.ellipse((av_x-5, av_y-5, av_x+avatar_size+5, av_y+avatar_size+5), fill="white")
-                im.paste(avatar_img, (av_x, av_y), mask=mask)
+                im.paste(avatar_img, (av_x, av_y), avatar_img)
             except Exception as e:
                 logger.debug(f"Engram 画像渲染器：渲染用户 {user_id} 头像失败：{e}")
         
         # 5. 文字信息
         curr_y = 220
         name = basic.get("nickname", "未知用户")
-        tw = draw.textlength(name, font=f_name)
-        draw.text(((W - tw)/2, curr_y), name, fill=colors["text_main"], font=f_name)
+        tw = self._text_width(draw, name, f_name)
+        draw.text(((W - tw)/2, curr_y), name, fill=text_main, font=f_name)
         
         curr_y += 55
         uid_str = f"ID: {basic.get('qq_id', user_id)}"
-        uw = draw.textlength(uid_str, font=f_uid)
-        draw.rounded_rectangle([(W-uw)/2 - 12, curr_y, (W+uw)/2 + 12, curr_y+32], radius=12, fill=colors["grid"])
-        draw.text(((W - uw)/2, curr_y+3), uid_str, fill=colors["text_dim"], font=f_uid)
+        uw = self._text_width(draw, uid_str, f_uid)
+        draw.rounded_rectangle([(W-uw)/2 - 12, curr_y, (W+uw)/2 + 12, curr_y+32], radius=12, fill=grid_color)
+        draw.text(((W - uw)/2, curr_y+3), uid_str, fill=text_dim, font=f_uid)
         
         # 个性签名
         sig = basic.get('signature') or "暂无个性签名"
-        if len(sig) > 28:
-            sig = sig[:27] + "..."
+        sig, sw = self._fit_text(draw, sig, f_tag, W - 2*margin - 60)
         curr_y += 50
-        sw = draw.textlength(sig, font=f_tag)
-        draw.text(((W - sw)/2, curr_y), sig, fill=colors["text_dim"], font=f_tag)
+        draw.text(((W - sw)/2, curr_y), sig, fill=text_dim, font=f_tag)
         curr_y += 50
         
         # 属性栏
@@ -335,58 +527,60 @@ class ProfileRenderer:
             row, col = i // 2, i % 2
             x_p = start_x + col * (W // 2 - margin - 30)
             y_p = curr_y + row * line_height
-            draw.text((x_p, y_p), f"{label}：", fill=colors["text_dim"], font=f_label)
-            draw.text((x_p + label_offset, y_p), str(val), fill=colors["text_main"], font=f_val)
+            draw.text((x_p, y_p), f"{label}：", fill=text_dim, font=f_label)
+            draw.text((x_p + label_offset, y_p), str(val), fill=text_main, font=f_val)
         
         if infos:
             curr_y += ((len(infos) + 1) // 2) * line_height + 50
         else:
             curr_y += 30
         
-        draw.line([(margin+30, curr_y), (W-margin-30, curr_y)], fill=colors["grid"], width=1)
+        draw.line([(margin+30, curr_y), (W-margin-30, curr_y)], fill=grid_color, width=1)
         
         # 6. 标签区域（v2.1 优化版：细分喜好类别）
         curr_y += 35
-        draw.text((margin+35, curr_y), "记忆碎片", fill=colors["accent"], font=f_title)
+        draw.text((margin+35, curr_y), "记忆碎片", fill=accent, font=f_title)
         curr_y += 55
         
         # 使用新的标签分类
-        tag_categories = self._get_tag_categories(profile)
+        if tag_categories is None:
+            tag_categories = self._get_tag_categories(profile)
         
         has_any_tag = False
         for cat_name, tags in tag_categories:
             if not tags:
                 continue
             has_any_tag = True
-            draw.text((margin+35, curr_y), f"· {cat_name}", fill=colors["text_dim"], font=f_tag)
+            draw.text((margin+35, curr_y), f"· {cat_name}", fill=text_dim, font=f_tag)
             curr_y += 38  # 分类标题与标签之间的间距
             
             # 根据分类获取对应的标签背景色
-            tag_bg_color = self.TAG_COLORS.get(cat_name, colors["tag_bg"])
+            tag_bg_color = tag_colors.get(cat_name, tag_bg)
             
             tag_x = margin + 50
             # 只显示一行标签（最多显示能放下的标签）
             for tag in tags:
                 t_t = str(tag)
-                tw = draw.textlength(t_t, font=f_tag) + 24
+                tw = self._text_width(draw, t_t, f_tag) + 24
                 # 如果这个标签放不下了，就停止（只显示一行）
                 if tag_x + tw > W - margin - 35:
                     break
                 
-                draw.rounded_rectangle([tag_x, curr_y, tag_x+tw, curr_y+32], radius=10, fill=tag_bg_color)
-                draw.text((tag_x+12, curr_y+4), t_t, fill=colors["text_main"], font=f_tag)
+                self._draw_pill(im, tag_x, curr_y, tag_x+tw, tag_bg_color)
+                draw.text((tag_x+12, curr_y+4), t_t, fill=text_main, font=f_tag)
                 tag_x += tw + 12
             curr_y += 45  # 分类之间的间距
         
         if not has_any_tag:
-            draw.text((margin+50, curr_y), "等待探索中...", fill=colors["text_dim"], font=f_tag)
+            draw.text((margin+50, curr_y), "等待探索中...", fill=text_dim, font=f_tag)
             curr_y += 40
         
         # 7. 羁绊模块（v2.1 扩展版：跟随在标签区域后）
         curr_y += 30  # 与标签区域的间距
-        draw.line([(margin+30, curr_y), (W-margin-30, curr_y)], fill=colors["grid"], width=1)
+        draw.line([(margin+30, curr_y), (W-margin-30, curr_y)], fill=grid_color, width=1)
         
-        bond_info = self._bond_calculator.calculate_bond_level(memory_count, profile)
+        if bond_info is None:
+            bond_info = self._bond_calculator.calculate_bond_level(memory_count, profile)
         level = bond_info["level"]
         level_name = bond_info["level_name"]
         progress = bond_info["progress"]
@@ -394,12 +588,12 @@ class ProfileRenderer:
         achievements = breakdown["achievements"]
         next_hints = bond_info["next_level_hint"]
         
-        level_color = self.LEVEL_COLORS.get(level, colors["accent"])
+        level_color = self.LEVEL_COLORS.get(level, accent)
         
         curr_y += 25
         # 第一行：等级名称
         level_text = f"羁绊: Lv.{level} {level_name}"
-        draw.text((margin+35, curr_y), level_text, fill=colors["accent"], font=f_title)
+        draw.text((margin+35, curr_y), level_text, fill=accent, font=f_title)
         
         # 第二行：进度条（不显示百分比文字）
         bar_y = curr_y + 45
@@ -418,14 +612,13 @@ class ProfileRenderer:
         badge_y = bar_y + 30
         if achievements:
             badge_x = margin + 30
-            achievement_color = self.TAG_COLORS.get("成就", colors["tag_bg"])
+            achievement_color = tag_colors.get("成就", tag_bg)
             for ach in achievements[:4]:
-                aw = draw.textlength(ach, font=f_tag) + 24
+                aw = self._text_width(draw, ach, f_tag) + 24
                 if badge_x + aw > W - margin - 30:
                     break
-                draw.rounded_rectangle([badge_x, badge_y, badge_x+aw, badge_y+32],
-                                       radius=10, fill=achievement_color)
-                draw.text((badge_x+12, badge_y+4), ach, fill=colors["text_main"], font=f_tag)
+                self._draw_pill(im, badge_x, badge_y, badge_x+aw, achievement_color)
+                draw.text((badge_x+12, badge_y+4), ach, fill=text_main, font=f_tag)
                 badge_x += aw + 12
             badge_y += 45
         else:
@@ -433,17 +626,15 @@ class ProfileRenderer:
         
         # 第四行：升级提示
         if level < 7 and next_hints:
-            hint_text = next_hints[0]
-            if len(hint_text) > 35:
-                hint_text = hint_text[:34] + "..."
-            draw.text((margin+35, badge_y), hint_text, fill=colors["text_dim"], font=f_tag)
+            hint_text, _ = self._fit_text(draw, next_hints[0], f_tag, W - 2*margin - 70)
+            draw.text((margin+35, badge_y), hint_text, fill=text_dim, font=f_tag)
 
         # 8. 证据摘要（可选）
         if self.config.get("show_profile_evidence_in_image", False) and evidence_summary:
             sec_y = badge_y + 45
-            draw.line([(margin+30, sec_y), (W-margin-30, sec_y)], fill=colors["grid"], width=1)
+            draw.line([(margin+30, sec_y), (W-margin-30, sec_y)], fill=grid_color, width=1)
             sec_y += 22
-            draw.text((margin+35, sec_y), "证据摘要", fill=colors["accent"], font=f_title)
+            draw.text((margin+35, sec_y), "证据摘要", fill=accent, font=f_title)
             sec_y += 38
 
             for item in evidence_summary[:8]:
@@ -451,16 +642,76 @@ class ProfileRenderer:
                 count = int(item.get("evidence_count", 0) or 0)
                 field_text = field if len(field) <= 34 else field[:33] + "..."
                 line = f"• {field_text} ({count})"
-                draw.text((margin+45, sec_y), line, fill=colors["text_dim"], font=f_tag)
+                draw.text((margin+45, sec_y), line, fill=text_dim, font=f_tag)
                 sec_y += 28
 
         # 输出（CPU密集型操作）
         img_byte_arr = io.BytesIO()
-        im.save(img_byte_arr, format='PNG')
+        im.save(img_byte_arr, format='PNG', compress_level=self.PNG_COMPRESS_LEVEL, optimize=False)
         return img_byte_arr.getvalue()
     
+    def _render_cache_file(self, user_id, profile, memory_count, evidence_summary):
+        """根据渲染输入计算成品图缓存路径（字体变更也会使缓存失效）"""
+        show_evidence = bool(self.config.get("show_profile_evidence_in_image", False))
+        payload = json.dumps(
+            [
+                self.RENDER_CACHE_VERSION,
+                self.config.get("pillowmd_style_path", ""),
+                self._find_font() or "",
+                profile,
+                memory_count,
+                evidence_summary if show_evidence else None,
+            ],
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        key = hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+        return os.path.join(self.render_cache_dir, f"{user_id}_{key}.png")
+
+    def _read_render_cache(self, user_id, profile, memory_count, evidence_summary):
+        """
+        计算缓存路径并读取未过期的成品图（序列化、哈希与读盘均在渲染线程池中执行）
+
+        Returns:
+            (cache_file, 图片字节或 None)
+        """
+        cache_file = self._render_cache_file(user_id, profile, memory_count, evidence_summary)
+        try:
+            if time.time() - os.path.getmtime(cache_file) < self.RENDER_CACHE_TTL:
+                with open(cache_file, "rb") as f:
+                    return cache_file, f.read()
+        except OSError:
+            pass
+        return cache_file, None
+
+    def _render_and_cache(self, cache_file, user_id, *render_args):
+        """渲染图片并写入成品图缓存（同时清理该用户的旧缓存）"""
+        image_bytes = self._render_sync(user_id, *render_args)
+        if cache_file:
+            prefix = f"{user_id}_"
+            keep = os.path.basename(cache_file)
+            try:
+                for name in os.listdir(self.render_cache_dir):
+                    if name.startswith(prefix) and name != keep:
+                        os.remove(os.path.join(self.render_cache_dir, name))
+                with open(cache_file, "wb") as f:
+                    f.write(image_bytes)
+            except OSError as e:
+                logger.debug(f"Engram 画像渲染器：写入用户 {user_id} 画像图片缓存失败：{e}")
+        return image_bytes
+
     async def render(self, user_id, profile, memory_count=0, evidence_summary=None):
         """渲染用户画像图片（异步包装，避免阻塞事件循环）"""
+        # 0. 输入未变化时直接返回缓存的成品图
+        loop = asyncio.get_running_loop()
+        cache_file, cached = await loop.run_in_executor(
+            _get_render_executor(), self._read_render_cache,
+            user_id, profile, memory_count, evidence_summary,
+        )
+        if cached is not None:
+            return cached
+
         # 1. 异步获取头像（如果需要）
         basic = profile.get("basic_info", {})
         avatar_url = basic.get("avatar_url")
@@ -468,18 +719,25 @@ class ProfileRenderer:
         if avatar_url:
             avatar_img = await self._get_cached_avatar(user_id, avatar_url)
         
-        # 2. 动态计算高度
-        required_height = self._calculate_required_height(profile, memory_count, evidence_summary=evidence_summary)
+        # 2. 纯数据计算只做一次：标签分类同时用于高度估算和绘制，羁绊信息不涉及 PIL，留在事件循环中计算
+        tag_categories = self._get_tag_categories(profile)
+        bond_info = self._bond_calculator.calculate_bond_level(memory_count, profile)
+        required_height = self._calculate_required_height(
+            profile, memory_count, evidence_summary=evidence_summary, tag_categories=tag_categories
+        )
         
         # 3. 在线程池中执行CPU密集型的图像渲染操作
-        loop = asyncio.get_event_loop()
+        # 头像下载失败时不写缓存，下次请求可重新获取头像
         return await loop.run_in_executor(
-            None,  # 使用默认线程池
-            self._render_sync,
+            _get_render_executor(),
+            self._render_and_cache,
+            cache_file if avatar_img or not avatar_url else None,
             user_id,
             profile,
             memory_count,
             avatar_img,
             required_height,
             evidence_summary,
+            tag_categories,
+            bond_info,
         )
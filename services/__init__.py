@@ -11,6 +11,7 @@ from .injection_strategy import TopicMemoryCacheService, ToolHintStrategyService
 from .config_preset import ConfigPresetService
 from .time_parser import TimeExpressionService
 from .friend_cache import FriendCacheService
+from .provider_resolver import ProviderResolver
 
 __all__ = [
     'BondCalculator',
@@ -22,4 +23,5 @@ __all__ = [
     'ConfigPresetService',
     'TimeExpressionService',
     'FriendCacheService',
+    'ProviderResolver',
 ]
@@ -6,6 +6,40 @@ import math
 from typing import Dict, List, Any, Tuple
 
 
+# 记忆深度评分的对数曲线分母：3000 条记忆时达到满分
+_MEMORY_LOG_DENOM = math.log1p(3000 / 150)
+
+# 计入“喜好”的偏好分类
+_LIKE_KEYS = ("likes", "favorite_foods", "favorite_items", "favorite_activities")
+
+# 成就规则：(名称, 判定函数(记忆数, 聊天天数, 喜好数, 重要的人数))
+_ACHIEVEMENT_RULES = (
+    ("百次对话", lambda m, d, l, ip: m >= 100),
+    ("记忆达人", lambda m, d, l, ip: m >= 500),
+    ("月度陪伴", lambda m, d, l, ip: d >= 30),
+    ("百日相守", lambda m, d, l, ip: d >= 100),
+    ("知心者", lambda m, d, l, ip: l >= 10),
+    ("知己之交", lambda m, d, l, ip: ip >= 1),
+)
+
+# 等级规则（从高到低匹配，必须同时满足多个条件）：
+# (等级, 判定函数(记忆数, 聊天天数, 画像深度, 喜好数, 禁忌数, 重要的人数, 分享秘密, 成就数))
+_LEVEL_RULES = (
+    # Lv.7 灵魂共鸣：3000记忆 + 180天聊天 + 画像100% + 6成就
+    (7, lambda m, d, p, l, dl, ip, ss, a: m >= 3000 and d >= 180 and p >= 100 and a >= 6),
+    # Lv.6 挚友：1200记忆 + 60天聊天 + 重要的人 + 5禁忌
+    (6, lambda m, d, p, l, dl, ip, ss, a: m >= 1200 and d >= 60 and ip >= 1 and dl >= 5),
+    # Lv.5 知己：600记忆 + 30天聊天 + 分享秘密 + 5喜好
+    (5, lambda m, d, p, l, dl, ip, ss, a: m >= 600 and d >= 30 and ss and l >= 5),
+    # Lv.4 熟悉：350记忆 + 14天聊天 + 画像30%
+    (4, lambda m, d, p, l, dl, ip, ss, a: m >= 350 and d >= 14 and p >= 30),
+    # Lv.3 相识：180记忆 + 7天聊天 + 3喜好
+    (3, lambda m, d, p, l, dl, ip, ss, a: m >= 180 and d >= 7 and l >= 3),
+    # Lv.2 初识：50记忆 + 1项主动信息
+    (2, lambda m, d, p, l, dl, ip, ss, a: m >= 50 and p > 0),
+)
+
+
 class BondCalculator:
     """羁绊系统计算器 - 负责所有与羁绊等级相关的计算"""
     
@@ -87,19 +121,14 @@ class BondCalculator:
         """
         social = profile.get("social_graph", {})
         stats = social.get("interaction_stats", {})
-        prefs = profile.get("preferences", {})
+        prefs_get = profile.get("preferences", {}).get
         
         # 获取累计聊天天数
         total_chat_days = stats.get("total_chat_days", 0)
         
         # 获取喜好/禁忌数量（包括新分类）
-        likes_count = (
-            len(prefs.get("likes", [])) +
-            len(prefs.get("favorite_foods", [])) +
-            len(prefs.get("favorite_items", [])) +
-            len(prefs.get("favorite_activities", []))
-        )
-        dislikes_count = len(prefs.get("dislikes", []))
+        likes_count = sum(len(prefs_get(key, ())) for key in _LIKE_KEYS)
+        dislikes_count = len(prefs_get("dislikes", ()))
         
         # 获取重要的人
         important_people = social.get("important_people", [])
@@ -114,7 +143,7 @@ class BondCalculator:
         
         # 1. 记忆深度评分（满分25，对数曲线增长）
         if memory_count > 0:
-            memory_score = min(25, 25 * math.log(1 + memory_count / 150) / math.log(1 + 3000 / 150))
+            memory_score = min(25, 25 * math.log1p(memory_count / 150) / _MEMORY_LOG_DENOM)
         else:
             memory_score = 0
         
@@ -187,22 +216,11 @@ class BondCalculator:
         important_people: List[str]
     ) -> List[str]:
         """计算已解锁的成就"""
-        achievements = []
-        
-        if memory_count >= 100:
-            achievements.append("百次对话")
-        if memory_count >= 500:
-            achievements.append("记忆达人")
-        if total_chat_days >= 30:
-            achievements.append("月度陪伴")
-        if total_chat_days >= 100:
-            achievements.append("百日相守")
-        if likes_count >= 10:
-            achievements.append("知心者")
-        if len(important_people) >= 1:
-            achievements.append("知己之交")
-        
-        return achievements
+        people_count = len(important_people)
+        return [
+            name for name, rule in _ACHIEVEMENT_RULES
+            if rule(memory_count, total_chat_days, likes_count, people_count)
+        ]
     
     def _determine_level(
         self,
@@ -215,31 +233,14 @@ class BondCalculator:
         shared_secrets: bool,
         achievements: List[str]
     ) -> Tuple[int, str]:
-        """判定羁绊等级（必须同时满足多个条件）"""
-        
-        # Lv.7 灵魂共鸣：3000记忆 + 180天聊天 + 画像100% + 6成就
-        if memory_count >= 3000 and total_chat_days >= 180 and depth_pct >= 100 and len(achievements) >= 6:
-            return 7, self.LEVEL_NAMES[7]
-        
-        # Lv.6 挚友：1200记忆 + 60天聊天 + 重要的人 + 5禁忌
-        if memory_count >= 1200 and total_chat_days >= 60 and len(important_people) >= 1 and dislikes_count >= 5:
-            return 6, self.LEVEL_NAMES[6]
-        
-        # Lv.5 知己：600记忆 + 30天聊天 + 分享秘密 + 5喜好
-        if memory_count >= 600 and total_chat_days >= 30 and shared_secrets and likes_count >= 5:
-            return 5, self.LEVEL_NAMES[5]
-        
-        # Lv.4 熟悉：350记忆 + 14天聊天 + 画像30%
-        if memory_count >= 350 and total_chat_days >= 14 and depth_pct >= 30:
-            return 4, self.LEVEL_NAMES[4]
-        
-        # Lv.3 相识：180记忆 + 7天聊天 + 3喜好
-        if memory_count >= 180 and total_chat_days >= 7 and likes_count >= 3:
-            return 3, self.LEVEL_NAMES[3]
-        
-        # Lv.2 初识：50记忆 + 1项主动信息
-        if memory_count >= 50 and depth_pct > 0:
-            return 2, self.LEVEL_NAMES[2]
+        """判定羁绊等级（按 _LEVEL_RULES 从高到低匹配）"""
+        args = (
+            memory_count, total_chat_days, depth_pct, likes_count, dislikes_count,
+            len(important_people), shared_secrets, len(achievements)
+        )
+        for level, rule in _LEVEL_RULES:
+            if rule(*args):
+                return level, self.LEVEL_NAMES[level]
         
         # Lv.1 萍水相逢（默认）
         return 1, self.LEVEL_NAMES[1]
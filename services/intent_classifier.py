@@ -12,6 +12,8 @@ from typing import Any, Optional, Pattern, Set
 
 from astrbot.api import logger
 
+from .provider_resolver import ProviderResolver
+
 # LLM 判断提示词（精简，节省 Token）
 _LLM_INTENT_PROMPT = (
     "判断以下用户消息是否需要调用长期记忆来回答。"
@@ -65,6 +67,7 @@ class IntentClassifier:
     def __init__(self, config: Optional[dict] = None, context: Any = None):
         self._config = config or {}
         self._context = context
+        self._provider_resolver = ProviderResolver(context)
 
         # 从配置读取模式，默认 keyword
         self._mode: str = str(self._config.get("memory_intent_mode", "keyword")).lower()
@@ -230,12 +233,7 @@ class IntentClassifier:
                 self._config.get("intent_llm_model", "").strip()
                 or self._config.get("summarize_model", "").strip()
             )
-            if model_id:
-                provider = self._context.get_provider_by_id(model_id)
-                if not provider:
-                    provider = self._context.get_using_provider()
-            else:
-                provider = self._context.get_using_provider()
+            provider = self._provider_resolver.resolve(model_id)
 
             if not provider:
                 logger.warning("Engram 意图分类器：无可用 LLM 提供商，已回退到 keyword")
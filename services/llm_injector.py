@@ -6,6 +6,27 @@ LLM上下文注入服务
 from typing import Dict, List, Any, Optional
 
 
+# 基础信息字段 -> 展示标签（只注入非空且非"未知"的字段）
+_BASIC_LABELS = (
+    ("gender", "性别"),
+    ("age", "年龄"),
+    ("birthday", "生日"),
+    ("job", "职业"),
+    ("location", "所在地"),
+    ("constellation", "星座"),
+    ("zodiac", "生肖"),
+)
+
+# v2.1 细分喜好字段 -> 展示标签
+_PREF_LABELS = (
+    ("favorite_foods", "喜欢的美食"),
+    ("favorite_items", "喜欢的事物"),
+    ("favorite_activities", "喜欢的活动"),
+    ("likes", "其他喜好"),
+    ("dislikes", "讨厌"),
+)
+
+
 class LLMContextInjector:
     """LLM上下文注入器 - 负责构建画像和记忆文本块并注入到LLM请求"""
     
@@ -25,38 +46,29 @@ class LLMContextInjector:
         if not profile or not profile.get("basic_info"):
             return ""
         
-        basic = profile.get("basic_info", {})
-        attrs = profile.get("attributes", {})
-        prefs = profile.get("preferences", {})
-        dev = profile.get("dev_metadata", {})
-        social = profile.get("social_graph", {})
+        prof_get = profile.get
+        basic_get = prof_get("basic_info", {}).get
+        attrs_get = prof_get("attributes", {}).get
+        prefs_get = prof_get("preferences", {}).get
+        dev = prof_get("dev_metadata", {})
+        social = prof_get("social_graph", {})
+        join_list = self._join_list
         
         # 构建列表字段
-        hobbies = self._join_list(attrs.get("hobbies", []))
-        skills = self._join_list(attrs.get("skills", []))
-        tech = self._join_list(dev.get("tech_stack", []))
-        
-        # v2.1 优化：细分喜好类别
-        favorite_foods = self._join_list(prefs.get("favorite_foods", []))
-        favorite_items = self._join_list(prefs.get("favorite_items", []))
-        favorite_activities = self._join_list(prefs.get("favorite_activities", []))
-        likes = self._join_list(prefs.get("likes", []))
-        dislikes = self._join_list(prefs.get("dislikes", []))
+        hobbies = join_list(attrs_get("hobbies", []))
+        skills = join_list(attrs_get("skills", []))
+        tech = join_list(dev.get("tech_stack", []))
         
         # 构建画像文本块
         lines = [
             "【用户档案】",
-            f"- 称呼: {basic.get('nickname', '用户')} (QQ: {basic.get('qq_id')})"
+            f"- 称呼: {basic_get('nickname', '用户')} (QQ: {basic_get('qq_id')})"
         ]
         
         # 基础信息（只添加非空且非"未知"的字段）
-        self._add_if_valid(lines, "性别", basic.get('gender'))
-        self._add_if_valid(lines, "年龄", basic.get('age'))
-        self._add_if_valid(lines, "生日", basic.get('birthday'))
-        self._add_if_valid(lines, "职业", basic.get('job'))
-        self._add_if_valid(lines, "所在地", basic.get('location'))
-        self._add_if_valid(lines, "星座", basic.get('constellation'))
-        self._add_if_valid(lines, "生肖", basic.get('zodiac'))
+        add_if_valid = self._add_if_valid
+        for key, label in _BASIC_LABELS:
+            add_if_valid(lines, label, basic_get(key))
         
         # 爱好和技能
         if hobbies:
@@ -66,16 +78,10 @@ class LLMContextInjector:
             lines.append(f"- 技能/技术栈: {skill_text}")
         
         # v2.1 优化：注入细分喜好
-        if favorite_foods:
-            lines.append(f"- 喜欢的美食: {favorite_foods}")
-        if favorite_items:
-            lines.append(f"- 喜欢的事物: {favorite_items}")
-        if favorite_activities:
-            lines.append(f"- 喜欢的活动: {favorite_activities}")
-        if likes:
-            lines.append(f"- 其他喜好: {likes}")
-        if dislikes:
-            lines.append(f"- 讨厌: {dislikes}")
+        for key, label in _PREF_LABELS:
+            text = join_list(prefs_get(key, []))
+            if text:
+                lines.append(f"- {label}: {text}")
         
         # v2.1 优化：显示羁绊等级
         status = social.get("relationship_status", "萍水相逢")
@@ -129,10 +135,8 @@ class LLMContextInjector:
             req.system_prompt = f"你是一个有记忆的助手。以下是关于用户的信息：{inject_text}"
     
     def _join_list(self, items: Any) -> str:
-        """安全地连接列表项为字符串"""
-        if isinstance(items, list) and items:
-            return ", ".join(str(item) for item in items)
-        return ""
+        """连接列表项为字符串（列表字段已由 ProfileManager 在读写时规范为 list）"""
+        return ", ".join(map(str, items)) if items else ""
     
     def _add_if_valid(self, lines: List[str], label: str, value: Any) -> None:
         """如果值有效（非空且非"未知"），添加到行列表"""
@@ -0,0 +1,52 @@
+"""
+LLM 提供商解析服务
+
+按配置的模型 ID 优先级解析 LLM 提供商，并对按 ID 命中的结果做短时缓存，
+避免总结、折叠、画像更新等路径每次都遍历已注册的提供商列表。
+回退到当前默认提供商时不缓存，用户切换默认模型后立即生效。
+"""
+
+import time
+
+
+class ProviderResolver:
+    """LLM 提供商解析与缓存服务。"""
+
+    def __init__(self, context, ttl: float = 60.0):
+        self._context = context
+        self._ttl = float(ttl)
+        self._cache = {}  # {(model_id, ...): (timestamp, provider)}
+
+    def resolve(self, *model_ids):
+        """
+        依次尝试配置的模型 ID，全部不可用时回退到当前默认提供商。
+
+        Args:
+            *model_ids: 按优先级排列的提供商 ID，空值自动跳过
+
+        Returns:
+            Provider 对象；无可用提供商时返回 None
+        """
+        key = tuple(str(m or "").strip() for m in model_ids)
+        now = time.monotonic()
+        entry = self._cache.get(key)
+        if entry and now - entry[0] < self._ttl:
+            return entry[1]
+
+        if not self._context:
+            return None
+
+        for model_id in key:
+            if model_id:
+                provider = self._context.get_provider_by_id(model_id)
+                if provider:
+                    # 仅缓存按显式 ID 解析成功的结果；解析失败不缓存，提供商恢复后可立即生效
+                    self._cache[key] = (now, provider)
+                    return provider
+
+        # 默认提供商可随时在 AstrBot 中切换，每次重新获取
+        return self._context.get_using_provider()
+
+    def cache_clear(self):
+        """清空解析缓存（提供商或配置变更时调用）"""
+        self._cache.clear()
@@ -1,10 +1,33 @@
+import asyncio
 import datetime
 import pathlib
 import sys
+from types import SimpleNamespace
 
 sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
 
 from db_manager import DatabaseManager
+from utils import request_json_completion
+
+
+def _raw_row(i, content=None, user_id="u1", **fields):
+    """构造第 i 条原始消息行（uuid 为 raw-i，时间戳按序号递增）"""
+    row = {
+        "uuid": f"raw-{i}",
+        "session_id": user_id,
+        "user_id": user_id,
+        "role": "user",
+        "content": f"message {i}" if content is None else content,
+        "msg_type": "text",
+        "timestamp": datetime.datetime(2026, 4, 8, 10, 0, i % 60),
+    }
+    row.update(fields)
+    return row
+
+
+def _seed_raw(manager, contents, **fields):
+    """按 contents 顺序写入原始消息，返回写入条数"""
+    return manager.save_raw_memories([_raw_row(i, content, **fields) for i, content in enumerate(contents)])
 
 
 def test_delete_history_persist_and_restore_status(tmp_path):
@@ -108,3 +131,263 @@ def test_search_memory_indexes_by_keywords_bm25_and_like_fallback(tmp_path):
     )
     assert like_rows
     assert like_rows[0].index_id == "idx-1"
+
+
+def test_save_raw_memories_batch_insert(tmp_path):
+    manager = DatabaseManager(str(tmp_path))
+
+    rows = [
+        _raw_row(i, user_name="tester", role="user" if i % 2 == 0 else "assistant")
+        for i in range(5)
+    ]
+
+    assert manager.save_raw_memories(rows) == 5
+    assert manager.save_raw_memories([]) == 0
+
+    unarchived = manager.get_unarchived_raw("u1")
+    assert [m.uuid for m in unarchived] == [f"raw-{i}" for i in reversed(range(5))]
+
+
+def test_get_unarchived_raw_filtered_skips_commands(tmp_path):
+    manager = DatabaseManager(str(tmp_path))
+
+    contents = ["/mem_list", "hello there friend", "mem_undo", "#help", "今天天气不错"]
+    _seed_raw(manager, contents)
+
+    kept, skipped = manager.get_unarchived_raw_filtered("u1", ("/", "#"))
+    assert [m.uuid for m in kept] == ["raw-4", "raw-1"]
+    assert sorted(skipped) == ["raw-0", "raw-2", "raw-3"]
+
+    kept, skipped = manager.get_unarchived_raw_filtered(
+        "u1", ("/", "#"), before=datetime.datetime(2026, 4, 8, 10, 0, 3)
+    )
+    assert [m.uuid for m in kept] == ["raw-4"]
+    assert sorted(skipped) == ["raw-0", "raw-1", "raw-2", "raw-3"]
+
+
+def test_commit_summaries_writes_index_and_archives_raw(tmp_path):
+    manager = DatabaseManager(str(tmp_path))
+
+    _seed_raw(manager, [f"message {i}" for i in range(3)])
+
+    saved = manager.commit_summaries(
+        [{
+            "index_id": "idx-1",
+            "summary": "summary",
+            "ref_uuids": '["raw-0", "raw-1"]',
+            "prev_index_id": None,
+            "source_type": "private",
+            "user_id": "u1",
+            "created_at": datetime.datetime(2026, 4, 8, 10, 0, 1),
+        }],
+        ["raw-0", "raw-1"],
+    )
+
+    assert saved == 1
+    assert manager.get_memory_index_by_id("idx-1") is not None
+    assert [m.uuid for m in manager.get_unarchived_raw("u1")] == ["raw-2"]
+
+
+def test_remove_memory_index_unarchives_or_deletes_raw(tmp_path):
+    manager = DatabaseManager(str(tmp_path))
+
+    _seed_raw(manager, [f"message {i}" for i in range(3)])
+    for idx, uuids in (("idx-1", ["raw-0"]), ("idx-2", ["raw-1", "raw-2"])):
+        manager.commit_summaries(
+            [{
+                "index_id": idx,
+                "summary": "summary",
+                "ref_uuids": "[]",
+                "prev_index_id": None,
+                "source_type": "private",
+                "user_id": "u1",
+                "created_at": datetime.datetime(2026, 4, 8, 10, 0, 1),
+            }],
+            uuids,
+        )
+
+    manager.remove_memory_index("idx-1", ["raw-0"])
+    assert manager.get_memory_index_by_id("idx-1") is None
+    assert [m.uuid for m in manager.get_unarchived_raw("u1")] == ["raw-0"]
+
+    manager.remove_memory_index("idx-2", ["raw-1", "raw-2"], delete_raw=True)
+    assert manager.get_memory_index_by_id("idx-2") is None
+    assert manager.get_message_stats("u1")["total"] == 1
+
+
+def test_get_memory_by_sequence_matches_memory_list_order(tmp_path):
+    manager = DatabaseManager(str(tmp_path))
+
+    for day in range(1, 4):
+        manager.save_memory_index(
+            index_id=f"idx-{day}",
+            summary=f"summary {day}",
+            ref_uuids='[]',
+            prev_index_id=None,
+            source_type="private",
+            user_id="u1",
+            created_at=datetime.datetime(2026, 4, day, 10, 0, 0),
+        )
+
+    listed = [m.index_id for m in manager.get_memory_list("u1", 10)]
+    assert [manager.get_memory_by_sequence("u1", n).index_id for n in (1, 2, 3)] == listed
+    assert manager.get_memory_by_sequence("u1", 4) is None
+    assert manager.get_memory_by_sequence("u1", 0) is None
+
+
+def test_export_queries_return_projected_dicts(tmp_path):
+    manager = DatabaseManager(str(tmp_path))
+
+    manager.save_raw_memories([
+        _raw_row(i, user_id=f"u{i}", user_name=f"name{i}") for i in range(2)
+    ])
+
+    rows = manager.get_all_raw_messages("u1")
+    assert rows == [{
+        "role": "user",
+        "content": "message 1",
+        "timestamp": datetime.datetime(2026, 4, 8, 10, 0, 1),
+        "user_id": "u1",
+        "user_name": "name1",
+    }]
+    assert [row["user_id"] for row in manager.get_all_users_messages()] == ["u0", "u1"]
+
+
+def test_get_recent_delete_histories_across_scopes(tmp_path):
+    manager = DatabaseManager(str(tmp_path))
+
+    ids = []
+    for i, scope in enumerate(("private:u1", "group:u1", "private:u1", "private:u2")):
+        ids.append(manager.save_delete_history(
+            scope_key=scope,
+            user_id="u1",
+            group_id="",
+            source_type="private",
+            index_id=f"idx-{i}",
+            summary="summary",
+            ref_uuids="[]",
+            prev_index_id="",
+            created_at=datetime.datetime(2026, 1, 1, 12, 0, 0),
+            active_score=100,
+            delete_raw=False,
+            deleted_uuids="[]",
+            vector_data=None,
+            deleted_at=datetime.datetime(2026, 1, 2, 12, 0, i),
+        ))
+    manager.mark_delete_history_restored(ids[2])
+
+    rows = manager.get_recent_delete_histories(("private:u1", "group:u1"), limit=5)
+    assert [row.index_id for row in rows] == ["idx-1", "idx-0"]
+    rows = manager.get_recent_delete_histories(("private:u1", "group:u1"), limit=1)
+    assert [row.index_id for row in rows] == ["idx-1"]
+
+
+def test_archive_and_delete_raw_in_batches(tmp_path):
+    manager = DatabaseManager(str(tmp_path))
+
+    uuids = [f"raw-{i}" for i in range(1200)]
+    _seed_raw(manager, ["message"] * len(uuids))
+
+    manager.mark_as_archived(uuids[:1100])
+    assert manager.get_message_stats("u1")["archived"] == 1100
+
+    manager.delete_raw_memories_by_uuids(uuids[100:])
+    assert manager.get_message_stats("u1")["total"] == 100
+
+
+def test_restore_deleted_memories_marks_history_in_one_call(tmp_path):
+    manager = DatabaseManager(str(tmp_path))
+
+    _seed_raw(manager, ["message"])
+    history_id = manager.save_delete_history(
+        scope_key="private:u1",
+        user_id="u1",
+        group_id="",
+        source_type="private",
+        index_id="idx-1",
+        summary="summary",
+        ref_uuids='["raw-0"]',
+        prev_index_id="",
+        created_at=datetime.datetime(2026, 4, 8, 10, 0, 0),
+        active_score=100,
+        delete_raw=False,
+        deleted_uuids='["raw-0"]',
+        vector_data=None,
+    )
+
+    restored = manager.restore_deleted_memories(
+        [{
+            "index_id": "idx-1",
+            "summary": "summary",
+            "ref_uuids": '["raw-0"]',
+            "prev_index_id": None,
+            "source_type": "private",
+            "user_id": "u1",
+            "created_at": datetime.datetime(2026, 4, 8, 10, 0, 0),
+            "active_score": 100,
+        }],
+        ["raw-0"],
+        [history_id],
+    )
+
+    assert restored == 1
+    assert manager.get_memory_index_by_id("idx-1") is not None
+    assert manager.get_unarchived_raw("u1") == []
+    assert manager.get_last_delete_history(scope_key="private:u1") is None
+
+
+class _StreamProvider:
+    """按给定分片依次产出流式响应的假提供商，记录实际被读取的分片数"""
+
+    def __init__(self, chunks, final_text=None):
+        self.chunks = chunks
+        self.final_text = final_text
+        self.consumed = 0
+
+    async def text_chat_stream(self, prompt):
+        for text in self.chunks:
+            self.consumed += 1
+            yield SimpleNamespace(completion_text=text, is_chunk=True)
+        if self.final_text is not None:
+            self.consumed += 1
+            yield SimpleNamespace(completion_text=self.final_text, is_chunk=False)
+
+
+def _stream_json(provider):
+    return asyncio.run(request_json_completion(provider, "prompt", stream=True))
+
+
+def test_stream_json_skips_braces_in_preface():
+    provider = _StreamProvider(["按 {格式} 输出：", '{"a": 1}', "之后的内容"])
+
+    assert _stream_json(provider) == '{"a": 1}'
+    assert provider.consumed == 2
+
+
+def test_stream_json_ignores_escaped_quotes_and_braces_in_strings():
+    text = '{"note": "他说 \\"}{\\" 了", "n": 2}'
+    provider = _StreamProvider([text, "尾部"])
+
+    assert _stream_json(provider) == text
+    assert provider.consumed == 1
+
+
+def test_stream_json_object_split_across_chunks():
+    provider = _StreamProvider(["前言 {\"a\": {\"b", '": "}"}', ", \"c\": 3}", "尾部"])
+
+    assert _stream_json(provider) == '{"a": {"b": "}"}, "c": 3}'
+    assert provider.consumed == 3
+
+
+def test_stream_json_final_summary_chunk_returns_full_text():
+    provider = _StreamProvider(['{"a": '], final_text='{"a": 1}')
+
+    assert _stream_json(provider) == '{"a": 1}'
+    assert provider.consumed == 2
+
+
+def test_stream_json_without_object_returns_full_text():
+    provider = _StreamProvider(["没有", "任何 {对象}"])
+
+    assert _stream_json(provider) == "没有任何 {对象}"
+    assert provider.consumed == 2
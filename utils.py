@@ -1,11 +1,208 @@
 """
 工具函数模块
-包含星座、生肖、职业等映射方法
+包含星座、生肖、职业等映射方法，以及 JSON 编解码辅助
 """
+import os
+import re
+import json
+import uuid
+import asyncio
 from zhdate import ZhDate
 from datetime import date
 from astrbot.api import logger
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import aiofiles
+except ImportError:
+    aiofiles = None
+
+
+def json_dumps_bytes(obj, indent: bool = False) -> bytes:
+    """JSON 序列化为 UTF-8 字节：orjson 直接产出字节，省去 str -> bytes 的二次编码"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        try:
+            return orjson.dumps(obj, option=option)
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None).encode("utf-8")
+
+
+def json_dumps(obj, indent: bool = False) -> str:
+    """JSON 序列化：优先 orjson（UTF-8 原样输出），不可用或类型不支持时回退标准库"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        try:
+            return orjson.dumps(obj, option=option).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None)
+
+
+def json_loads(data):
+    """JSON 反序列化：优先 orjson，接受 str / bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _temp_path_for(path: str) -> str:
+    """同目录下的唯一临时文件名（保证 os.replace 在同一文件系统内原子完成）"""
+    return f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+
+
+def _discard_temp_file(tmp_path: str) -> None:
+    try:
+        os.remove(tmp_path)
+    except OSError:
+        pass
+
+
+def write_json_file(path: str, obj, indent: bool = True) -> None:
+    """将对象原子写入 JSON 文件：先写临时文件再 os.replace，进程中断不会留下半截文件"""
+    payload = json_dumps_bytes(obj, indent=indent)
+    tmp_path = _temp_path_for(path)
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+    except BaseException:
+        _discard_temp_file(tmp_path)
+        raise
+
+
+def read_json_file(path: str):
+    """读取 JSON 文件"""
+    if orjson is not None:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+async def read_json_file_async(path: str, executor=None):
+    """
+    异步读取 JSON 文件
+
+    aiofiles 可用时，文件 I/O 由 aiofiles 交给事件循环的默认线程池执行，不占用传入的 executor；
+    JSON 解析仍在事件循环线程中进行。aiofiles 不可用时整个读取与解析都在 executor 中执行。
+    """
+    if aiofiles is not None:
+        async with aiofiles.open(path, 'rb') as f:
+            data = await f.read()
+        return json_loads(data)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, read_json_file, path)
+
+
+async def write_json_file_async(path: str, obj, executor=None, indent: bool = True) -> None:
+    """
+    异步原子写入 JSON 文件
+
+    aiofiles 可用时，临时文件的打开与写入由 aiofiles 交给事件循环的默认线程池执行，不占用传入的 executor；
+    JSON 编码与 os.replace 仍在事件循环线程中进行。aiofiles 不可用时整个写入都在 executor 中执行。
+    """
+    if aiofiles is not None:
+        payload = json_dumps_bytes(obj, indent=indent)
+        tmp_path = _temp_path_for(path)
+        try:
+            async with aiofiles.open(tmp_path, 'wb') as f:
+                await f.write(payload)
+            os.replace(tmp_path, path)
+        except BaseException:
+            _discard_temp_file(tmp_path)
+            raise
+        return
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(executor, write_json_file, path, obj, indent)
+
+
+# LLM 输出中的 ```json 代码块（未闭合时取到文本末尾）
+_JSON_FENCE_RE = re.compile(r"```json(.*?)(?:```|\Z)", re.DOTALL)
+
+
+def extract_json_text(content: str) -> str:
+    """从 LLM 输出中提取 JSON 文本：优先取 ```json 代码块，否则取首个 { 到最后一个 } 之间的内容"""
+    match = _JSON_FENCE_RE.search(content)
+    if match:
+        return match.group(1).strip()
+    start = content.find("{")
+    end = content.rfind("}")
+    if start != -1 and end != -1:
+        return content[start:end + 1]
+    return content
+
+
+async def request_json_completion(provider, prompt: str, stream: bool = False) -> str:
+    """
+    请求 LLM 返回 JSON 文本。
+
+    stream=True 且提供商支持 text_chat_stream 时改用流式接收，并增量跟踪 JSON 括号深度：
+    候选对象（从深度 0 处的 { 开始）闭合且能成功解析时即停止读取，返回该对象文本；
+    正文中夹带的非 JSON 花括号解析失败后继续读取，流结束仍未得到对象时返回完整文本。
+    不支持流式时回退普通请求。
+    """
+    stream_fn = getattr(provider, "text_chat_stream", None) if stream else None
+    if not callable(stream_fn):
+        resp = await provider.text_chat(prompt=prompt)
+        return resp.completion_text
+
+    parts = []
+    pos = 0  # 已接收文本的字符数
+    start = -1  # 当前候选对象起始位置
+    depth = 0
+    in_string = False
+    escaped = False
+    response_stream = stream_fn(prompt=prompt)
+    try:
+        async for chunk in response_stream:
+            text = getattr(chunk, "completion_text", "") or ""
+            if not getattr(chunk, "is_chunk", True):
+                # 流末尾的汇总包携带完整文本
+                return text or "".join(parts)
+            if not text:
+                continue
+            parts.append(text)
+
+            for ch in text:
+                if in_string:
+                    if escaped:
+                        escaped = False
+                    elif ch == "\\":
+                        escaped = True
+                    elif ch == '"':
+                        in_string = False
+                elif ch == '"':
+                    in_string = depth > 0
+                elif ch == "{":
+                    if depth == 0:
+                        start = pos
+                    depth += 1
+                elif ch == "}" and depth > 0:
+                    depth -= 1
+                    if depth == 0:
+                        candidate = "".join(parts)[start:pos + 1]
+                        try:
+                            json_loads(candidate)
+                        except ValueError:
+                            pass
+                        else:
+                            return candidate
+                pos += 1
+    finally:
+        aclose = getattr(response_stream, "aclose", None)
+        if aclose is not None:
+            try:
+                await aclose()
+            except Exception:
+                pass
+    return "".join(parts)
+
 
 def get_constellation(month: int, day: int) -> str:
     """星座映射"""
@@ -6,7 +6,7 @@ Engram WebUI Server
 from __future__ import annotations
 
 import asyncio
-import json
+import datetime
 import secrets
 import time
 from pathlib import Path
@@ -15,11 +15,13 @@ from typing import Any, Callable
 import uvicorn
 from fastapi import Depends, FastAPI, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 from fastapi.staticfiles import StaticFiles
 
 from astrbot.api import logger
 
+from .profile_renderer import ProfileRenderer
+from .utils import json_loads
 
 
 class EngramWebServer:
@@ -217,10 +219,18 @@ class EngramWebServer:
         return request.headers.get("X-Auth-Token", "")
 
     async def _run_in_executor(self, func: Callable, *args):
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
         return await loop.run_in_executor(self.logic.executor, func, *args)
 
+    async def _flush_pending_raw(self):
+        """统计前落库私聊与群聊记忆的原始消息写缓冲"""
+        await self.logic.flush_pending_raw()
+        group_manager = getattr(self.plugin, "_group_memory_manager", None)
+        if group_manager is not None:
+            await group_manager.flush_pending_raw()
+
     async def _collect_stats(self, db, user_id=None):
+        await self._flush_pending_raw()
         MemoryIndex = db.MemoryIndex
         if user_id:
             stats = await self._run_in_executor(db.get_message_stats, user_id)
@@ -269,7 +279,6 @@ class EngramWebServer:
 
     async def _get_history_stats(self):
         """获取近 7 日消息增长趋势"""
-        import datetime
         now = datetime.datetime.now()
         history = []
         for i in range(6, -1, -1):
@@ -324,7 +333,7 @@ class EngramWebServer:
         if not memory_index or not getattr(memory_index, "ref_uuids", None):
             return []
         try:
-            uuids = json.loads(memory_index.ref_uuids)
+            uuids = json_loads(memory_index.ref_uuids)
         except Exception:
             return []
         if not isinstance(uuids, list) or not uuids:
@@ -686,13 +695,11 @@ class EngramWebServer:
                     return None
                 if isinstance(value, (int, float)):
                     try:
-                        import datetime
                         return datetime.datetime.fromtimestamp(value)
                     except Exception:
                         return None
                 if isinstance(value, str):
                     try:
-                        import datetime
                         return datetime.datetime.fromisoformat(value)
                     except Exception:
                         return None
@@ -1141,14 +1148,13 @@ class EngramWebServer:
             del token
             try:
                 # 调用 ProfileRenderer 渲染图片
-                from fastapi.responses import Response
-                from .profile_renderer import ProfileRenderer
                 renderer = ProfileRenderer(self.config, self.plugin.plugin_data_dir)
                 profile = await self.logic.get_user_profile(user_id)
                 
                 # 获取记忆总数用于显示羁绊等级（可选）
                 memory_count = 0
                 try:
+                    await self.logic.flush_pending_raw()
                     stats = await self._run_in_executor(self.db.get_message_stats, user_id)
                     memory_count = stats.get("total_messages", 0) if stats else 0
                 except: pass